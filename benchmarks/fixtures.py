@@ -0,0 +1,281 @@
+"""
+Synthetic QES responses, shaped like the responses of the daily series visual.
+
+Responses are generated deterministically from a seed, so a fixture of a given
+size is the same on every run and machine. They can also be recorded to
+gzipped JSON files, to benchmark or debug against a fixed set of files:
+
+    python benchmarks/fixtures.py --output-dir benchmarks/data
+"""
+
+import argparse
+from datetime import date, datetime, timedelta, timezone
+import gzip
+import json
+import os
+import random
+from typing import Optional
+
+# Fixture name -> (days, products)
+FIXTURE_SIZES = {
+    "1d-1p": (1, 1),
+    "1m-1p": (31, 1),
+    "1y-1p": (365, 1),
+    "10y-1p": (3652, 1),
+    "30y-1p": (10957, 1),
+    "1y-50p": (365, 50),
+    "1y-500p": (365, 500),
+    "30y-50p": (10957, 50),
+    "30y-500p": (10957, 500),
+}
+# Sizes run by default: 30y-500p alone takes a few GB of memory
+DEFAULT_SIZES = ("1d-1p", "1m-1p", "1y-1p", "10y-1p", "30y-1p", "1y-50p", "1y-500p")
+
+FIXTURE_START_DATE = date(1995, 1, 2)
+MISSING_RATE = 0.05
+
+
+def product_names(count: int) -> list[str]:
+    return [f"Producto {index:03d}" for index in range(count)]
+
+
+def series_response(
+    start_date: date,
+    end_date: date,
+    products: list[str],
+    departments: Optional[list[str]] = None,
+    seed: int = 0,
+    missing_rate: float = MISSING_RATE,
+    is_complete: bool = True,
+    server_seconds: float = 0.0,
+) -> dict:
+    """
+    Build the QES response of a daily series query.
+
+    Like the service, the response has one primary row per business day of
+    [start_date, end_date), one secondary member per product (per product and
+    department when several departments are given), and a cell per member in
+    each row, empty where the member has no value that day.
+
+    :param end_date: Exclusive end date
+    :param departments: Departments of a multi-department query, added as a
+        second member column
+    :param seed: Seed of the random walk of the values
+    :param missing_rate: Share of cells without value
+    :param is_complete: IC flag of the data set
+    :param server_seconds: Duration of the query in the ExecutionMetrics
+    """
+    if departments and len(departments) > 1:
+        members = [
+            {"G1": product, "G2": department}
+            for product in products
+            for department in departments
+        ]
+    else:
+        members = [{"G1": product} for product in products]
+
+    rng = random.Random(seed)
+    prices = [rng.uniform(500.0, 5000.0) for _ in members]
+
+    rows = []
+    day = start_date
+    while day < end_date:
+        if day.weekday() < 5:
+            cells = []
+            for index in range(len(members)):
+                prices[index] *= 1 + rng.gauss(0, 0.01)
+                if rng.random() < missing_rate:
+                    cells.append({})
+                else:
+                    cells.append({"M0": round(prices[index], 2)})
+
+            midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+            row = {"G0": int(midnight.timestamp() * 1000), "X": cells}
+            if not rows:
+                row["S"] = [{"N": "G0", "T": 7}]
+            rows.append(row)
+        day += timedelta(days=1)
+
+    # Timed from a fixed instant, to keep responses deterministic
+    started = datetime(end_date.year, end_date.month, end_date.day, tzinfo=timezone.utc)
+    ended = started + timedelta(seconds=server_seconds)
+    execution_metrics = {
+        "Version": "1.0.0",
+        "Events": [
+            {
+                "Id": "00000000-0000-0000-0000-000000000001",
+                "Name": "Execute Semantic Query",
+                "Component": "DSE",
+                "Start": started.isoformat(timespec="milliseconds"),
+                "End": ended.isoformat(timespec="milliseconds"),
+                "Metrics": {"RowCount": len(rows)},
+            }
+        ],
+    }
+
+    return {
+        "results": [
+            {
+                "jobId": "00000000-0000-0000-0000-000000000000",
+                "result": {
+                    "data": {
+                        "descriptor": {"Select": []},
+                        "metrics": execution_metrics,
+                        "dsr": {
+                            "Version": 2,
+                            "MinorVersion": 1,
+                            "DS": [
+                                {
+                                    "N": "DS0",
+                                    "PH": [{"DM0": rows}],
+                                    "SH": [{"DM1": members}],
+                                    "IC": is_complete,
+                                }
+                            ],
+                        },
+                    }
+                },
+            }
+        ]
+    }
+
+
+def catalog_response(pairs: list[tuple[str, str]], is_complete: bool = True) -> dict:
+    """
+    Build the QES response of a catalog query (PayloadFactory.catalog).
+
+    Like the service, department and product names are sent as indexes into
+    the ValueDicts of the data set.
+
+    :param pairs: (department, product) pairs of the catalog
+    """
+    departments = sorted({department for department, _ in pairs})
+    products = sorted({product for _, product in pairs})
+    department_index = {name: index for index, name in enumerate(departments)}
+    product_index = {name: index for index, name in enumerate(products)}
+
+    rows = [
+        {"C": [department_index[department], product_index[product]]}
+        for department, product in sorted(set(pairs))
+    ]
+    if rows:
+        rows[0]["S"] = [
+            {"N": "G0", "T": 1, "DN": "D0"},
+            {"N": "G1", "T": 1, "DN": "D1"},
+        ]
+
+    return {
+        "results": [
+            {
+                "jobId": "00000000-0000-0000-0000-000000000000",
+                "result": {
+                    "data": {
+                        "descriptor": {
+                            "Select": [
+                                {
+                                    "Kind": 1,
+                                    "Value": "G0",
+                                    "Name": "Precios reuters diarios.DEPARTAMENTO",
+                                },
+                                {
+                                    "Kind": 1,
+                                    "Value": "G1",
+                                    "Name": "Precios reuters diarios.PRODUCTO",
+                                },
+                            ]
+                        },
+                        "dsr": {
+                            "Version": 2,
+                            "MinorVersion": 1,
+                            "DS": [
+                                {
+                                    "N": "DS0",
+                                    "PH": [{"DM0": rows}],
+                                    "IC": is_complete,
+                                    "ValueDicts": {"D0": departments, "D1": products},
+                                }
+                            ],
+                        },
+                    }
+                },
+            }
+        ]
+    }
+
+
+def is_catalog_query(payload: dict | bytes) -> bool:
+    """Check if a payload is a PayloadFactory.catalog query, without filters."""
+    if isinstance(payload, (bytes, str)):
+        payload = json.loads(payload)
+
+    command = payload["queries"][0]["Query"]["Commands"][0]
+    return "Where" not in command["SemanticQueryDataShapeCommand"]["Query"]
+
+
+def fixture(name: str) -> tuple[dict, list[str]]:
+    """
+    :param name: One of FIXTURE_SIZES
+    :return: (QES response, its products)
+    """
+    days, count = FIXTURE_SIZES[name]
+    products = product_names(count)
+    response = series_response(
+        FIXTURE_START_DATE,
+        FIXTURE_START_DATE + timedelta(days=days),
+        products,
+        seed=days * 1000 + count,
+    )
+    return response, products
+
+
+def payload_query(payload: dict | bytes) -> tuple[date, date, list[str], list[str]]:
+    """
+    Read back the query of a PayloadFactory payload.
+
+    :return: (start date, exclusive end date, departments, products)
+    """
+    if isinstance(payload, (bytes, str)):
+        payload = json.loads(payload)
+
+    command = payload["queries"][0]["Query"]["Commands"][0]
+    where = command["SemanticQueryDataShapeCommand"]["Query"]["Where"]
+
+    def literal_date(comparison: dict) -> date:
+        # datetime'YYYY-mm-ddT00:00:00'
+        value = comparison["Comparison"]["Right"]["Literal"]["Value"]
+        return date.fromisoformat(value[len("datetime'") :][:10])
+
+    def literal_strings(condition: dict) -> list[str]:
+        return [
+            value[0]["Literal"]["Value"][1:-1].replace("''", "'")
+            for value in condition["Condition"]["In"]["Values"]
+        ]
+
+    dates = where[0]["Condition"]["And"]
+    return (
+        literal_date(dates["Left"]),
+        literal_date(dates["Right"]),
+        literal_strings(where[1]),
+        literal_strings(where[2]),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record synthetic QES responses")
+    parser.add_argument("--output-dir", required=True, type=str)
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        choices=list(FIXTURE_SIZES),
+        default=list(DEFAULT_SIZES),
+        help="Fixtures to record (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in args.sizes:
+        response, _ = fixture(name)
+        path = os.path.join(args.output_dir, f"qes_{name}.json.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(response, f)
+        print(f"{path}: {os.path.getsize(path)} bytes")
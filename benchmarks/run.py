@@ -0,0 +1,249 @@
+"""
+Benchmark suite of the extractor.
+
+Per stage timings on synthetic QES responses of several sizes (see
+fixtures.py):
+- parse: DailySeriesParser.parse, into row dicts
+- frame: DailySeriesParser.parse_frame, into a typed DataFrame
+- aggregate: SeriesAggregator monthly rollup and total mean
+- write_csv: write_reference_csv of the daily values
+- write_binary / load_binary: write_binary_series of the daily values, and
+  load_binary_series of the written file into a DataFrame
+
+and end to end timings of main.py runs against the local stand-in server
+(see stand_in_server.py), which include process startup.
+
+Each stage is run --repeat times and its best and median times are reported.
+With --json, results are also saved, to compare a change against a previous
+run:
+
+    python benchmarks/run.py --json before.json
+    python benchmarks/run.py --json after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import DEFAULT_SIZES, FIXTURE_SIZES, fixture
+from stand_in_server import StandInServer
+
+from src.aggregation import SeriesAggregator
+from src.binary_series import load_binary_series, write_binary_series
+from src.csv_writer import write_reference_csv
+from src.response_parser import DailySeriesParser
+
+# Scenario name -> main.py arguments. The stand-in server answers every query
+END_TO_END_SCENARIOS = {
+    "e2e-10y-1p-daily": [
+        "--department=Nacional",
+        "--product=Café",
+        "--start-date=20150101",
+        "--end-date=20241231",
+        "--write-daily-values-csv",
+    ],
+    "e2e-10y-1p-all": [
+        "--department=Nacional",
+        "--product=Café",
+        "--start-date=20150101",
+        "--end-date=20241231",
+        "--write-daily-values-csv",
+        "--write-monthly-values-csv",
+        "--write-mean-csv",
+        "--apply-fillna",
+    ],
+    "e2e-1y-20p": [
+        "--start-date=20240101",
+        "--end-date=20241231",
+        "--write-daily-values-csv",
+        *(f"--pair=Nacional|Producto {index:03d}" for index in range(20)),
+    ],
+    "e2e-1y-20p-batch": [
+        "--start-date=20240101",
+        "--end-date=20241231",
+        "--write-daily-values-csv",
+        "--batch-size=10",
+        *(f"--pair=Nacional|Producto {index:03d}" for index in range(20)),
+    ],
+}
+
+
+def measure(function: Callable[[], object], repeat: int) -> list[float]:
+    """
+    :return: Wall time of each call, in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def stage_benchmarks(name: str, repeat: int, output_dir: str) -> dict[str, dict]:
+    """
+    Time the stages of the pipeline on the `name` fixture.
+
+    :return: {stage: {'best_ms', 'median_ms', 'rows'}}
+    """
+    response, _ = fixture(name)
+    parser = DailySeriesParser()
+    df = parser.parse_frame(response, None)
+    path = os.path.join(output_dir, f"{name}.csv")
+    binary_path = os.path.join(output_dir, f"{name}.series")
+
+    def aggregate() -> None:
+        aggregator = SeriesAggregator(df)
+        aggregator.rollup("monthly")
+        aggregator.total()
+
+    stages = {
+        "parse": lambda: parser.parse(response, None),
+        "frame": lambda: parser.parse_frame(response, None),
+        "aggregate": aggregate,
+        "write_csv": lambda: write_reference_csv(df, path),
+        "write_binary": lambda: write_binary_series(
+            df, binary_path, "Nacional", "Producto"
+        ),
+        "load_binary": lambda: load_binary_series(binary_path).to_frame(),
+    }
+    return {
+        stage: summarize(measure(function, repeat), rows=len(df))
+        for stage, function in stages.items()
+    }
+
+
+def end_to_end_benchmarks(
+    scenarios: list[str], repeat: int, latency: float, output_dir: str
+) -> dict[str, dict]:
+    """
+    Time main.py runs against a stand-in server started for the occasion.
+
+    :return: {scenario: {'best_ms', 'median_ms', 'queries'}}
+    """
+    server = StandInServer(latency=latency)
+    server.start()
+    environment = {**os.environ, **server.environment()}
+
+    results = {}
+    try:
+        for scenario in scenarios:
+            arguments = [
+                sys.executable,
+                "main.py",
+                f"--output-dir={output_dir}",
+                # Away from a catalog index of the real service
+                f"--catalog-file={os.path.join(output_dir, 'catalog.json')}",
+                *END_TO_END_SCENARIOS[scenario],
+            ]
+
+            def run() -> None:
+                subprocess.run(
+                    arguments,
+                    cwd=ROOT,
+                    env=environment,
+                    check=True,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+
+            queries = server.requests["qes"]
+            timings = measure(run, repeat)
+            results[scenario] = summarize(
+                timings, queries=(server.requests["qes"] - queries) // repeat
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return results
+
+
+def summarize(timings: list[float], **extra) -> dict:
+    return {
+        "best_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        **extra,
+    }
+
+
+def print_results(results: dict[str, dict], baseline: dict[str, dict]) -> None:
+    for name, result in results.items():
+        line = (
+            f"{name:<32} best {result['best_ms']:>10.1f}ms"
+            f"  median {result['median_ms']:>10.1f}ms"
+        )
+        if "rows" in result and result["best_ms"] > 0:
+            line += f"  {result['rows'] / result['best_ms'] * 1000:>12,.0f} rows/s"
+        if "queries" in result:
+            line += f"  {result['queries']:>4} queries"
+        previous = baseline.get(name)
+        if previous:
+            change = result["best_ms"] / previous["best_ms"] - 1
+            line += f"  {change:+.1%} vs baseline"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extractor benchmark suite")
+    parser.add_argument(
+        "--sizes",
+        nargs="*",
+        choices=list(FIXTURE_SIZES),
+        default=list(DEFAULT_SIZES),
+        help="Fixtures of the stage benchmarks (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="*",
+        choices=list(END_TO_END_SCENARIOS),
+        default=list(END_TO_END_SCENARIOS),
+        help="End to end scenarios (default: all)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds per QES query of the stand-in server",
+    )
+    parser.add_argument("--json", type=str, help="Save the results to this file")
+    parser.add_argument(
+        "--compare", type=str, help="Results file of a previous run to compare with"
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name in args.sizes:
+            for stage, result in stage_benchmarks(
+                name, args.repeat, output_dir
+            ).items():
+                results[f"{stage}/{name}"] = result
+                print_results({f"{stage}/{name}": result}, baseline)
+
+        if args.scenarios:
+            e2e = end_to_end_benchmarks(
+                args.scenarios, args.repeat, args.latency, output_dir
+            )
+            results.update(e2e)
+            print_results(e2e, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,227 @@
+"""
+Local stand-in for the PowerBI endpoints used by the extractor.
+
+Serves the token route, modelsAndExploration and the QES query endpoint on a
+single local port, answering queries with synthetic responses (see
+fixtures.series_response) for the dates, departments and products of the
+payload. Latency and transient errors can be injected.
+
+Run it, then point the extractor at it with the environment variables of
+src/config_values.py:
+
+    python benchmarks/stand_in_server.py --port 8901 --latency 0.05
+    GEP_CLUSTER_URL=http://127.0.0.1:8901 \\
+    GEP_QES_ENDPOINT=http://127.0.0.1:8901/qes/query \\
+    GEP_AUTH_API_ROUTE=http://127.0.0.1:8901/token \\
+    python main.py --department Nacional --product 'Café' ...
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from typing import Optional
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import (
+    catalog_response,
+    is_catalog_query,
+    payload_query,
+    product_names,
+    series_response,
+)
+
+QES_PATH = "/qes/query"
+TOKEN_PATH = "/token"
+MODELS_PATH_SUFFIX = "/modelsAndExploration"
+# Pairs answered to catalog queries. Series queries are answered for any pair
+DEFAULT_CATALOG = [("Nacional", "Café")] + [
+    ("Nacional", product) for product in product_names(20)
+]
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Threaded stand-in of the token, modelsAndExploration and QES endpoints.
+
+    :ivar requests: Number of requests received, per endpoint
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        missing_rate: float = 0.05,
+        seed: int = 0,
+        catalog: Optional[list[tuple[str, str]]] = None,
+    ):
+        """
+        :param latency: Seconds each QES query takes to answer
+        :param error_rate: Share of QES queries answered with `error_status`
+        :param missing_rate: Share of cells without value in the responses
+        :param catalog: Pairs answered to catalog queries, defaults to
+            DEFAULT_CATALOG
+        """
+        super().__init__(address, StandInRequestHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.missing_rate = missing_rate
+        self.catalog = DEFAULT_CATALOG if catalog is None else catalog
+        self.requests = {"token": 0, "models": 0, "qes": 0, "errors": 0}
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self) -> dict[str, str]:
+        """Environment variables pointing the extractor at this server."""
+        return {
+            "GEP_CLUSTER_URL": self.url,
+            "GEP_QES_ENDPOINT": self.url + QES_PATH,
+            "GEP_AUTH_API_ROUTE": self.url + TOKEN_PATH,
+        }
+
+    def start(self) -> threading.Thread:
+        """Serve in a background thread (stop with shutdown())."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def count(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    server: StandInServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0]
+        if path.endswith(MODELS_PATH_SUFFIX):
+            self.server.count("models")
+            self._send_json(
+                200,
+                {
+                    "models": [{"id": 1, "displayName": "stand-in"}],
+                    "exploration": {"mwcToken": "stand-in-mwc-token"},
+                },
+            )
+        elif path.startswith(TOKEN_PATH):
+            self.server.count("token")
+            expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+            self._send_json(
+                200,
+                {
+                    "Token": "stand-in-embed-token",
+                    "Expiration": expiration.isoformat(timespec="seconds"),
+                },
+            )
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        if self.path.split("?", 1)[0] != QES_PATH:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        self.server.count("qes")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self.server.count("errors")
+            self._send_json(self.server.error_status, {"error": "injected failure"})
+            return
+
+        try:
+            if is_catalog_query(body):
+                self._send_json(200, catalog_response(self.server.catalog))
+                return
+            start_date, end_date, departments, products = payload_query(body)
+        except (ValueError, KeyError, IndexError) as exc:
+            self._send_json(400, {"error": f"Invalid query: {exc}"})
+            return
+
+        response = series_response(
+            start_date,
+            end_date,
+            products,
+            departments,
+            seed=zlib.crc32("|".join(departments + products).encode("utf-8")),
+            missing_rate=self.server.missing_rate,
+            server_seconds=self.server.latency,
+        )
+        self._send_json(200, response)
+
+    def _send_json(self, status: int, body: dict) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            content = gzip.compress(content, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args) -> None:
+        self.server.logger.debug("%s - %s", self.address_string(), format % args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PowerBI endpoints stand-in")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per QES query"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of QES queries answered with --error-status",
+    )
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StandInServer(
+        (args.host, args.port),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    for name, value in server.environment().items():
+        print(f"export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"requests: {server.requests}")
@@ -0,0 +1,91 @@
+"""
+Startup budget of the extractor CLI.
+
+Measures the wall time of `python main.py --help` (interpreter start, module
+imports and argument parsing) over several runs, and checks that importing
+main.py does not import the heavy dependencies (pandas, pyarrow) that only
+some features need.
+
+Exits with status 1 when the median startup time is over the budget or a
+heavy dependency is imported eagerly.
+
+Usage: python benchmarks/startup.py [--runs 10] [--budget-ms 600]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_BUDGET_MS = 600
+LAZY_MODULES = ("pandas", "pyarrow")
+
+
+def time_startup(runs: int) -> list[float]:
+    """
+    :return: Wall time of each `python main.py --help` run, in milliseconds
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "main.py", "--help"],
+            cwd=ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def eager_modules() -> list[str]:
+    """
+    :return: LAZY_MODULES imported by `import main`
+    """
+    code = (
+        "import sys, main; "
+        f"print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.split()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extractor CLI startup budget")
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=STARTUP_BUDGET_MS,
+        help=f"Budget of the median startup time (default: {STARTUP_BUDGET_MS}ms)",
+    )
+    args = parser.parse_args()
+
+    # A first run warms up the bytecode and file system caches
+    time_startup(1)
+    timings = time_startup(args.runs)
+    median = statistics.median(timings)
+    print(
+        f"startup: median {median:.0f}ms, min {min(timings):.0f}ms, "
+        f"max {max(timings):.0f}ms over {args.runs} runs "
+        f"(budget {args.budget_ms:.0f}ms)"
+    )
+
+    eager = eager_modules()
+    print(f"eagerly imported: {', '.join(eager) or 'none'}")
+
+    if median > args.budget_ms or eager:
+        print("FAIL: startup budget exceeded")
+        sys.exit(1)
+    print("OK")
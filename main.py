@@ -1,29 +1,206 @@
+from __future__ import annotations
+
 import argparse
-from datetime import datetime, timedelta
-import pytz
-import pandas as pd
+from datetime import date, datetime, timedelta, timezone
+import logging
+import os
+import sys
+from typing import TYPE_CHECKING
 
 from src.config_values import *
+from src.aggregation import FREQUENCIES, STATISTICS
+from src.catalog import Catalog, UnknownCatalogValueError
+from src.chunking import ChunkReport, merge_chunk_frames
 from src.csv_writer import (
-    write_reference_csv,
+    CSV_COMPRESSIONS,
+    CompressionUnavailableError,
+    read_reference_csv,
     normalize_filename_part,
-    build_csv_filename,
 )
 from src.date_util import parse_yyyymmdd
+from src.extraction_state import ExtractionState
+from src.fill_engine import FILL_GRIDS, FILL_METHODS, FillEngine
+from src.extractor import SeriesExtractor
 from src.logging_util import setup_logging
-from src.payload_factory import PayloadFactory
-from src.powerbi_client import PowerBIClient
-from src.response_parser import DailySeriesParser
+from src import metrics
+from src.metrics import METRICS_FORMATS
+from src.manifest import PAIR_SEPARATOR, load_manifest, parse_pair, write_manifest
+from src.output_writer import OUTPUT_FORMATS, get_output_writer
+from src.outputs import write_daily_rows, write_outputs
+from src.pipeline import Outcome, PostProcessPipeline
+from src.resilience import CircuitBreaker, RetryPolicy
+from src.response_cache import ResponseCache
+from src.token_manager import TokenManager
 from src.token_provider import EmbedTokenProvider
 
+# pandas, pyarrow and the modules depending on them are imported when a
+# feature needs them: a daily CSV only run never imports pandas
+if TYPE_CHECKING:
+    from src.checkpoint import CheckpointStore
+    from src.series_store import SeriesStore
+
 logger = setup_logging()
 
 
-def fill_nans_with_previous(df: pd.DataFrame) -> pd.DataFrame:
-    """Help method to fill nan values with previous valid values."""
-    df = df.copy()
-    df["value"] = df["value"].ffill()
-    return df
+def record_outcomes(
+    outcomes: list[Outcome],
+    args: argparse.Namespace,
+    start_date: date,
+    end_date_given: date,
+    raise_errors: bool = False,
+) -> list[tuple[str, str]]:
+    """
+    Handle the outcomes of the post-processing of pairs: log the failed ones,
+    and save the incremental state of the others.
+
+    :param outcomes: ((department, product), daily values output or exception)
+        tuples, from PostProcessPipeline
+    :param raise_errors: Raise the exception of a failed pair instead
+    :return: Failed (department, product) pairs
+    """
+    failed = []
+    for (department_name, product_name), outcome in outcomes:
+        if isinstance(outcome, Exception):
+            if raise_errors:
+                raise outcome
+            logger.error(
+                "Extraction failed for department '%s' and product '%s'",
+                department_name,
+                product_name,
+                exc_info=outcome,
+            )
+            failed.append((department_name, product_name))
+            continue
+
+        if args.incremental and outcome:
+            ExtractionState(
+                department=department_name,
+                product=product_name,
+                covered_start=start_date,
+                covered_end=end_date_given,
+                daily_csv=outcome,
+            ).save(args.state_dir)
+    return failed
+
+
+def build_extractor(
+    args: argparse.Namespace,
+    token_manager: TokenManager,
+    cache: ResponseCache | None = None,
+    checkpoint: CheckpointStore | None = None,
+    background_refresh: bool = False,
+    rows: bool = False,
+) -> SeriesExtractor:
+    """Build the SeriesExtractor configured by the command line arguments."""
+    return SeriesExtractor(
+        tokens=token_manager,
+        cluster_url=CLUSTER,
+        report_id=REPORT_ID,
+        dataset_id=DATASET_ID,
+        visual_id=VISUAL_ID,
+        qes_endpoint=QES_ENDPOINT,
+        max_concurrency=args.max_concurrency,
+        rate_limit=args.rate_limit,
+        chunk_days=args.chunk_days,
+        point_limit=DATA_REDUCTION_POINT_LIMIT,
+        cache=cache,
+        background_refresh=background_refresh,
+        stream_responses=args.stream_responses,
+        batch_size=args.batch_size,
+        checkpoint=checkpoint,
+        retry_policy=RetryPolicy(
+            max_retries=args.max_retries,
+            backoff_base=HTTP_BACKOFF_BASE_SECONDS,
+            backoff_max=HTTP_BACKOFF_MAX_SECONDS,
+        ),
+        circuit_breaker=CircuitBreaker(
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=CIRCUIT_RESET_SECONDS,
+        ),
+        rows=rows,
+        max_pending=args.max_pending,
+    )
+
+
+def load_catalog(
+    args: argparse.Namespace, token_manager: TokenManager, refresh: bool = False
+) -> Catalog:
+    """
+    Load the catalog index, or fetch it when missing, stale or `refresh`.
+
+    A fetched catalog is saved to the index for the next runs, unless the
+    service returned only part of the pairs: it is then kept for this run
+    only.
+    """
+    catalog = None if refresh else Catalog.load(args.catalog_file)
+    if catalog is not None and not catalog.is_stale(args.catalog_ttl):
+        return catalog
+
+    logger.info("Fetching the catalog of departments and products")
+    catalog = build_extractor(args, token_manager).fetch_catalog()
+    if not catalog.complete:
+        logger.warning(
+            "The catalog is incomplete: it is not saved to %s, pairs are not "
+            "validated, and listings and --all-products only cover the %d pairs "
+            "returned",
+            args.catalog_file,
+            len(catalog.pairs),
+        )
+        return catalog
+
+    catalog.save(args.catalog_file)
+    logger.info("Catalog saved to %s", args.catalog_file)
+    return catalog
+
+
+def serve(args: argparse.Namespace, token_manager: TokenManager) -> None:
+    """
+    Run the extraction HTTP server until interrupted.
+
+    The server shares one warm extractor: tokens are refreshed in the
+    background and, with --cache-dir, responses are cached across requests.
+    The checkpoint store is not used, as its connection belongs to one thread.
+    """
+    from src.server import ExtractionServer
+
+    cache = None
+    if args.cache_dir:
+        cache = ResponseCache(
+            args.cache_dir,
+            ttl=args.cache_ttl,
+            max_bytes=args.cache_max_mb * 1024 * 1024,
+        )
+
+    extractor = build_extractor(
+        args, token_manager, cache=cache, background_refresh=True
+    )
+    # Handshake up front, so the first request does not pay for it
+    extractor.connect()
+
+    fill_engine = FillEngine(
+        method=args.fill_method, grid=args.fill_grid, max_gap=args.fill_max_gap
+    )
+
+    # Requests for unknown departments or products are rejected without a
+    # query when a fresh catalog index is available
+    catalog = None
+    if not args.no_catalog_check:
+        catalog = Catalog.load(args.catalog_file)
+        if catalog is not None and catalog.is_stale(args.catalog_ttl):
+            catalog = None
+
+    server = ExtractionServer(
+        (args.host, args.port), extractor, fill_engine, catalog=catalog
+    )
+    logger.info("Serving on http://%s:%d", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Interrupted, shutting down")
+    finally:
+        server.server_close()
+        if extractor.client is not None:
+            logger.info("PowerBI requests: %s", extractor.client.stats)
 
 
 if __name__ == "__main__":
@@ -39,36 +216,132 @@ if __name__ == "__main__":
 
     parser.add_argument(
         "--department",
-        required=True,
+        required=False,
         type=str,
         help="Department name, according to Bolsa Mercantil de Colombia (e.g., 'Nacional')",
     )
 
     parser.add_argument(
         "--product",
-        required=True,
+        required=False,
         type=str,
         help="Product name, according Bolsa Mercantil de Colombia (e.g., 'Azúcar Blanco')",
     )
 
+    parser.add_argument(
+        "--pair",
+        required=False,
+        action="append",
+        type=parse_pair,
+        help="Batch mode: department/product pair in 'department|product' format "
+        "(e.g., 'Nacional|Azúcar Blanco'). Can be given multiple times",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        required=False,
+        type=str,
+        help="Batch mode: CSV file with 'department' and 'product' columns",
+    )
+
+    parser.add_argument(
+        "--all-products",
+        action="store_true",
+        help="Batch mode: every product of the catalog, or of --department when "
+        "given (see --catalog-file)",
+    )
+
+    parser.add_argument(
+        "--list-catalog",
+        action="store_true",
+        help="Print the department|product pairs of the catalog (of --department "
+        "when given) and exit",
+    )
+
+    parser.add_argument(
+        "--write-manifest",
+        required=False,
+        type=str,
+        help="Write the pairs of the catalog (of --department when given) to this "
+        "manifest CSV file and exit",
+    )
+
+    parser.add_argument(
+        "--refresh-catalog",
+        action="store_true",
+        help="Fetch the catalog again, even if the local index is fresh",
+    )
+
+    parser.add_argument(
+        "--catalog-file",
+        required=False,
+        type=str,
+        default=CATALOG_INDEX_PATH,
+        help="Local index of the available departments and products. When it is "
+        "fresh, pairs are validated and their spelling corrected against it "
+        f"before querying (default: {CATALOG_INDEX_PATH})",
+    )
+
+    parser.add_argument(
+        "--catalog-ttl",
+        required=False,
+        type=float,
+        default=CATALOG_TTL_SECONDS,
+        help="Seconds before the catalog index is fetched again "
+        f"(default: {CATALOG_TTL_SECONDS})",
+    )
+
+    parser.add_argument(
+        "--no-catalog-check",
+        action="store_true",
+        help="Do not validate the pairs against the catalog index",
+    )
+
     parser.add_argument(
         "--start-date",
-        required=True,
+        required=False,
         type=parse_yyyymmdd,
-        help="Start date, in YYYYmmdd format",
+        help="Start date, in YYYYmmdd format (required unless --serve)",
     )
 
     parser.add_argument(
         "--end-date",
-        required=True,
+        required=False,
         type=parse_yyyymmdd,
-        help="End date, in YYYYmmdd format",
+        help="End date, in YYYYmmdd format (required unless --serve)",
     )
 
     parser.add_argument(
         "--apply-fillna",
         action="store_true",
-        help="Fill missing values using the previous valid values",
+        help="Fill missing values of each product (by default with the previous "
+        "valid values, see --fill-method, --fill-grid and --fill-max-gap)",
+    )
+
+    parser.add_argument(
+        "--fill-method",
+        required=False,
+        choices=FILL_METHODS,
+        default="ffill",
+        help="With --apply-fillna: ffill (previous valid value), bfill (next valid "
+        "value) or linear interpolation (default: ffill)",
+    )
+
+    parser.add_argument(
+        "--fill-grid",
+        required=False,
+        choices=FILL_GRIDS,
+        default="none",
+        help="With --apply-fillna: also add the missing business days or calendar "
+        "days of each product before filling (default: none)",
+    )
+
+    parser.add_argument(
+        "--fill-max-gap",
+        required=False,
+        type=int,
+        help="With --apply-fillna: leave runs of more than this number of "
+        "consecutive missing days unfilled",
     )
 
     parser.add_argument(
@@ -89,18 +362,357 @@ if __name__ == "__main__":
         help="If a csv file of total mean of given period should be written",
     )
 
+    parser.add_argument(
+        "--write-rollups",
+        nargs="+",
+        choices=FREQUENCIES,
+        default=[],
+        help="Also write the values aggregated by each of these periods, "
+        "in files suffixed with the period name",
+    )
+
+    parser.add_argument(
+        "--rollup-statistic",
+        required=False,
+        choices=STATISTICS,
+        default="mean",
+        help="Statistic of --write-rollups: mean, min, max, first, last, count, "
+        "or change (relative change of the mean over the calendar-previous "
+        "period, empty when that period has no values). "
+        "Files of a statistic other than mean are also suffixed with its name "
+        "(default: mean)",
+    )
+
+    parser.add_argument(
+        "--max-concurrency",
+        required=False,
+        type=int,
+        default=QES_MAX_CONCURRENCY,
+        help=f"Batch mode: max number of concurrent queries (default: {QES_MAX_CONCURRENCY})",
+    )
+
+    parser.add_argument(
+        "--rate-limit",
+        required=False,
+        type=float,
+        default=QES_RATE_LIMIT_PER_SECOND,
+        help="Max queries per second sent to the capacity endpoint "
+        f"(default: {QES_RATE_LIMIT_PER_SECOND})",
+    )
+
+    parser.add_argument(
+        "--chunk-days",
+        required=False,
+        type=int,
+        default=CHUNK_MAX_DAYS,
+        help="Split date ranges longer than this number of days in parallel chunks, "
+        f"to avoid data reduction on long ranges (default: {CHUNK_MAX_DAYS}, 0 disables)",
+    )
+
+    parser.add_argument(
+        "--batch-size",
+        required=False,
+        type=int,
+        default=QES_BATCH_SIZE,
+        help="Batch mode: number of pairs with the same date range fetched by a "
+        f"single multi-product query (default: {QES_BATCH_SIZE})",
+    )
+
+    parser.add_argument(
+        "--max-retries",
+        required=False,
+        type=int,
+        default=HTTP_MAX_RETRIES,
+        help="Max retries of a request failing with 429, 5xx or a connection "
+        f"error, with exponential backoff (default: {HTTP_MAX_RETRIES}, 0 disables)",
+    )
+
+    parser.add_argument(
+        "--workers",
+        required=False,
+        type=int,
+        default=PIPELINE_WORKERS,
+        help="Batch mode: worker processes filling, aggregating and writing the "
+        "outputs of the fetched pairs while the next ones are fetched "
+        f"(default: {PIPELINE_WORKERS}, in the main process)",
+    )
+
+    parser.add_argument(
+        "--max-pending",
+        required=False,
+        type=int,
+        default=PIPELINE_MAX_PENDING,
+        help="Max queries sent ahead of the processing of their results, and max "
+        "pairs waiting for a worker. Bounds memory usage on long batches "
+        f"(default: {PIPELINE_MAX_PENDING})",
+    )
+
+    parser.add_argument(
+        "--token-cache",
+        required=False,
+        type=str,
+        help="File where EmbedToken and MWC token are cached between runs "
+        "(created with owner-only permissions)",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        required=False,
+        type=str,
+        help="Directory of the local QES response cache. Disabled if not given",
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        required=False,
+        type=float,
+        default=CACHE_TTL_SECONDS,
+        help="Seconds before a cached response of an open date range expires "
+        f"(default: {CACHE_TTL_SECONDS})",
+    )
+
+    parser.add_argument(
+        "--cache-max-mb",
+        required=False,
+        type=int,
+        default=CACHE_MAX_MB,
+        help=f"Max size of the response cache, in MB (default: {CACHE_MAX_MB})",
+    )
+
+    parser.add_argument(
+        "--checkpoint-db",
+        required=False,
+        type=str,
+        help="SQLite file recording the completed chunks of a backfill. Rerunning "
+        "with the same file only fetches the chunks not completed yet",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only query the dates not covered by the previous run of each pair, "
+        "and merge them with its daily values csv",
+    )
+
+    parser.add_argument(
+        "--state-dir",
+        required=False,
+        type=str,
+        default=INCREMENTAL_STATE_DIR,
+        help=f"Incremental mode: directory of the state files (default: {INCREMENTAL_STATE_DIR})",
+    )
+
+    parser.add_argument(
+        "--incremental-overlap-days",
+        required=False,
+        type=int,
+        default=INCREMENTAL_OVERLAP_DAYS,
+        help="Incremental mode: number of last extracted days to query again "
+        f"(default: {INCREMENTAL_OVERLAP_DAYS})",
+    )
+
+    parser.add_argument(
+        "--store-db",
+        required=False,
+        type=str,
+        help="SQLite store of the daily series. Only the dates not stored yet are "
+        "queried, fetched values are upserted into it, and the outputs are "
+        "derived from it",
+    )
+
+    parser.add_argument(
+        "--stream-responses",
+        action="store_true",
+        help="Parse QES responses while they are downloaded, keeping memory "
+        "usage flat for large responses",
+    )
+
+    parser.add_argument(
+        "--output-format",
+        required=False,
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="Output format. parquet and feather write a dataset partitioned by "
+        "kind (daily, monthly, ...)/product/department/year under --output-dir, "
+        "and binary writes series files to be memory-mapped with "
+        "src.binary_series.load_binary_series (default: csv)",
+    )
+
+    parser.add_argument(
+        "--csv-compression",
+        required=False,
+        choices=CSV_COMPRESSIONS,
+        default=None,
+        help="Compress the csv output files (.csv.gz or .csv.zst). zstd requires "
+        "the zstandard package (default: no compression)",
+    )
+
+    parser.add_argument(
+        "--output-dir",
+        required=False,
+        type=str,
+        default=".",
+        help="Output directory (default: current directory)",
+    )
+
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run an HTTP server answering series requests with a warm extractor, "
+        "instead of a one-off extraction (see src/server.py)",
+    )
+
+    parser.add_argument(
+        "--host",
+        required=False,
+        type=str,
+        default=SERVER_HOST,
+        help=f"Server mode: address to listen on (default: {SERVER_HOST})",
+    )
+
+    parser.add_argument(
+        "--port",
+        required=False,
+        type=int,
+        default=SERVER_PORT,
+        help=f"Server mode: port to listen on (default: {SERVER_PORT})",
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        required=False,
+        type=str,
+        help="Write per stage timings and counters (token fetch, QES execution, "
+        "server side execution metrics, parse, write...) to this file",
+    )
+
+    parser.add_argument(
+        "--metrics-format",
+        required=False,
+        choices=METRICS_FORMATS,
+        default="jsonl",
+        help="Format of --metrics-file: JSON lines, or Prometheus text file "
+        "(default: jsonl)",
+    )
+
     args = parser.parse_args()
     processing_datetime = args.processing_datetime
     if processing_datetime:
         logger.info(f"Processing datetime provided: {processing_datetime}")
     else:
-        processing_datetime = datetime.now(tz=pytz.UTC).strftime("%Y%m%d_%H%M%S")
+        processing_datetime = datetime.now(tz=timezone.utc).strftime("%Y%m%d_%H%M%S")
         logger.info(
             f"No processing datetime provided, using current datetime: {processing_datetime}"
         )
 
-    department_name = args.department
-    product_name = args.product
+    if args.stream_responses and args.cache_dir:
+        parser.error("--stream-responses cannot be combined with --cache-dir")
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    if args.workers < 0:
+        parser.error("--workers must be at least 0")
+
+    if args.max_pending < 1:
+        parser.error("--max-pending must be at least 1")
+
+    if args.stream_responses and args.batch_size > 1:
+        parser.error("--stream-responses cannot be combined with --batch-size")
+
+    token_provider = EmbedTokenProvider(TOKEN_URL)
+    token_manager = TokenManager(
+        token_provider,
+        cache_path=args.token_cache,
+        default_ttl=TOKEN_DEFAULT_TTL_SECONDS,
+        refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS,
+        min_refresh_interval=TOKEN_REFRESH_MIN_INTERVAL_SECONDS,
+    )
+
+    if args.serve:
+        serve(args, token_manager)
+        sys.exit(0)
+
+    # The catalog is fetched when a discovery option needs it. Otherwise the
+    # local index, when fresh, is only used to validate the pairs offline
+    catalog = None
+    if (
+        args.refresh_catalog
+        or args.list_catalog
+        or args.write_manifest
+        or args.all_products
+    ):
+        catalog = load_catalog(args, token_manager, refresh=args.refresh_catalog)
+    elif not args.no_catalog_check:
+        catalog = Catalog.load(args.catalog_file)
+        if catalog is not None and catalog.is_stale(args.catalog_ttl):
+            logger.info(
+                "Catalog index %s is stale, pairs are not validated "
+                "(see --refresh-catalog)",
+                args.catalog_file,
+            )
+            catalog = None
+
+    catalog_pairs = []
+    if catalog is not None:
+        catalog_pairs = catalog.pairs
+        if args.department and not args.product:
+            try:
+                department = catalog.resolve_department(args.department)
+            except UnknownCatalogValueError as exc:
+                if catalog.complete:
+                    parser.error(str(exc))
+                department = args.department
+            catalog_pairs = [pair for pair in catalog_pairs if pair[0] == department]
+
+    if args.list_catalog or args.write_manifest:
+        if args.write_manifest:
+            write_manifest(args.write_manifest, catalog_pairs)
+            logger.info(
+                "%d pairs written to %s", len(catalog_pairs), args.write_manifest
+            )
+        if args.list_catalog:
+            for department_name, product_name in catalog_pairs:
+                print(f"{department_name}{PAIR_SEPARATOR}{product_name}")
+        sys.exit(0)
+
+    pairs = []
+    if args.manifest:
+        pairs.extend(load_manifest(args.manifest))
+    if args.pair:
+        pairs.extend(args.pair)
+    if args.all_products:
+        if args.product:
+            parser.error("--all-products cannot be combined with --product")
+        pairs.extend(catalog_pairs)
+    elif args.department or args.product:
+        if not (args.department and args.product):
+            parser.error("--department and --product must be given together")
+        pairs.append((args.department, args.product))
+    if not pairs:
+        parser.error(
+            "either --department/--product, --pair, --manifest or --all-products "
+            "must be given"
+        )
+
+    if catalog is not None and catalog.complete and not args.no_catalog_check:
+        try:
+            pairs = [catalog.resolve(*pair) for pair in pairs]
+        except UnknownCatalogValueError as exc:
+            parser.error(f"{exc} (catalog {args.catalog_file})")
+    pairs = list(dict.fromkeys(pairs))
+
+    if args.incremental and not args.write_daily_values_csv:
+        parser.error("--incremental requires --write-daily-values-csv")
+    if args.incremental and args.output_format != "csv":
+        parser.error("--incremental requires --output-format csv")
+    if args.csv_compression and args.output_format != "csv":
+        parser.error("--csv-compression requires --output-format csv")
+    if args.incremental and args.store_db:
+        parser.error("--incremental cannot be combined with --store-db")
+
+    if args.start_date is None or args.end_date is None:
+        parser.error("--start-date and --end-date are required")
 
     start_date = args.start_date
     end_date = args.end_date
@@ -117,97 +729,241 @@ if __name__ == "__main__":
     write_mean_csv = args.write_mean_csv
 
     logger.info("Running extractor for given values")
-    logger.info(f"department: {department_name}")
-    logger.info(f"product: {product_name}")
+    logger.info(f"pairs: {len(pairs)}")
     logger.info(f"start-date: {start_date}")
     logger.info(f"end-date: {end_date}")
     logger.info(f"apply-fillna: {apply_fillna}")
 
-    token_provider = EmbedTokenProvider(TOKEN_URL)
-    embed_token = token_provider.get_token()
-
-    client = PowerBIClient(CLUSTER, REPORT_ID, embed_token)
-    models = client.get_models_and_exploration()
-
-    mwc_token = client.get_mwc_token(models)
-    if not mwc_token:
-        logger.error("Could not find mwc_token")
-        raise
-
-    payload = PayloadFactory.daily_series(
-        dataset_id=DATASET_ID,
-        report_id=REPORT_ID,
-        visual_id=VISUAL_ID,
-        start_date=start_date,
-        end_date=end_date,
-        product=product_name,
-        department=department_name,
+    os.makedirs(args.output_dir, exist_ok=True)
+    try:
+        writer = get_output_writer(
+            args.output_format, args.output_dir, args.csv_compression
+        )
+    except CompressionUnavailableError as exc:
+        parser.error(str(exc))
+    fill_engine = FillEngine(
+        method=args.fill_method, grid=args.fill_grid, max_gap=args.fill_max_gap
     )
 
-    response = client.execute_query(QES_ENDPOINT, mwc_token, payload)
-
-    parser = DailySeriesParser()
-    rows = parser.parse(response, product_name)
-
-    # Now we have a list of dicts in format [{'date', 'product', 'value'}]
-    # Let's spend some memory and write a pandas
-    df = pd.DataFrame(rows)
-    df["date"] = pd.to_datetime(df["date"])
-    df["value"] = pd.to_numeric(df["value"], errors="coerce")
-
-    if apply_fillna:
-        logger.info("Applying fill na")
-        df = fill_nans_with_previous(df)
+    cache = None
+    if args.cache_dir:
+        cache = ResponseCache(
+            args.cache_dir,
+            ttl=args.cache_ttl,
+            max_bytes=args.cache_max_mb * 1024 * 1024,
+        )
 
-    min_date = df["date"].min()
-    max_date = df["date"].max()
-    num_days = df["date"].nunique()
+    checkpoint = None
+    if args.checkpoint_db:
+        from src.checkpoint import CheckpointStore
+
+        checkpoint = CheckpointStore(args.checkpoint_db)
+
+    store = None
+    if args.store_db:
+        from src.series_store import SeriesStore
+
+        store = SeriesStore(args.store_db)
+
+    # Daily values only, as CSV and without fill: rows are written as parsed,
+    # without pandas
+    rows_only = (
+        write_daily_values
+        and not (write_monthly_values or write_mean_csv or args.write_rollups)
+        and not apply_fillna
+        and args.output_format == "csv"
+        and not args.incremental
+        and checkpoint is None
+        and store is None
+        and args.batch_size == 1
+        and not args.stream_responses
+    )
+    if rows_only:
+        logger.info("Daily values only: writing parsed rows directly")
+
+    extractor = build_extractor(
+        args,
+        token_manager,
+        cache=cache,
+        checkpoint=checkpoint,
+        background_refresh=len(pairs) > 1,
+        rows=rows_only,
+    )
 
-    logger.info(
-        "Dataframe covers %d distinct days (%s - %s)",
-        num_days,
-        min_date.strftime("%Y-%m-%d"),
-        max_date.strftime("%Y-%m-%d"),
+    # In incremental mode, only the dates not covered by the previous run are
+    # queried, and with a store, only the dates not stored yet
+    states = {}
+    fetch_plan = []
+    for department_name, product_name in pairs:
+        ranges = [(start_date, end_date)]
+        if store is not None:
+            ranges = store.missing_ranges(
+                department_name, product_name, start_date, end_date
+            )
+            logger.info(
+                "Store %s|%s: querying %s",
+                department_name,
+                product_name,
+                ", ".join(f"{a} - {b - timedelta(days=1)}" for a, b in ranges)
+                or "nothing",
+            )
+        elif args.incremental:
+            state = ExtractionState.load(args.state_dir, department_name, product_name)
+            if state is not None:
+                states[(department_name, product_name)] = state
+                ranges = state.missing_ranges(
+                    start_date, end_date, overlap_days=args.incremental_overlap_days
+                )
+                logger.info(
+                    "Incremental %s|%s: covered %s - %s, querying %s",
+                    department_name,
+                    product_name,
+                    state.covered_start,
+                    state.covered_end,
+                    ", ".join(f"{a} - {b - timedelta(days=1)}" for a, b in ranges)
+                    or "nothing",
+                )
+        fetch_plan.append(ranges)
+
+    chunk_reports: list[ChunkReport] = []
+    results = extractor.fetch_many(
+        (
+            (department_name, product_name, range_start, range_end)
+            for (department_name, product_name), ranges in zip(pairs, fetch_plan)
+            for range_start, range_end in ranges
+        ),
+        chunk_reports=chunk_reports,
     )
 
-    base_filename = build_csv_filename(
-        department=department_name,
-        product=product_name,
-        start_date=start_date,
-        end_date=end_date_given,
-        apply_fillna=apply_fillna,
+    # Outputs are written by the pipeline, in worker processes with --workers,
+    # while the next pairs are fetched
+    pipeline = PostProcessPipeline(workers=args.workers, max_pending=args.max_pending)
+    failed = []
+    for (department_name, product_name), ranges in zip(pairs, fetch_plan):
+        logger.info(f"department: {department_name}")
+        logger.info(f"product: {product_name}")
+        with metrics.span(
+            "main.fetch", department=department_name, product=product_name
+        ):
+            fetched = [next(results) for _ in ranges]
+
+        outcomes = []
+        try:
+            for df in fetched:
+                if isinstance(df, Exception):
+                    raise df
+
+            if rows_only:
+                # rows_only implies --output-format csv: writer is a CsvOutputWriter
+                outcomes = pipeline.submit(
+                    (department_name, product_name),
+                    write_daily_rows,
+                    rows=fetched[0],
+                    department_name=department_name,
+                    product_name=product_name,
+                    start_date=start_date,
+                    end_date_given=end_date_given,
+                    writer=writer,
+                    logger=logger,
+                )
+            else:
+                state = states.get((department_name, product_name))
+                if store is not None:
+                    for fetched_df, covered in zip(fetched, ranges):
+                        store.upsert(
+                            department_name, product_name, fetched_df, covered=covered
+                        )
+                    df = store.read_frame(
+                        department_name, product_name, start_date, end_date
+                    )
+                elif state is not None:
+                    import pandas as pd
+
+                    existing = pd.DataFrame(
+                        read_reference_csv(state.daily_csv),
+                        columns=["date", "product", "value"],
+                    )
+                    existing["date"] = pd.to_datetime(existing["date"])
+                    existing["value"] = pd.to_numeric(
+                        existing["value"], errors="coerce"
+                    )
+                    existing = existing[
+                        (existing["date"] >= pd.Timestamp(start_date))
+                        & (existing["date"] < pd.Timestamp(end_date))
+                    ]
+                    # Fresh rows come first, so they win over the existing ones
+                    df = merge_chunk_frames(fetched + [existing])
+                else:
+                    df = fetched[0]
+
+                outcomes = pipeline.submit(
+                    (department_name, product_name),
+                    write_outputs,
+                    df=df,
+                    department_name=department_name,
+                    product_name=product_name,
+                    start_date=start_date,
+                    end_date_given=end_date_given,
+                    apply_fillna=apply_fillna,
+                    write_daily_values=write_daily_values,
+                    write_monthly_values=write_monthly_values,
+                    write_mean_csv=write_mean_csv,
+                    writer=writer,
+                    logger=logger,
+                    rollups=tuple(args.write_rollups),
+                    rollup_statistic=args.rollup_statistic,
+                    fill_engine=fill_engine,
+                )
+        except Exception:
+            if len(pairs) == 1:
+                raise
+            logger.exception(
+                "Extraction failed for department '%s' and product '%s'",
+                department_name,
+                product_name,
+            )
+            failed.append((department_name, product_name))
+
+        failed += record_outcomes(
+            outcomes, args, start_date, end_date_given, len(pairs) == 1
+        )
+
+    failed += record_outcomes(
+        pipeline.drain(), args, start_date, end_date_given, len(pairs) == 1
     )
+    pipeline.close()
 
-    if write_daily_values:
-        daily_filename = base_filename + ".csv"
-        logger.info(f"writing: {daily_filename}")
-        write_reference_csv(df, daily_filename, logger)
+    token_manager.stop_background_refresh()
 
-    if write_monthly_values:
-        df["date"] = pd.to_datetime(df["date"])
-        df["year_month"] = df["date"].dt.to_period("M")
+    if checkpoint is not None:
+        checkpoint.close()
 
-        monthly_avg = df.groupby(["product", "year_month"], as_index=False)[
-            "value"
-        ].mean()
+    if store is not None:
+        store.close()
 
-        monthly_avg["date"] = monthly_avg["year_month"].dt.to_timestamp()
-        monthly_avg = monthly_avg.drop(columns=["year_month"])
+    if cache is not None:
+        logger.info("Response cache: %d hits, %d misses", cache.hits, cache.misses)
 
-        monthly_filename = base_filename + "_monthly.csv"
-        logger.info(f"writing: {monthly_filename}")
-        write_reference_csv(monthly_avg, monthly_filename, logger)
+    if extractor.client is not None:
+        logger.info("PowerBI requests: %s", extractor.client.stats)
 
-    if write_mean_csv:
-        df = df.copy()
-        df["date"] = pd.to_datetime(df["date"])
+    reduced_chunks = [r for r in chunk_reports if not r.complete]
+    logger.info(
+        "Chunks: %d queried, %d complete, %d reduced",
+        len(chunk_reports),
+        len(chunk_reports) - len(reduced_chunks),
+        len(reduced_chunks),
+    )
+    for report in reduced_chunks:
+        logger.warning("Reduced chunk: %s", report)
 
-        result = df.groupby("product", as_index=False).agg(
-            value=("value", "mean"), date=("date", "min")
-        )
+    logger.info("Stage timings: %s", metrics.REGISTRY.summary())
+    if args.metrics_file:
+        metrics.REGISTRY.write(args.metrics_file, args.metrics_format)
+        logger.info("Metrics written to %s", args.metrics_file)
 
-        mean_filename = base_filename + "_mean.csv"
-        logger.info(f"writing: {mean_filename}")
-        write_reference_csv(result, mean_filename, logger)
+    if failed:
+        logger.error("%d of %d pairs failed: %s", len(failed), len(pairs), failed)
+        sys.exit(1)
 
     logger.info(f"That's all folks! The work is done")
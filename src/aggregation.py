@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FREQUENCIES = ("daily", "weekly", "monthly", "quarterly", "yearly")
+STATISTICS = ("mean", "min", "max", "first", "last", "count", "change")
+
+
+class SeriesAggregator:
+    """
+    Rollups of [date, product, value] series, for many products at once.
+
+    Product codes, day numbers and values are extracted once as NumPy arrays,
+    and each rollup groups them on integer (product, period) keys, computing
+    all of its statistics in a single groupby. The input DataFrame is never
+    copied nor modified.
+
+    Periods are labelled with their first day: weeks start on Monday, and
+    quarters on January, April, July and October.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        import pandas as pd
+
+        product = df["product"]
+        if not isinstance(product.dtype, pd.CategoricalDtype):
+            product = product.astype("category")
+        self.categories = product.cat.categories
+        self.codes = product.cat.codes.to_numpy(dtype="int64")
+
+        dates = df["date"]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates)
+        self.days = dates.to_numpy(dtype="datetime64[D]")
+        self.values = df["value"].to_numpy(dtype="float64", na_value=np.nan)
+
+    def period_starts(self, frequency: str) -> np.ndarray:
+        """
+        First day of the period of each row.
+
+        :param frequency: One of FREQUENCIES
+        :return: datetime64[D] array
+        """
+        if frequency == "daily":
+            return self.days
+        if frequency == "weekly":
+            day_numbers = self.days.astype("int64")
+            # 1970-01-01 was a Thursday: shift so weeks start on Monday
+            return (day_numbers - (day_numbers + 3) % 7).astype("datetime64[D]")
+        if frequency == "monthly":
+            return self.days.astype("datetime64[M]").astype("datetime64[D]")
+        if frequency == "quarterly":
+            months = self.days.astype("datetime64[M]").astype("int64")
+            return (months - months % 3).astype("datetime64[M]").astype("datetime64[D]")
+        if frequency == "yearly":
+            return self.days.astype("datetime64[Y]").astype("datetime64[D]")
+        raise ValueError(
+            f"Unknown frequency '{frequency}'. Expected one of {FREQUENCIES}"
+        )
+
+    @staticmethod
+    def previous_period_starts(starts: np.ndarray, frequency: str) -> np.ndarray:
+        """
+        First day of the calendar period before each period.
+
+        :param starts: datetime64[D] array of period starts, as period_starts()
+        :param frequency: One of FREQUENCIES
+        :return: datetime64[D] array
+        """
+        if frequency == "daily":
+            return starts - np.timedelta64(1, "D")
+        if frequency == "weekly":
+            return starts - np.timedelta64(7, "D")
+        months = {"monthly": 1, "quarterly": 3, "yearly": 12}.get(frequency)
+        if months is None:
+            raise ValueError(
+                f"Unknown frequency '{frequency}'. Expected one of {FREQUENCIES}"
+            )
+        months_start = starts.astype("datetime64[M]") - np.timedelta64(months, "M")
+        return months_start.astype("datetime64[D]")
+
+    def rollup(
+        self, frequency: str, statistics: Iterable[str] = ("mean",)
+    ) -> pd.DataFrame:
+        """
+        Aggregate values per product and period.
+
+        'change' is the relative change of the period mean over the calendar
+        previous period of the same product: NaN when that period has no
+        values, e.g. for the first period or after a gap, rather than a change
+        spanning several periods.
+
+        :param frequency: One of FREQUENCIES
+        :param statistics: Some of STATISTICS
+        :return: DataFrame with columns [product, date, *statistics], sorted by
+            product (in category order) and date
+        """
+        return self._aggregate(
+            self.period_starts(frequency), list(statistics), frequency
+        )
+
+    def total(self, statistics: Iterable[str] = ("mean",)) -> pd.DataFrame:
+        """
+        Aggregate all values of each product.
+
+        :return: DataFrame with columns [product, date, *statistics], where
+            date is the first date of the product
+        """
+        statistics = list(statistics)
+        if "change" in statistics:
+            raise ValueError("'change' is only defined for rollups")
+        return self._aggregate(None, statistics)
+
+    def _aggregate(
+        self,
+        periods: np.ndarray | None,
+        statistics: list[str],
+        frequency: str | None = None,
+    ) -> pd.DataFrame:
+        import pandas as pd
+
+        unknown = set(statistics) - set(STATISTICS)
+        if unknown:
+            raise ValueError(
+                f"Unknown statistics {sorted(unknown)}. Expected some of {STATISTICS}"
+            )
+
+        keep = self.codes >= 0
+        columns = {"code": self.codes[keep], "value": self.values[keep]}
+        keys = ["code"]
+        if periods is not None:
+            columns["period"] = periods[keep]
+            keys.append("period")
+        else:
+            columns["day"] = self.days[keep]
+
+        functions = [s for s in statistics if s != "change"]
+        if "change" in statistics and "mean" not in functions:
+            functions.append("mean")
+        if not functions:
+            raise ValueError("At least one statistic is required")
+
+        grouped = pd.DataFrame(columns).groupby(keys, sort=True)
+        result = grouped["value"].agg(functions)
+        if periods is None:
+            result["period"] = grouped["day"].min()
+        result = result.reset_index()
+
+        if "change" in statistics:
+            # Look the mean of each period up at the calendar-previous period
+            codes = result["code"].to_numpy()
+            starts = result["period"].to_numpy().astype("datetime64[D]")
+            means = pd.Series(
+                result["mean"].to_numpy(),
+                index=pd.MultiIndex.from_arrays([codes, starts.astype("int64")]),
+            )
+            previous_starts = self.previous_period_starts(starts, frequency)
+            previous = means.reindex(
+                pd.MultiIndex.from_arrays([codes, previous_starts.astype("int64")])
+            ).to_numpy()
+            result["change"] = result["mean"].to_numpy() / previous - 1
+
+        output = pd.DataFrame(
+            {
+                "product": pd.Categorical.from_codes(
+                    result["code"].to_numpy(), categories=self.categories
+                ),
+                "date": result["period"].astype("datetime64[ns]"),
+            }
+        )
+        for statistic in statistics:
+            output[statistic] = result[statistic].to_numpy()
+
+        return output
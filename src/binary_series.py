@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+import struct
+import tempfile
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+BINARY_SERIES_SUFFIX = ".series"
+MAGIC = b"GEPS"
+VERSION = 1
+# magic, version, reserved, number of rows, metadata length
+HEADER = struct.Struct("<4sHHQI")
+ALIGNMENT = 8
+
+
+class BinarySeriesError(RuntimeError):
+    """Raised when a file is not a binary series file."""
+
+    pass
+
+
+class BinarySeries:
+    """
+    Daily series read from a binary series file.
+
+    `dates` and `values` are read-only views on the memory-mapped file: loading
+    copies nothing, and processes reading the same files share the OS page
+    cache.
+
+    :ivar dates: int32 array of days since 1970-01-01
+    :ivar values: float64 array, NaN for missing values
+    """
+
+    def __init__(
+        self, department: str, product: str, dates: np.ndarray, values: np.ndarray
+    ):
+        self.department = department
+        self.product = product
+        self.dates = dates
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def datetimes(self) -> np.ndarray:
+        """:return: `dates` as a datetime64[D] array (a copy)"""
+        return self.dates.astype("datetime64[D]")
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        :return: DataFrame with columns [date, product, value], as parsed. The
+            value column is built on the mapped values, without a copy
+        """
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                "date": self.datetimes().astype("datetime64[ns]"),
+                "product": pd.Categorical.from_codes(
+                    np.zeros(len(self), dtype=np.int8), [self.product]
+                ),
+                "value": pd.Series(self.values, copy=False),
+            },
+            copy=False,
+        )
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_binary_series(
+    df: pd.DataFrame, path: str, department: str, product: str
+) -> None:
+    """
+    Write a daily series as a binary series file, atomically.
+
+    Layout, little endian:
+    - header: HEADER, then the metadata (department, product) as UTF-8 JSON
+    - dates: int32 days since 1970-01-01, from the next multiple of 8 bytes
+    - values: float64, from the next multiple of 8 bytes after the dates
+
+    :param df: DataFrame with columns [date, value]
+    """
+    import pandas as pd
+
+    dates = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]").astype("<i4")
+    values = df["value"].to_numpy(dtype="<f8", na_value=np.nan)
+    metadata = json.dumps(
+        {"department": department, "product": product}, ensure_ascii=False
+    ).encode("utf-8")
+
+    dates_offset = _aligned(HEADER.size + len(metadata))
+    values_offset = dates_offset + _aligned(dates.nbytes)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(values), len(metadata)))
+            f.write(metadata)
+            f.write(b"\0" * (dates_offset - f.tell()))
+            f.write(dates.tobytes())
+            f.write(b"\0" * (values_offset - f.tell()))
+            f.write(values.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_binary_series(path: str) -> BinarySeries:
+    """
+    Memory-map a binary series file.
+
+    :raises BinarySeriesError: if the file is not a binary series file
+    """
+    with metrics.span("load.binary"):
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(buffer) < HEADER.size:
+            raise BinarySeriesError(f"{path} is not a binary series file")
+
+        magic, version, _, rows, metadata_size = HEADER.unpack(
+            buffer[: HEADER.size].tobytes()
+        )
+        if magic != MAGIC or version != VERSION:
+            raise BinarySeriesError(
+                f"{path} is not a version {VERSION} binary series file"
+            )
+
+        metadata = json.loads(
+            buffer[HEADER.size : HEADER.size + metadata_size].tobytes()
+        )
+        dates_offset = _aligned(HEADER.size + metadata_size)
+        values_offset = dates_offset + _aligned(rows * 4)
+        if len(buffer) < values_offset + rows * 8:
+            raise BinarySeriesError(f"{path} is truncated")
+
+        return BinarySeries(
+            department=metadata["department"],
+            product=metadata["product"],
+            dates=buffer[dates_offset : dates_offset + rows * 4].view("<i4"),
+            values=buffer[values_offset : values_offset + rows * 8].view("<f8"),
+        )
+
+
+def load_binary_series_dir(
+    directory: str, pattern: str = "*"
+) -> dict[str, BinarySeries]:
+    """
+    Memory-map every binary series file of a directory.
+
+    :param pattern: Glob pattern of the base filenames, e.g. 'values_nacional_*'
+    :return: BinarySeries per base filename, in name order
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern + BINARY_SERIES_SUFFIX)))
+    return {
+        os.path.basename(path)[: -len(BINARY_SERIES_SUFFIX)]: load_binary_series(path)
+        for path in paths
+    }
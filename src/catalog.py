@@ -0,0 +1,183 @@
+import difflib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Iterable, Optional
+
+from src.csv_writer import normalize_filename_part
+from src.dsr_decoder import DsrDecoder, descriptor_names
+
+DEPARTMENT_COLUMN = "Precios reuters diarios.DEPARTAMENTO"
+PRODUCT_COLUMN = "Precios reuters diarios.PRODUCTO"
+CATALOG_VERSION = 1
+
+
+class UnknownCatalogValueError(ValueError):
+    """Raised when a department or product is not in the catalog."""
+
+    pass
+
+
+def match_key(value: str) -> str:
+    """
+    Key under which names are matched: accents, case, spaces and punctuation
+    are ignored, so 'azucar blanco' matches 'Azúcar Blanco'.
+    """
+    return normalize_filename_part(value.strip())
+
+
+def parse_catalog(response: dict) -> tuple[list[tuple[str, str]], bool]:
+    """
+    Parse the response of a PayloadFactory.catalog query.
+
+    :return: ((department, product) pairs, completeness flag returned by the
+        service)
+    """
+    names = {name: key for key, name in descriptor_names(response).items()}
+    department_key = names.get(DEPARTMENT_COLUMN, "G0")
+    product_key = names.get(PRODUCT_COLUMN, "G1")
+
+    pairs = []
+    complete = True
+    for shape in DsrDecoder().decode(response):
+        complete = complete and shape.is_complete
+        for department, product in zip(
+            shape.primary.column(department_key), shape.primary.column(product_key)
+        ):
+            if department and product:
+                pairs.append((str(department), str(product)))
+
+    return pairs, complete
+
+
+class Catalog:
+    """
+    Departments and products available in the data set.
+
+    The catalog is discovered with a distinct values query (see
+    SeriesExtractor.fetch_catalog) and kept in a local JSON index, so inputs
+    can be validated, and their spelling corrected, without querying the
+    service: 'nacional|azucar blanco' resolves to ('Nacional', 'Azúcar
+    Blanco'), and a misspelled product fails before the token handshake.
+    """
+
+    def __init__(
+        self,
+        pairs: Iterable[tuple[str, str]],
+        fetched_at: Optional[float] = None,
+        complete: bool = True,
+    ):
+        """
+        :param pairs: (department, product) pairs
+        :param fetched_at: Epoch time the pairs were fetched at, defaults to now
+        :param complete: False when the service returned only part of the pairs.
+            Such a catalog is neither saved nor used to validate inputs
+        """
+        self.pairs = sorted(set(pairs))
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.complete = complete
+
+        self._departments: dict[str, str] = {}
+        self._products: dict[str, dict[str, str]] = {}
+        for department, product in self.pairs:
+            self._departments.setdefault(match_key(department), department)
+            self._products.setdefault(department, {}).setdefault(
+                match_key(product), product
+            )
+
+    @property
+    def departments(self) -> list[str]:
+        return sorted(set(self._departments.values()))
+
+    def products(self, department: Optional[str] = None) -> list[str]:
+        """
+        :param department: Only the products of this department (any spelling)
+        :return: Sorted product names
+        """
+        if department is not None:
+            return sorted(self._products[self.resolve_department(department)].values())
+        return sorted({product for _, product in self.pairs})
+
+    def resolve_department(self, department: str) -> str:
+        """
+        :return: Department name, as spelled in the catalog
+        :raises UnknownCatalogValueError: if the department is not in the catalog
+        """
+        return self._resolve(department, self._departments, "department")
+
+    def resolve(self, department: str, product: str) -> tuple[str, str]:
+        """
+        Match a department/product pair against the catalog.
+
+        :return: (department, product), as spelled in the catalog
+        :raises UnknownCatalogValueError: if the department, or the product in
+            that department, is not in the catalog
+        """
+        department = self.resolve_department(department)
+        product = self._resolve(
+            product, self._products[department], "product", f" in '{department}'"
+        )
+        return department, product
+
+    @staticmethod
+    def _resolve(value: str, names: dict[str, str], kind: str, where: str = "") -> str:
+        key = match_key(value)
+        if key in names:
+            return names[key]
+
+        suggestions = [
+            names[match]
+            for match in difflib.get_close_matches(key, list(names), n=3, cutoff=0.6)
+        ]
+        message = f"Unknown {kind} '{value}'{where}"
+        if suggestions:
+            message += f". Did you mean: {', '.join(repr(s) for s in suggestions)}?"
+        raise UnknownCatalogValueError(message)
+
+    def is_stale(self, ttl: float) -> bool:
+        """
+        :param ttl: Seconds the catalog stays fresh after it was fetched
+        """
+        return time.time() - self.fetched_at > ttl
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Catalog"]:
+        """
+        Load a catalog index.
+
+        :return: Catalog, or None if there is no usable index
+        """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CATALOG_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            return cls(
+                [(department, product) for department, product in data["pairs"]],
+                fetched_at=float(data["fetched_at"]),
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            logging.getLogger(cls.__name__).warning(
+                "Ignoring unreadable catalog %s", path
+            )
+            return None
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        data = {
+            "version": CATALOG_VERSION,
+            "fetched_at": self.fetched_at,
+            "pairs": self.pairs,
+        }
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".catalog-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
@@ -0,0 +1,146 @@
+from datetime import date, datetime
+import logging
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    department TEXT NOT NULL,
+    product TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    num_rows INTEGER NOT NULL,
+    completed_at TEXT NOT NULL,
+    UNIQUE (department, product, start_date, end_date)
+);
+CREATE TABLE IF NOT EXISTS unit_rows (
+    unit_id INTEGER NOT NULL REFERENCES units (id) ON DELETE CASCADE,
+    date TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (unit_id, date)
+) WITHOUT ROWID;
+"""
+
+Unit = tuple[str, str, date, date]
+
+
+class CheckpointStore:
+    """
+    Durable record of the completed units of a backfill, in a SQLite file.
+
+    A unit is a (department, product, start_date, end_date) chunk query. Its
+    rows are stored together with its completion, in a single transaction,
+    so a run that crashes can be started again with the same checkpoint file
+    and only fetch the units that were not completed yet. The rows of the
+    completed units are read back from the file to rebuild the outputs.
+
+    A checkpoint file belongs to one backfill: start a new backfill with a
+    new file, or with reset().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def completed_units(self) -> set[Unit]:
+        rows = self.connection.execute(
+            "SELECT department, product, start_date, end_date FROM units"
+        )
+        return {
+            (department, product, date.fromisoformat(start), date.fromisoformat(end))
+            for department, product, start, end in rows
+        }
+
+    def load(self, unit: Unit) -> pd.DataFrame:
+        """
+        Read the rows of a completed unit.
+
+        :return: DataFrame with columns [date, product, value], as fetched
+        """
+        department, product, start_date, end_date = unit
+        rows = self.connection.execute(
+            """
+            SELECT r.date, r.value FROM unit_rows r JOIN units u ON u.id = r.unit_id
+            WHERE u.department = ? AND u.product = ? AND u.start_date = ?
+                AND u.end_date = ?
+            ORDER BY r.date
+            """,
+            (department, product, start_date.isoformat(), end_date.isoformat()),
+        ).fetchall()
+
+        dates = [row[0] for row in rows]
+        return pd.DataFrame(
+            {
+                "date": pd.to_datetime(dates, format="%Y-%m-%d"),
+                "product": pd.Categorical([product] * len(rows)),
+                "value": np.array(
+                    [np.nan if row[1] is None else row[1] for row in rows],
+                    dtype="float64",
+                ),
+            }
+        )
+
+    def complete(self, unit: Unit, frames: list[pd.DataFrame]) -> None:
+        """
+        Store the rows of a unit and mark it as completed.
+
+        :param frames: DataFrames with columns [date, product, value] fetched
+            for the unit (several when the chunk was split)
+        """
+        department, product, start_date, end_date = unit
+        rows = {}
+        for df in frames:
+            for ts, value in zip(df["date"].dt.strftime("%Y-%m-%d"), df["value"]):
+                # First valid value wins, as in merge_chunk_frames
+                if rows.get(ts) is None:
+                    rows[ts] = None if pd.isna(value) else float(value)
+
+        with self.connection:
+            self.connection.execute(
+                """
+                DELETE FROM units WHERE department = ? AND product = ?
+                    AND start_date = ? AND end_date = ?
+                """,
+                (department, product, start_date.isoformat(), end_date.isoformat()),
+            )
+            cursor = self.connection.execute(
+                """
+                INSERT INTO units (department, product, start_date, end_date,
+                    num_rows, completed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    department,
+                    product,
+                    start_date.isoformat(),
+                    end_date.isoformat(),
+                    len(rows),
+                    datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+            self.connection.executemany(
+                "INSERT INTO unit_rows (unit_id, date, value) VALUES (?, ?, ?)",
+                ((cursor.lastrowid, ts, value) for ts, value in rows.items()),
+            )
+
+    def reset(self) -> None:
+        """Forget every completed unit."""
+        with self.connection:
+            self.connection.execute("DELETE FROM units")
+        self.logger.info("Checkpoint %s reset", self.path)
+
+    def close(self) -> None:
+        self.connection.close()
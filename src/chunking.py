@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from datetime import date
+import logging
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkReport:
+    """Completeness report of a single date-range chunk query."""
+
+    def __init__(
+        self,
+        department: str,
+        product: str,
+        start_date: date,
+        end_date: date,
+        num_rows: int,
+        complete: bool,
+        reason: Optional[str] = None,
+    ):
+        self.department = department
+        self.product = product
+        self.start_date = start_date
+        self.end_date = end_date
+        self.num_rows = num_rows
+        self.complete = complete
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        status = "complete" if self.complete else f"reduced ({self.reason})"
+        return (
+            f"ChunkReport({self.department}|{self.product} "
+            f"{self.start_date}..{self.end_date}: {self.num_rows} rows, {status})"
+        )
+
+
+def check_chunk(
+    department: str,
+    product: str,
+    start_date: date,
+    end_date: date,
+    num_rows: int,
+    service_complete: bool,
+    point_limit: int,
+) -> ChunkReport:
+    """
+    Report whether a chunk came back complete or reduced by the service.
+
+    A chunk is considered reduced when the service flags the result as
+    incomplete, or when the number of points reaches the data reduction limit.
+
+    :param end_date: Exclusive end date of the chunk
+    :param num_rows: Number of points returned for the chunk
+    :param service_complete: Completeness flag returned by the service
+    :param point_limit: Number of points at which the service starts sampling
+    """
+    reason = None
+    if not service_complete:
+        reason = "service flagged result as incomplete"
+    elif num_rows >= point_limit:
+        reason = f"{num_rows} points reached the reduction limit of {point_limit}"
+
+    return ChunkReport(
+        department=department,
+        product=product,
+        start_date=start_date,
+        end_date=end_date,
+        num_rows=num_rows,
+        complete=reason is None,
+        reason=reason,
+    )
+
+
+def merge_chunk_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Merge the DataFrames of several chunks into a single daily series.
+
+    Rows are de-duplicated by (product, date), keeping the first valid value
+    in `frames` order, and sorted by date.
+
+    :param frames: DataFrames with columns [date, product, value]
+    :return: merged DataFrame
+    """
+    import pandas as pd
+
+    df = pd.concat(frames, ignore_index=True)
+    df["product"] = df["product"].astype("category")
+
+    # Stable sort keeps frames order among rows with the same key and validity
+    df = df.assign(_missing=df["value"].isna()).sort_values(
+        ["date", "product", "_missing"], kind="stable"
+    )
+    df = df.drop_duplicates(subset=["product", "date"], keep="first")
+
+    return df.drop(columns="_missing").reset_index(drop=True)
+
+
+def merge_chunk_rows(chunks: list[list[dict]]) -> list[dict]:
+    """
+    merge_chunk_frames() for rows, without pandas.
+
+    :param chunks: Rows of several chunks, as DailySeriesParser.parse()
+    :return: merged rows, in format [{'date', 'product', 'value'}]
+    """
+    merged: dict[tuple, dict] = {}
+    for rows in chunks:
+        for row in rows:
+            key = (row["product"], row["date"])
+            kept = merged.get(key)
+            if kept is None or (kept["value"] is None and row["value"] is not None):
+                merged[key] = row
+
+    return [merged[key] for key in sorted(merged, key=lambda key: (key[1], key[0]))]
@@ -1,12 +1,77 @@
-CLUSTER = "https://wabi-south-central-us-redirect.analysis.windows.net"
+import os
+
+# PowerBI endpoints. GEP_CLUSTER_URL, GEP_QES_ENDPOINT and GEP_AUTH_API_ROUTE
+# override them, e.g. to run against benchmarks/stand_in_server.py
+CLUSTER = os.environ.get(
+    "GEP_CLUSTER_URL", "https://wabi-south-central-us-redirect.analysis.windows.net"
+)
 REPORT_ID = "36f8f9aa-cf5a-4bd2-b09f-87b1b06ac1eb"
 GROUP_ID = "11411183-c06e-4690-9537-67a40c1df2ca"
 DATASET_ID = "0515b379-fdb6-4d08-9010-0028e146a8ad"
 VISUAL_ID = "d56ab5ab6a1f2e4348e5"
-QES_ENDPOINT = (
+QES_ENDPOINT = os.environ.get(
+    "GEP_QES_ENDPOINT",
     "https://950ea744264a460d9034a49e3a94ca63.pbidedicated.windows.net"
     "/webapi/capacities/950EA744-264A-460D-9034-A49E3A94CA63"
-    "/workloads/QES/QueryExecutionService/automatic/public/query"
+    "/workloads/QES/QueryExecutionService/automatic/public/query",
+)
+AUTH_API_ROUTE = os.environ.get(
+    "GEP_AUTH_API_ROUTE",
+    "https://63p7r2qck2.execute-api.us-east-1.amazonaws.com/Prod/token",
 )
-AUTH_API_ROUTE = "https://63p7r2qck2.execute-api.us-east-1.amazonaws.com/Prod/token"
 TOKEN_URL = f"{AUTH_API_ROUTE}/{GROUP_ID}/{REPORT_ID}"
+
+# Concurrent QES execution: max in-flight queries and requests per second
+# sent to the pbidedicated capacity endpoint
+QES_MAX_CONCURRENCY = 4
+QES_RATE_LIMIT_PER_SECOND = 5.0
+
+# Long date ranges are split in chunks of at most CHUNK_MAX_DAYS days, so each
+# query stays under the BinnedLineSample data reduction threshold
+CHUNK_MAX_DAYS = 1000
+DATA_REDUCTION_POINT_LIMIT = 3500
+
+# Batch mode: number of department/product pairs fetched by a single
+# multi-product query (1 sends one query per pair)
+QES_BATCH_SIZE = 1
+
+# Transient HTTP failures (429, 5xx, connection errors) are retried up to
+# HTTP_MAX_RETRIES times with exponential backoff and jitter, and requests are
+# paused for CIRCUIT_RESET_SECONDS after CIRCUIT_FAILURE_THRESHOLD failures in a row
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE_SECONDS = 1.0
+HTTP_BACKOFF_MAX_SECONDS = 60.0
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30.0
+
+# Batch post-processing (fill, rollups, output writing): worker processes (0
+# runs it in the main process), and max fetched results waiting to be
+# processed, which bounds memory on long batches
+PIPELINE_WORKERS = 0
+PIPELINE_MAX_PENDING = 16
+
+# Tokens without a known expiration are assumed valid for TOKEN_DEFAULT_TTL_SECONDS,
+# and all tokens are refreshed TOKEN_REFRESH_MARGIN_SECONDS before they expire (at
+# most half of their lifetime), at most every TOKEN_REFRESH_MIN_INTERVAL_SECONDS in
+# the background
+TOKEN_DEFAULT_TTL_SECONDS = 3600
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+TOKEN_REFRESH_MIN_INTERVAL_SECONDS = 30
+
+# Local QES response cache. Responses of closed months never expire
+CACHE_TTL_SECONDS = 24 * 3600
+CACHE_MAX_MB = 1024
+
+# Incremental mode: state files directory, and number of last extracted days
+# queried again to pick up values published late
+INCREMENTAL_STATE_DIR = ".extraction_state"
+INCREMENTAL_OVERLAP_DAYS = 1
+
+# Catalog of the available departments and products: local index file, and
+# seconds before it is fetched again
+CATALOG_INDEX_PATH = ".catalog.json"
+CATALOG_TTL_SECONDS = 7 * 24 * 3600
+
+# Server mode (--serve): default address of the extraction HTTP server
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
@@ -1,22 +1,204 @@
-import pandas as pd
-from datetime import date
+from __future__ import annotations
+
+from contextlib import contextmanager
+import csv
+from datetime import date, datetime
+import gzip
+import io
 import logging
+import os
 import re
+import secrets
+from typing import IO, TYPE_CHECKING, Iterator
 import unicodedata
 
+import numpy as np
+
+from src import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+REFERENCE_HEADER = ("Referencia", "Data", "Valor")
+CSV_COMPRESSIONS = ("gzip", "zstd")
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class CompressionUnavailableError(RuntimeError):
+    """Raised when the module of a compression is not installed."""
+
+    pass
+
+
+def compression_from_path(path: str) -> str | None:
+    """
+    :return: Compression of a file named with a COMPRESSION_SUFFIXES suffix,
+        None otherwise
+    """
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def check_compression(compression: str | None) -> None:
+    """
+    :param compression: None, or one of CSV_COMPRESSIONS
+    :raises ValueError: for an unknown compression
+    :raises CompressionUnavailableError: if its module is not installed
+    """
+    if compression is not None and compression not in CSV_COMPRESSIONS:
+        raise ValueError(
+            f"Unknown compression '{compression}'. "
+            f"Expected one of {CSV_COMPRESSIONS}"
+        )
+    if compression == "zstd":
+        _zstandard()
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise CompressionUnavailableError(
+            "zstd compression requires the zstandard package (pip install zstandard)"
+        ) from exc
+    return zstandard
+
+
+@contextmanager
+def open_reference_output(
+    output_path: str, compression: str | None = None
+) -> Iterator[IO[str]]:
+    """
+    Open a text file to write, atomically: the text goes to a temporary file
+    next to `output_path`, renamed over it once closed without error.
+
+    :param compression: None, or one of CSV_COMPRESSIONS
+    """
+    check_compression(compression)
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    # Unlike mkstemp (0600), the file gets the permissions open() would: the
+    # kernel applies the umask to 0666
+    tmp_path = os.path.join(directory, f".{secrets.token_hex(8)}.tmp")
+    fd = os.open(
+        tmp_path,
+        os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0),
+        0o666,
+    )
+    try:
+        with open(fd, "wb", buffering=WRITE_BUFFER_SIZE) as raw:
+            if compression == "gzip":
+                # mtime=0: the same rows give the same bytes
+                stream = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0)
+            elif compression == "zstd":
+                stream = _zstandard().ZstdCompressor().stream_writer(raw, closefd=False)
+            else:
+                stream = raw
+            with io.TextIOWrapper(stream, encoding="utf-8", newline="") as f:
+                yield f
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def open_reference_input(input_path: str) -> IO[str]:
+    """
+    Open a reference CSV file to read, decompressing it after its suffix.
+    """
+    compression = compression_from_path(input_path)
+    if compression == "gzip":
+        return gzip.open(input_path, "rt", newline="", encoding="utf-8")
+    if compression == "zstd":
+        stream = _zstandard().ZstdDecompressor().stream_reader(open(input_path, "rb"))
+        return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    return open(input_path, newline="", encoding="utf-8")
+
+
+@contextmanager
+def _reference_writer(output: str | IO[str], compression: str | None) -> Iterator:
+    # Same dialect as DataFrame.to_csv
+    if isinstance(output, str):
+        with open_reference_output(output, compression) as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(REFERENCE_HEADER)
+            yield writer
+    else:
+        writer = csv.writer(output, lineterminator=os.linesep)
+        writer.writerow(REFERENCE_HEADER)
+        yield writer
+
+
+def format_reference_dates(dates: pd.Series) -> list[str]:
+    """
+    Format dates as DD/MM/YYYY, '' for NaT.
+
+    A series has few distinct days compared to its rows (one per day, repeated
+    per product in batches), so each distinct day is formatted once and the
+    rows index the formatted days.
+    """
+    import pandas as pd
+
+    days = pd.to_datetime(dates).to_numpy(dtype="datetime64[D]")
+    unique, inverse = np.unique(days, return_inverse=True)
+    labels = np.array(
+        ["" if day is None else day.strftime("%d/%m/%Y") for day in unique.tolist()],
+        dtype=object,
+    )
+    return labels[inverse].tolist()
+
+
+def format_reference_labels(labels: pd.Series) -> list[str]:
+    """
+    Format a (usually categorical) column as str, '' for missing values: each
+    distinct label is converted once.
+    """
+    import pandas as pd
+
+    categorical = pd.Categorical(labels)
+    # code -1 (missing) picks the trailing ''
+    names = np.array([str(c) for c in categorical.categories] + [""], dtype=object)
+    return names[categorical.codes].tolist()
+
+
+def format_reference_values(values: pd.Series) -> list[str] | None:
+    """
+    Format a value column as DataFrame.to_csv does.
+
+    :return: Formatted values, or None for a dtype other than float64, integer
+        or bool
+    """
+    dtype = values.dtype
+    if dtype == np.float64:
+        return [
+            "" if value != value else repr(value)
+            for value in values.to_numpy().tolist()
+        ]
+    if isinstance(dtype, np.dtype) and dtype.kind in "iub":
+        return [str(value) for value in values.to_numpy().tolist()]
+    return None
+
 
 def write_reference_csv(
     df: pd.DataFrame,
-    output_path: str,
+    output_path: str | IO[str],
     logger: logging.Logger | None = None,
+    compression: str | None = None,
 ) -> None:
     """
     Write a CSV file in the format:
     Referencia, Data, Valor
 
+    Rows are streamed from the columns, formatted without intermediate
+    DataFrames. A file is written atomically.
+
     :param df: DataFrame with columns [product, date, value]
-    :param output_path: Path to the output CSV file
+    :param output_path: Path to the output CSV file, or a text stream
     :param logger: Optional logger
+    :param compression: None, or one of CSV_COMPRESSIONS (path only)
     """
     if logger:
         logger.info("Writing CSV to %s", output_path)
@@ -26,6 +208,32 @@ def write_reference_csv(
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
 
+    with metrics.span("write.csv", rows=len(df)):
+        values = format_reference_values(df["value"])
+        if values is None:
+            _write_reference_frame(df, output_path, compression)
+        else:
+            with _reference_writer(output_path, compression) as writer:
+                writer.writerows(
+                    zip(
+                        format_reference_labels(df["product"]),
+                        format_reference_dates(df["date"]),
+                        values,
+                    )
+                )
+    metrics.increment("write.rows", len(df))
+
+    if logger:
+        logger.info("CSV successfully written (%d rows)", len(df))
+
+
+def _write_reference_frame(
+    df: pd.DataFrame, output_path: str | IO[str], compression: str | None
+) -> None:
+    # DataFrame.to_csv, for value dtypes format_reference_values() does not
+    # handle
+    import pandas as pd
+
     output_df = (
         df.rename(
             columns={
@@ -35,18 +243,87 @@ def write_reference_csv(
             }
         )
         .assign(Data=lambda x: pd.to_datetime(x["Data"]).dt.strftime("%d/%m/%Y"))
-        .loc[:, ["Referencia", "Data", "Valor"]]
+        .loc[:, list(REFERENCE_HEADER)]
     )
 
-    output_df.to_csv(
-        output_path,
-        index=False,
-        encoding="utf-8",
-        sep=",",
-    )
+    if not isinstance(output_path, str):
+        output_df.to_csv(output_path, index=False, sep=",")
+        return
+    with open_reference_output(output_path, compression) as f:
+        output_df.to_csv(f, index=False, sep=",")
+
+
+def write_reference_rows(
+    rows: list[dict],
+    output_path: str,
+    logger: logging.Logger | None = None,
+    compression: str | None = None,
+) -> None:
+    """
+    write_reference_csv() for rows, without pandas.
+
+    The file is byte for byte the one write_reference_csv() writes for the
+    DataFrame of the same rows.
+
+    :param rows: list of dicts in format [{'date', 'product', 'value'}]
+    :param output_path: Path to the output CSV file
+    :param logger: Optional logger
+    :param compression: None, or one of CSV_COMPRESSIONS
+    """
+    if logger:
+        logger.info("Writing CSV to %s", output_path)
+
+    with metrics.span("write.csv", rows=len(rows)), _reference_writer(
+        output_path, compression
+    ) as writer:
+        writer.writerows(
+            (
+                row["product"],
+                row["date"].strftime("%d/%m/%Y"),
+                format_reference_value(row["value"]),
+            )
+            for row in rows
+        )
+    metrics.increment("write.rows", len(rows))
 
     if logger:
-        logger.info("CSV successfully written (%d rows)", len(output_df))
+        logger.info("CSV successfully written (%d rows)", len(rows))
+
+
+def format_reference_value(value) -> str:
+    """
+    Format a value as DataFrame.to_csv does for a float64 column: shortest
+    repr, and an empty string for missing or non numeric values.
+    """
+    if value is None:
+        return ""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return ""
+    return "" if value != value else repr(value)
+
+
+def read_reference_csv(input_path: str) -> list[dict]:
+    """
+    Read back a CSV file written by write_reference_csv.
+
+    :param input_path: Path to the CSV file, compressed after its suffix
+    :return: list of dicts in format [{'date', 'product', 'value'}]
+    """
+    rows = []
+    with open_reference_input(input_path) as f:
+        for record in csv.DictReader(f):
+            value = record["Valor"]
+            rows.append(
+                {
+                    "date": datetime.strptime(record["Data"], "%d/%m/%Y").date(),
+                    "product": record["Referencia"],
+                    "value": float(value) if value != "" else None,
+                }
+            )
+
+    return rows
 
 
 def normalize_filename_part(value: str) -> str:
@@ -1,4 +1,4 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 
 def parse_yyyymmdd(value: str) -> date:
@@ -13,3 +13,27 @@ def parse_yyyymmdd(value: str) -> date:
         return datetime.strptime(value, "%Y%m%d").date()
     except ValueError as exc:
         raise ValueError(f"Invalid date '{value}'. Expected format: YYYYmmdd") from exc
+
+
+def split_date_range(
+    start_date: date, end_date: date, max_days: int
+) -> list[tuple[date, date]]:
+    """
+    Split the [start_date, end_date) range into consecutive chunks.
+
+    :param start_date: Start date, inclusive
+    :param end_date: End date, exclusive
+    :param max_days: Max number of days in each chunk. 0 or less disables chunking
+    :return: list of (chunk_start, chunk_end) tuples, end exclusive
+    """
+    if max_days <= 0 or (end_date - start_date).days <= max_days:
+        return [(start_date, end_date)]
+
+    chunks = []
+    chunk_start = start_date
+    while chunk_start < end_date:
+        chunk_end = min(chunk_start + timedelta(days=max_days), end_date)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+
+    return chunks
@@ -0,0 +1,265 @@
+import logging
+import re
+from typing import Iterable, Iterator, Optional
+
+# Keys holding values in DSR rows: G<n> for groups, M<n> for measures,
+# A<n> for aggregates
+VALUE_KEY_PATTERN = re.compile(r"^[GMA]\d+$")
+DATA_MEMBER_PATTERN = re.compile(r"^DM\d+$")
+
+SCHEMA_KEY = "S"
+COMPRESSED_KEY = "C"
+REPEAT_BITMASK_KEY = "R"
+NULL_BITMASK_KEY = "Ø"
+SECONDARY_CELLS_KEY = "X"
+SECONDARY_INDEX_KEY = "I"
+CHILDREN_KEY = "M"
+
+
+class ColumnTable:
+    """
+    Columnar table whose columns may appear at any row.
+
+    Columns that first appear after some rows, or that are missing in a row,
+    are padded with None so all columns always have the same length.
+    """
+
+    def __init__(self):
+        self.columns: dict[str, list] = {}
+        self.num_rows = 0
+
+    def append(self, values: dict) -> None:
+        for name in values:
+            if name not in self.columns:
+                self.columns[name] = [None] * self.num_rows
+
+        for name, column in self.columns.items():
+            column.append(values.get(name))
+
+        self.num_rows += 1
+
+    def column(self, name: str) -> list:
+        return self.columns.get(name, [None] * self.num_rows)
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+
+class DataShape:
+    """
+    Decoded DSR data set.
+
+    :ivar primary: One row per leaf of the primary hierarchy (e.g. one per date)
+    :ivar members: One row per member of the secondary hierarchy (e.g. one per
+        product). Empty when the query has no secondary grouping
+    :ivar cells: One row per (primary row, secondary member) intersection, with
+        the '_row' and '_member' index columns and the measures of the cell
+    :ivar is_complete: False when the service reduced or windowed the result
+    :ivar restart_tokens: Continuation tokens returned with a partial result
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.primary = ColumnTable()
+        self.members = ColumnTable()
+        self.cells = ColumnTable()
+        self.is_complete = True
+        self.restart_tokens: list = []
+
+
+class RowExpander:
+    """
+    Expand compressed DSR rows of one data member into plain value dicts.
+
+    The schema (S) of a data member is given in its first row and kept for the
+    following ones. Each row may then carry:
+    - C: the values of the non repeated, non null columns, in schema order
+    - R: a bitmask of columns repeating the value of the previous row
+    - Ø: a bitmask of null columns
+    Columns with a dictionary name (DN) hold indexes into the ValueDicts.
+    """
+
+    def __init__(self, value_dicts: dict):
+        self.value_dicts = value_dicts
+        self.schema: list[dict] = []
+
+    def expand(self, row: dict, previous: dict) -> dict:
+        """
+        Expand a single row.
+
+        :param previous: Decoded values of the previous row, used by the repeat
+            bitmask. It is updated in place with the values of this row
+        """
+        if SCHEMA_KEY in row:
+            self.schema = row[SCHEMA_KEY]
+
+        repeat = row.get(REPEAT_BITMASK_KEY, 0)
+        nulls = row.get(NULL_BITMASK_KEY, 0)
+        compressed = row.get(COMPRESSED_KEY)
+        compressed_values = iter(compressed or [])
+
+        values = {}
+        for i, column in enumerate(self.schema):
+            name = column["N"]
+            bit = 1 << i
+
+            if repeat & bit:
+                values[name] = previous.get(name)
+                continue
+            if nulls & bit:
+                values[name] = None
+                continue
+
+            if compressed is not None:
+                value = next(compressed_values, None)
+            else:
+                value = row.get(name)
+
+            dict_name = column.get("DN")
+            if dict_name is not None and isinstance(value, int):
+                value = self.value_dicts[dict_name][value]
+
+            values[name] = value
+
+        # Values given by name but absent from the schema
+        for name, value in row.items():
+            if name not in values and VALUE_KEY_PATTERN.match(name):
+                values[name] = value
+
+        previous.update(values)
+        return values
+
+
+class DsrDecoder:
+    """
+    Decode the DSR (data shape result) of QES responses into columnar tables.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def decode(self, response: dict) -> list[DataShape]:
+        """
+        Decode every data set of every result in a QES response.
+
+        :param response: QES response
+        :return: list of DataShape, in response order
+        """
+        shapes = []
+        for result in response.get("results", []):
+            dsr = result["result"]["data"]["dsr"]
+            for ds in dsr.get("DS", []):
+                shapes.append(self.decode_data_set(ds))
+
+        return shapes
+
+    def decode_data_set(self, ds: dict) -> DataShape:
+        shape = DataShape(ds.get("N", ""))
+        value_dicts = ds.get("ValueDicts", {})
+
+        shape.is_complete = bool(ds.get("IC", True))
+        shape.restart_tokens = ds.get("RT") or []
+
+        for member in self.iter_hierarchy(ds.get("SH", []), value_dicts):
+            shape.members.append(member)
+
+        cell_expander = RowExpander(value_dicts)
+        previous_cells: dict[int, dict] = {}
+
+        # Secondary cells (X) are carried along each primary row, and
+        # separated from it here
+        primary = self.iter_hierarchy(ds.get("PH", []), value_dicts, keep_cells=True)
+        for row in primary:
+            cells = row.pop(SECONDARY_CELLS_KEY, None)
+            row_index = shape.primary.num_rows
+            shape.primary.append(row)
+            self._append_cells(shape, row_index, cells, cell_expander, previous_cells)
+
+        return shape
+
+    def iter_hierarchy(
+        self,
+        hierarchy: list[dict],
+        value_dicts: dict,
+        parent: Optional[dict] = None,
+        keep_cells: bool = False,
+    ) -> Iterator[dict]:
+        """
+        Yield the expanded leaf rows of a (possibly nested) hierarchy.
+
+        Child rows (M) inherit the values of their parent row.
+        """
+        for level in hierarchy:
+            for key, rows in level.items():
+                if not DATA_MEMBER_PATTERN.match(key):
+                    continue
+                yield from self.iter_rows(rows, value_dicts, parent or {}, keep_cells)
+
+    def iter_rows(
+        self,
+        rows: Iterable[dict],
+        value_dicts: dict,
+        parent: dict,
+        keep_cells: bool,
+    ) -> Iterator[dict]:
+        """
+        Yield the expanded leaf rows of a DM<n> row list and their children.
+
+        :param keep_cells: Keep the secondary cells (X) of the leaf rows
+        """
+        expander = RowExpander(value_dicts)
+        previous: dict = {}
+
+        for row in rows:
+            values = {**parent, **expander.expand(row, previous)}
+
+            children = row.get(CHILDREN_KEY)
+            if children:
+                yield from self.iter_hierarchy(children, value_dicts, values, keep_cells)
+                continue
+
+            if keep_cells and SECONDARY_CELLS_KEY in row:
+                values[SECONDARY_CELLS_KEY] = row[SECONDARY_CELLS_KEY]
+            yield values
+
+    def _append_cells(
+        self,
+        shape: DataShape,
+        row_index: int,
+        cells: Optional[list[dict]],
+        expander: RowExpander,
+        previous_cells: dict[int, dict],
+    ) -> None:
+        """
+        Decode the secondary cells (X) of a primary row.
+
+        Each cell belongs to the secondary member given by its I index, or to
+        the member following the previous cell when I is absent.
+        """
+        if not cells:
+            return
+
+        member = -1
+        for cell in cells:
+            member = cell.get(SECONDARY_INDEX_KEY, member + 1)
+            previous = previous_cells.setdefault(member, {})
+
+            values = expander.expand(cell, previous)
+            shape.cells.append({"_row": row_index, "_member": member, **values})
+
+
+def descriptor_names(response: dict) -> dict[str, str]:
+    """
+    Map DSR value keys (G0, M0, ...) to the query names given in the descriptor.
+
+    :param response: QES response
+    :return: e.g. {'G0': 'Calendario.Fecha', 'M0': 'Sum(Precios reuters diarios.PRECIO)'}
+    """
+    names = {}
+    for result in response.get("results", []):
+        descriptor = result["result"]["data"].get("descriptor", {})
+        for select in descriptor.get("Select", []):
+            if "Value" in select and "Name" in select:
+                names[select["Value"]] = select["Name"]
+
+    return names
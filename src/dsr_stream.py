@@ -0,0 +1,169 @@
+import logging
+import re
+from typing import IO, Iterator
+
+import ijson
+
+from src.dsr_decoder import (
+    CHILDREN_KEY,
+    SECONDARY_CELLS_KEY,
+    SECONDARY_INDEX_KEY,
+    DsrDecoder,
+    RowExpander,
+)
+
+DS_PREFIX = "results.item.result.data.dsr.DS.item"
+PRIMARY_ROWS_PREFIX = re.compile(re.escape(DS_PREFIX) + r"\.PH\.item\.DM\d+$")
+PRIMARY_ROW_PREFIX = re.compile(re.escape(DS_PREFIX) + r"\.PH\.item\.DM\d+\.item$")
+MEMBER_ROWS_PREFIX = re.compile(re.escape(DS_PREFIX) + r"\.SH\.item\.DM\d+$")
+MEMBER_ROW_PREFIX = re.compile(re.escape(DS_PREFIX) + r"\.SH\.item\.DM\d+\.item$")
+VALUE_DICTS_PREFIX = DS_PREFIX + ".ValueDicts"
+RESTART_TOKENS_PREFIX = DS_PREFIX + ".RT"
+
+
+class DsrStreamReader:
+    """
+    Incrementally decode the DSR rows of a QES response body.
+
+    The body is read with an event based JSON parser, and each primary row is
+    expanded (schema, compressed values, repeat and null bitmasks) as soon as it
+    is fully read, so memory does not grow with the size of the response.
+
+    The secondary members (SH), completeness flag (IC) and restart tokens (RT)
+    usually come after the primary rows in the body: they are available in
+    `members` (one list per data set, as member indexes start again from 0 in
+    each data set), `is_complete` and `restart_tokens` once rows() is
+    exhausted.
+
+    Rows are expanded as DsrDecoder does, nested child rows (M) included, so
+    the rows are the same as the in-memory decoding of the body.
+
+    Dictionary encoded values (ValueDicts) can only be resolved when the
+    dictionaries come before the rows using them, which is not the case for
+    the daily series dates and prices.
+    """
+
+    def __init__(self, stream: IO[bytes]):
+        self.stream = stream
+        self.members: list[list[dict]] = []
+        self.is_complete = True
+        self.restart_tokens: list = []
+        self.bytes_read = 0
+        self.decoder = DsrDecoder()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def rows(self) -> Iterator[tuple[int, dict, list[tuple[int, dict]]]]:
+        """
+        Yield the primary leaf rows of every data set, in body order.
+
+        :return: Iterator over (data set index, row values,
+            [(member index, cell values)])
+        """
+        data_set = -1
+        value_dicts: dict = {}
+        row_expander = cell_expander = None
+        previous: dict = {}
+        previous_cells: dict[int, dict] = {}
+        member_rows: list[list[dict]] = []
+
+        builder = None
+        builder_prefix = None
+
+        reader = _CountingReader(self.stream, self)
+        for prefix, event, value in ijson.parse(reader, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if event in ("end_map", "end_array") and prefix == builder_prefix:
+                    row = builder.value
+                    builder = None
+
+                    if prefix == RESTART_TOKENS_PREFIX:
+                        self.restart_tokens.extend(row)
+                    elif PRIMARY_ROW_PREFIX.match(prefix):
+                        values = row_expander.expand(row, previous)
+                        if row.get(CHILDREN_KEY):
+                            # Child rows are read whole with their parent
+                            leaves = self.decoder.iter_hierarchy(
+                                row[CHILDREN_KEY], value_dicts, values, keep_cells=True
+                            )
+                        else:
+                            leaves = [
+                                {
+                                    **values,
+                                    SECONDARY_CELLS_KEY: row.get(SECONDARY_CELLS_KEY),
+                                }
+                            ]
+
+                        for leaf in leaves:
+                            cells = []
+                            member = -1
+                            for cell in leaf.pop(SECONDARY_CELLS_KEY, None) or []:
+                                member = cell.get(SECONDARY_INDEX_KEY, member + 1)
+                                cell_previous = previous_cells.setdefault(member, {})
+                                cells.append(
+                                    (member, cell_expander.expand(cell, cell_previous))
+                                )
+                            yield data_set, leaf, cells
+                    elif MEMBER_ROW_PREFIX.match(prefix):
+                        # Members are few, and usually dictionary encoded:
+                        # expand them once the ValueDicts have been read
+                        member_rows[-1].append(row)
+                    else:
+                        value_dicts.update(row)
+                continue
+
+            if event == "start_map" and prefix == DS_PREFIX:
+                # New data set: reset the decoding state
+                if data_set >= 0:
+                    self._expand_members(member_rows, value_dicts)
+                data_set += 1
+                value_dicts = {}
+                row_expander = RowExpander(value_dicts)
+                cell_expander = RowExpander(value_dicts)
+                previous, previous_cells, member_rows = {}, {}, []
+            elif event == "start_array" and PRIMARY_ROWS_PREFIX.match(prefix):
+                # Each DM<n> row list is compressed on its own
+                previous = {}
+            elif event == "start_array" and MEMBER_ROWS_PREFIX.match(prefix):
+                member_rows.append([])
+            elif (
+                event == "start_map"
+                and (
+                    PRIMARY_ROW_PREFIX.match(prefix)
+                    or MEMBER_ROW_PREFIX.match(prefix)
+                    or prefix == VALUE_DICTS_PREFIX
+                )
+            ) or (event == "start_array" and prefix == RESTART_TOKENS_PREFIX):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                builder_prefix = prefix
+            elif prefix == DS_PREFIX + ".IC" and event == "boolean":
+                self.is_complete = self.is_complete and value
+
+        if data_set >= 0:
+            self._expand_members(member_rows, value_dicts)
+        self.logger.info("Streamed %d bytes", self.bytes_read)
+
+    def _expand_members(self, member_rows: list[list[dict]], value_dicts: dict) -> None:
+        self.members.append(
+            [
+                member
+                for rows in member_rows
+                for member in self.decoder.iter_rows(
+                    rows, value_dicts, {}, keep_cells=False
+                )
+            ]
+        )
+
+
+class _CountingReader:
+    """File-like wrapper counting the bytes read from a stream."""
+
+    def __init__(self, stream: IO[bytes], owner: DsrStreamReader):
+        self.stream = stream
+        self.owner = owner
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.owner.bytes_read += len(data)
+        return data
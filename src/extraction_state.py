@@ -0,0 +1,113 @@
+from datetime import date, timedelta
+import json
+import logging
+import os
+import tempfile
+from typing import Optional
+
+from src.csv_writer import normalize_filename_part
+
+
+class ExtractionState:
+    """
+    Date range already extracted for a department/product pair.
+
+    The state is a small JSON file per pair, recording the inclusive date range
+    covered by the last run and the daily CSV holding its rows. Dates inside
+    the covered range that have no row (weekends, holidays) are known to be
+    empty, so they are never queried again.
+    """
+
+    def __init__(
+        self,
+        department: str,
+        product: str,
+        covered_start: date,
+        covered_end: date,
+        daily_csv: str,
+    ):
+        self.department = department
+        self.product = product
+        self.covered_start = covered_start
+        self.covered_end = covered_end
+        self.daily_csv = daily_csv
+
+    @staticmethod
+    def path_for(state_dir: str, department: str, product: str) -> str:
+        return os.path.join(
+            state_dir,
+            f"state_{normalize_filename_part(department)}_"
+            f"{normalize_filename_part(product)}.json",
+        )
+
+    @classmethod
+    def load(
+        cls, state_dir: str, department: str, product: str
+    ) -> Optional["ExtractionState"]:
+        """
+        Load the state of a pair, if any.
+
+        :return: ExtractionState, or None if there is no usable state
+        """
+        path = cls.path_for(state_dir, department, product)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            state = cls(
+                department=data["department"],
+                product=data["product"],
+                covered_start=date.fromisoformat(data["covered_start"]),
+                covered_end=date.fromisoformat(data["covered_end"]),
+                daily_csv=data["daily_csv"],
+            )
+        except (OSError, ValueError, KeyError):
+            logging.getLogger(cls.__name__).warning("Ignoring unreadable state %s", path)
+            return None
+
+        if not os.path.exists(state.daily_csv):
+            return None
+        return state
+
+    def save(self, state_dir: str) -> None:
+        os.makedirs(state_dir, exist_ok=True)
+        path = self.path_for(state_dir, self.department, self.product)
+
+        data = {
+            "department": self.department,
+            "product": self.product,
+            "covered_start": self.covered_start.isoformat(),
+            "covered_end": self.covered_end.isoformat(),
+            "daily_csv": os.path.abspath(self.daily_csv),
+        }
+
+        fd, tmp_path = tempfile.mkstemp(dir=state_dir, prefix=".state-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def missing_ranges(
+        self, start_date: date, end_date: date, overlap_days: int = 0
+    ) -> list[tuple[date, date]]:
+        """
+        Compute the parts of [start_date, end_date) not covered by this state.
+
+        :param end_date: Exclusive end date
+        :param overlap_days: Number of last covered days to query again, to
+            pick up values published late
+        :return: list of (start, end) ranges, end exclusive
+        """
+        covered_start = self.covered_start
+        covered_end = self.covered_end + timedelta(days=1) - timedelta(days=overlap_days)
+
+        if covered_end <= start_date or covered_start >= end_date:
+            return [(start_date, end_date)]
+
+        ranges = []
+        if start_date < covered_start:
+            ranges.append((start_date, covered_start))
+        if covered_end < end_date:
+            ranges.append((max(start_date, covered_end), end_date))
+        return ranges
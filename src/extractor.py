@@ -0,0 +1,600 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+import logging
+import threading
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional, TypeVar
+
+import requests
+
+from src.catalog import Catalog, parse_catalog
+from src.chunking import (
+    ChunkReport,
+    check_chunk,
+    merge_chunk_frames,
+    merge_chunk_rows,
+)
+from src.date_util import split_date_range
+from src.payload_factory import PayloadFactory
+from src.powerbi_client import PowerBIClient
+from src.query_executor import ConcurrentQueryExecutor, TokenBucket
+from src.response_cache import ResponseCache, is_closed_range
+from src.resilience import CircuitBreaker, RetryPolicy
+from src.response_parser import DailySeriesParser
+from src.token_manager import TokenManager
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from src.checkpoint import CheckpointStore
+
+AUTH_ERROR_STATUS_CODES = (401, 403)
+
+T = TypeVar("T")
+
+
+class SeriesExtractor:
+    """
+    Extract daily series reusing a single PowerBI session.
+
+    The EmbedToken / modelsAndExploration / MWC token handshake is done once
+    by connect() and then shared by every fetch_frame() / fetch_many() call,
+    so a batch of department/product pairs only pays for one handshake. Tokens
+    come from a TokenManager, so they may even be reused from a previous run.
+
+    With a ResponseCache, cached queries skip the network entirely, and the
+    handshake itself only happens on the first cache miss. With
+    `stream_responses`, response bodies are parsed while they are read instead
+    (streamed responses are not cached).
+
+    With a `batch_size` above 1, items sharing a date range are fetched up to
+    `batch_size` at a time with PayloadFactory.multi_series, one query per
+    batch chunk instead of one per item.
+
+    With a CheckpointStore, every completed (department, product, chunk) unit
+    is recorded with its rows, and units completed by a previous run are read
+    from the store instead of being fetched again.
+
+    With `max_pending`, at most that many chunk queries run ahead of the
+    results consumed from fetch_many(), which keeps memory bounded when the
+    caller processes results slower than they are fetched.
+
+    With `rows`, fetch_many() yields lists of row dicts instead of DataFrames,
+    parsed and merged without importing pandas at all. This lightweight mode
+    is for single product queries: it cannot be combined with
+    `stream_responses`, a `batch_size` above 1 nor a checkpoint.
+    """
+
+    def __init__(
+        self,
+        tokens: TokenManager,
+        cluster_url: str,
+        report_id: str,
+        dataset_id: str,
+        visual_id: str,
+        qes_endpoint: str,
+        max_concurrency: int = 1,
+        rate_limit: Optional[float] = None,
+        chunk_days: int = 0,
+        point_limit: int = 3500,
+        cache: Optional[ResponseCache] = None,
+        background_refresh: bool = False,
+        stream_responses: bool = False,
+        batch_size: int = 1,
+        checkpoint: Optional[CheckpointStore] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        rows: bool = False,
+        max_pending: Optional[int] = None,
+    ):
+        if rows and (stream_responses or batch_size > 1 or checkpoint is not None):
+            raise ValueError(
+                "rows cannot be combined with stream_responses, batch_size or checkpoint"
+            )
+
+        self.tokens = tokens
+        self.cluster_url = cluster_url
+        self.report_id = report_id
+        self.dataset_id = dataset_id
+        self.visual_id = visual_id
+        self.qes_endpoint = qes_endpoint
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.chunk_days = chunk_days
+        self.point_limit = point_limit
+        self.cache = cache
+        self.background_refresh = background_refresh
+        self.stream_responses = stream_responses
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rows = rows
+        self.max_pending = max_pending
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.client: Optional[PowerBIClient] = None
+        self.parser = DailySeriesParser()
+        self._connect_lock = threading.Lock()
+
+    def connect(self) -> None:
+        """
+        Run the token / modelsAndExploration handshake, once.
+
+        With `background_refresh`, tokens keep being refreshed by a background
+        thread before they expire, for long running batches.
+
+        :raises MWCTokenError: if the MWC token cannot be found
+        """
+        with self._connect_lock:
+            if self.client is not None:
+                return
+
+            client = PowerBIClient(
+                self.cluster_url,
+                self.report_id,
+                self.tokens.get_embed_token(),
+                pool_maxsize=max(10, self.max_concurrency),
+                retry_policy=self.retry_policy,
+                circuit_breaker=self.circuit_breaker,
+            )
+            self.tokens.get_mwc_token(client)
+
+            if self.background_refresh:
+                self.tokens.start_background_refresh(client)
+            self.client = client
+
+    def build_payload(
+        self,
+        department: str,
+        product: str,
+        start_date: date,
+        end_date: date,
+    ) -> bytes:
+        """
+        Build the daily series payload for a department/product pair.
+
+        :param end_date: Exclusive end date
+        :return: Serialized payload, rendered from the compiled template
+        """
+        return PayloadFactory.render_series(
+            dataset_id=self.dataset_id,
+            report_id=self.report_id,
+            visual_id=self.visual_id,
+            start_date=start_date,
+            end_date=end_date,
+            products=[product],
+            departments=[department],
+        )
+
+    def execute(self, payload: dict | bytes, immutable: bool = False) -> dict:
+        """
+        Send a payload to the QES endpoint using the shared session.
+
+        :param payload: Payload built by PayloadFactory, as a dict or serialized
+        :param immutable: The payload covers a closed date range, so its
+            response can be cached without expiration
+        :return: QES response
+        """
+        if self.cache is not None:
+            response = self.cache.get(payload)
+            if response is not None:
+                return response
+
+        response = self._with_token_retry(lambda token: self._send(token, payload))
+
+        if self.cache is not None:
+            self.cache.put(payload, response, immutable=immutable)
+        return response
+
+    def fetch_catalog(self) -> Catalog:
+        """
+        Query the distinct department/product pairs of the data set.
+
+        :return: Catalog of the pairs, not `complete` when the service returned
+            only part of them
+        """
+        payload = PayloadFactory.catalog(
+            dataset_id=self.dataset_id,
+            report_id=self.report_id,
+            visual_id=self.visual_id,
+        )
+        pairs, complete = parse_catalog(self.execute(payload))
+        if not complete:
+            self.logger.warning(
+                "Catalog query returned an incomplete result (%d pairs)", len(pairs)
+            )
+        self.logger.info("Catalog: %d department/product pairs", len(pairs))
+        return Catalog(pairs, complete=complete)
+
+    def _with_token_retry(self, send: Callable[[str], T]) -> T:
+        """
+        Call send(mwc_token), refreshing the tokens and retrying once if the
+        service rejects them with 401/403.
+        """
+        self.connect()
+
+        mwc_token = self.tokens.get_mwc_token(self.client)
+        try:
+            return send(mwc_token)
+        except requests.HTTPError as exc:
+            status = exc.response.status_code if exc.response is not None else None
+            if status not in AUTH_ERROR_STATUS_CODES:
+                raise
+
+        # The token was rejected before its expected expiration: refresh once
+        self.logger.warning("QES returned %s, refreshing tokens and retrying", status)
+        self.tokens.invalidate(mwc_token)
+        return send(self.tokens.get_mwc_token(self.client))
+
+    def _send(self, mwc_token: str, payload: dict | bytes) -> dict:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return self.client.execute_query(self.qes_endpoint, mwc_token, payload)
+
+    def _send_stream(
+        self, mwc_token: str, payload: dict | bytes, product: str
+    ) -> tuple[pd.DataFrame, bool]:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        with self.client.execute_query_stream(
+            self.qes_endpoint, mwc_token, payload
+        ) as body:
+            return self.parser.parse_stream(body, product)
+
+    def _fetch_chunk(
+        self, job: tuple[str, str, date, date]
+    ) -> tuple[pd.DataFrame | list[dict], bool]:
+        """
+        Query and parse a single (department, product, start_date, end_date) chunk.
+
+        :return: (DataFrame, or rows with `rows`, completeness flag returned by
+            the service)
+        """
+        department, product, start_date, end_date = job
+        payload = self.build_payload(department, product, start_date, end_date)
+
+        if self.stream_responses:
+            return self._with_token_retry(
+                lambda token: self._send_stream(token, payload, product)
+            )
+
+        response = self.execute(payload, immutable=is_closed_range(end_date))
+        parse = self.parser.parse if self.rows else self.parser.parse_frame
+        return parse(response, product), self.parser.is_complete(response)
+
+    def fetch_frame(
+        self,
+        department: str,
+        product: str,
+        start_date: date,
+        end_date: date,
+    ) -> pd.DataFrame:
+        """
+        Query and parse the daily series of a department/product pair.
+
+        :param end_date: Exclusive end date
+        :return: DataFrame with columns [date, product, value] (rows with `rows`)
+        """
+        df = next(self.fetch_many([(department, product, start_date, end_date)]))
+        if isinstance(df, Exception):
+            raise df
+        return df
+
+    def fetch_many(
+        self,
+        items: Iterable[tuple[str, str, date, date]],
+        chunk_reports: Optional[list[ChunkReport]] = None,
+    ) -> Iterator[pd.DataFrame | Exception]:
+        """
+        Query several (department, product, start_date, end_date) items concurrently.
+
+        Date ranges longer than `chunk_days` are split in chunks, and all chunks
+        of all items are sent through the same executor: at most
+        `max_concurrency` queries are in flight and the QES endpoint is rate
+        limited by `rate_limit` requests per second, when given. Chunks are
+        merged back in a single de-duplicated series per item.
+
+        :param chunk_reports: When given, the ChunkReport of every queried chunk
+            is appended to it
+        :return: Iterator over DataFrames with columns [date, product, value]
+            (rows with `rows`), in the same order as `items`. A failed item
+            yields its exception instead.
+        """
+        items = list(items)
+        if self.batch_size > 1:
+            yield from self._fetch_batched(items, chunk_reports)
+            return
+
+        plan = [
+            split_date_range(start_date, end_date, self.chunk_days)
+            for _, _, start_date, end_date in items
+        ]
+        jobs = [
+            (department, product, chunk_start, chunk_end)
+            for (department, product, _, _), chunks in zip(items, plan)
+            for chunk_start, chunk_end in chunks
+        ]
+
+        completed = self._completed_units(jobs)
+
+        executor = ConcurrentQueryExecutor(
+            send=self._fetch_chunk,
+            max_concurrency=self.max_concurrency,
+            max_pending=self.max_pending,
+        )
+        results = executor.map(
+            (job for job in jobs if job not in completed), return_exceptions=True
+        )
+
+        for (department, product, _, _), chunks in zip(items, plan):
+            units = [(department, product, start, end) for start, end in chunks]
+            parsed = [None if unit in completed else next(results) for unit in units]
+
+            frames = []
+            error = None
+            for unit, result in zip(units, parsed):
+                if unit in completed:
+                    frames.append(self.checkpoint.load(unit))
+                    continue
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    df, complete = result
+                    collected = self._collect_chunk(*unit, df, complete, chunk_reports)
+                except Exception as exc:
+                    error = error or exc
+                    continue
+
+                if self.checkpoint is not None:
+                    self.checkpoint.complete(unit, collected)
+                frames.extend(collected)
+
+            if error is not None:
+                yield error
+            elif len(frames) == 1:
+                yield frames[0]
+            elif self.rows:
+                yield merge_chunk_rows(frames)
+            else:
+                yield merge_chunk_frames(frames)
+
+    def _completed_units(
+        self, units: list[tuple[str, str, date, date]]
+    ) -> set[tuple[str, str, date, date]]:
+        """
+        Units of `units` already completed in the checkpoint store, if any.
+        """
+        if self.checkpoint is None:
+            return set()
+
+        completed = self.checkpoint.completed_units().intersection(units)
+        if completed:
+            self.logger.info(
+                "Checkpoint: %d of %d chunks already completed, skipping them",
+                len(completed),
+                len(units),
+            )
+        return completed
+
+    def _fetch_batch_chunk(
+        self, job: tuple[list[str], list[str], date, date]
+    ) -> tuple[dict[tuple[str, str], pd.DataFrame], bool]:
+        """
+        Query and parse a (departments, products, start_date, end_date) batch chunk.
+
+        :return: (DataFrame per (department, product) pair, completeness flag
+            returned by the service)
+        """
+        departments, products, start_date, end_date = job
+        payload = PayloadFactory.render_series(
+            dataset_id=self.dataset_id,
+            report_id=self.report_id,
+            visual_id=self.visual_id,
+            start_date=start_date,
+            end_date=end_date,
+            products=products,
+            departments=departments,
+        )
+
+        response = self.execute(payload, immutable=is_closed_range(end_date))
+        return (
+            self.parser.parse_batch(response, departments, products),
+            self.parser.is_complete(response),
+        )
+
+    def _fetch_batched(
+        self,
+        items: list[tuple[str, str, date, date]],
+        chunk_reports: Optional[list[ChunkReport]],
+    ) -> Iterator[pd.DataFrame | Exception]:
+        """
+        fetch_many() for a `batch_size` above 1.
+
+        Items with the same date range are sorted by department and product
+        and grouped in batches of `batch_size`. A batch queries every
+        combination of its departments and products, so the series count of a
+        query can exceed its item count at department boundaries. The range of
+        each batch is chunked so that series x days stays under the data
+        reduction limit. A batch chunk that still comes back reduced is
+        queried again item by item.
+        """
+        by_range: dict[tuple[date, date], list[int]] = {}
+        for index, (_, _, start_date, end_date) in enumerate(items):
+            by_range.setdefault((start_date, end_date), []).append(index)
+
+        jobs = []
+        for (start_date, end_date), indexes in by_range.items():
+            indexes.sort(key=lambda i: (items[i][0], items[i][1]))
+            for first in range(0, len(indexes), self.batch_size):
+                batch = indexes[first : first + self.batch_size]
+                departments = list(dict.fromkeys(items[i][0] for i in batch))
+                products = list(dict.fromkeys(items[i][1] for i in batch))
+
+                max_days = max(
+                    1, (self.point_limit - 1) // (len(departments) * len(products))
+                )
+                if self.chunk_days:
+                    max_days = min(max_days, self.chunk_days)
+
+                for chunk_start, chunk_end in split_date_range(
+                    start_date, end_date, max_days
+                ):
+                    jobs.append(
+                        (batch, (departments, products, chunk_start, chunk_end))
+                    )
+
+        def unit(index: int, job: tuple) -> tuple[str, str, date, date]:
+            return (items[index][0], items[index][1], job[2], job[3])
+
+        completed = self._completed_units(
+            [unit(index, job) for batch, job in jobs for index in batch]
+        )
+        pending = [
+            any(unit(index, job) not in completed for index in batch)
+            for batch, job in jobs
+        ]
+
+        self.logger.info(
+            "Fetching %d items in %d batch queries", len(items), sum(pending)
+        )
+
+        executor = ConcurrentQueryExecutor(
+            send=self._fetch_batch_chunk,
+            max_concurrency=self.max_concurrency,
+            max_pending=self.max_pending,
+        )
+        results = executor.map(
+            (job for (_, job), send in zip(jobs, pending) if send),
+            return_exceptions=True,
+        )
+
+        frames: dict[int, list[pd.DataFrame]] = {i: [] for i in range(len(items))}
+        errors: dict[int, Exception] = {}
+
+        for (batch, job), send in zip(jobs, pending):
+            for index in batch:
+                if unit(index, job) in completed:
+                    frames[index].append(self.checkpoint.load(unit(index, job)))
+            if not send:
+                continue
+
+            batch = [index for index in batch if unit(index, job) not in completed]
+            result = next(results)
+            departments, products, chunk_start, chunk_end = job
+            if isinstance(result, Exception):
+                for index in batch:
+                    errors.setdefault(index, result)
+                continue
+
+            series, service_complete = result
+            report = check_chunk(
+                department=",".join(departments),
+                product=",".join(products),
+                start_date=chunk_start,
+                end_date=chunk_end,
+                num_rows=sum(len(df) for df in series.values()),
+                service_complete=service_complete,
+                point_limit=self.point_limit,
+            )
+            if not report.complete:
+                self.logger.warning("Querying reduced batch item by item: %s", report)
+
+            for index in batch:
+                department, product = items[index][:2]
+                if report.complete:
+                    df = series[(department, product)]
+                    if chunk_reports is not None:
+                        chunk_reports.append(
+                            check_chunk(
+                                department=department,
+                                product=product,
+                                start_date=chunk_start,
+                                end_date=chunk_end,
+                                num_rows=len(df),
+                                service_complete=True,
+                                point_limit=self.point_limit,
+                            )
+                        )
+                    collected = [df]
+                else:
+                    if index in errors:
+                        continue
+                    try:
+                        df, complete = self._fetch_chunk(unit(index, job))
+                        collected = self._collect_chunk(
+                            *unit(index, job), df, complete, chunk_reports
+                        )
+                    except Exception as exc:
+                        errors[index] = exc
+                        continue
+
+                if self.checkpoint is not None:
+                    self.checkpoint.complete(unit(index, job), collected)
+                frames[index].extend(collected)
+
+        for index in range(len(items)):
+            if index in errors:
+                yield errors[index]
+            elif len(frames[index]) == 1:
+                yield frames[index][0]
+            else:
+                yield merge_chunk_frames(frames[index])
+
+    def _collect_chunk(
+        self,
+        department: str,
+        product: str,
+        start_date: date,
+        end_date: date,
+        df: pd.DataFrame,
+        service_complete: bool,
+        chunk_reports: Optional[list[ChunkReport]] = None,
+    ) -> list[pd.DataFrame]:
+        """
+        Check if a parsed chunk came back complete.
+
+        A reduced chunk is split in halves and queried again, until each part
+        is complete or a single day long.
+
+        :param chunk_reports: See fetch_many()
+        :return: list of DataFrames, one per (sub) chunk
+        """
+        report = check_chunk(
+            department=department,
+            product=product,
+            start_date=start_date,
+            end_date=end_date,
+            num_rows=len(df),
+            service_complete=service_complete,
+            point_limit=self.point_limit,
+        )
+
+        days = (end_date - start_date).days
+        if report.complete or days <= 1:
+            if not report.complete:
+                self.logger.warning("Chunk still reduced: %s", report)
+            if chunk_reports is not None:
+                chunk_reports.append(report)
+            return [df]
+
+        self.logger.warning("Splitting reduced chunk: %s", report)
+        middle = start_date + timedelta(days=days // 2)
+
+        collected = []
+        for part_start, part_end in ((start_date, middle), (middle, end_date)):
+            part_df, part_complete = self._fetch_chunk(
+                (department, product, part_start, part_end)
+            )
+            collected.extend(
+                self._collect_chunk(
+                    department,
+                    product,
+                    part_start,
+                    part_end,
+                    part_df,
+                    part_complete,
+                    chunk_reports,
+                )
+            )
+        return collected
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FILL_METHODS = ("ffill", "bfill", "linear")
+FILL_GRIDS = ("none", "business", "calendar")
+
+
+class FillReport:
+    """Counts of a FillEngine.fill() call."""
+
+    def __init__(self, rows_added: int, values_filled: int, values_missing: int):
+        self.rows_added = rows_added
+        self.values_filled = values_filled
+        self.values_missing = values_missing
+
+    def __repr__(self) -> str:
+        return (
+            f"FillReport({self.rows_added} days added, {self.values_filled} "
+            f"values filled, {self.values_missing} still missing)"
+        )
+
+
+class FillEngine:
+    """
+    Fill missing values of [date, product, value] series, per product.
+
+    With a 'business' or 'calendar' grid, each product is first reindexed to
+    every business day (Monday to Friday) or every day between its first and
+    last date, so days missing altogether are filled too. Rows already present
+    are always kept, even outside the grid (e.g. a value on a Saturday).
+
+    Filling never crosses products:
+    - ffill: previous valid value
+    - bfill: next valid value
+    - linear: linear interpolation on the day number between the surrounding
+      valid values (leading and trailing gaps are left missing)
+
+    With `max_gap`, runs of more than `max_gap` consecutive missing rows are
+    left missing entirely.
+
+    The whole frame is processed at once with NumPy arrays and grouped
+    operations, without per product copies.
+    """
+
+    def __init__(
+        self,
+        method: str = "ffill",
+        grid: str = "none",
+        max_gap: Optional[int] = None,
+    ):
+        if method not in FILL_METHODS:
+            raise ValueError(
+                f"Unknown fill method '{method}'. Expected one of {FILL_METHODS}"
+            )
+        if grid not in FILL_GRIDS:
+            raise ValueError(
+                f"Unknown fill grid '{grid}'. Expected one of {FILL_GRIDS}"
+            )
+        if max_gap is not None and max_gap < 1:
+            raise ValueError("max_gap must be at least 1")
+
+        self.method = method
+        self.grid = grid
+        self.max_gap = max_gap
+
+    def fill(self, df: pd.DataFrame) -> tuple[pd.DataFrame, FillReport]:
+        """
+        :param df: DataFrame with columns [date, product, value]
+        :return: (filled DataFrame with columns [date, product, value], report).
+            Without a grid, rows keep their order; with a grid, rows are sorted
+            by product and date
+        """
+        import pandas as pd
+
+        product = df["product"]
+        if not isinstance(product.dtype, pd.CategoricalDtype):
+            product = product.astype("category")
+        categories = product.cat.categories
+        codes = product.cat.codes.to_numpy(dtype="int64")
+        days = (
+            pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]").astype("int64")
+        )
+        values = df["value"].to_numpy(dtype="float64", na_value=np.nan)
+
+        order = np.lexsort((days, codes))
+        codes, days, values = codes[order], days[order], values[order]
+
+        if self.grid == "none":
+            present = np.ones(len(days), dtype=bool)
+        else:
+            codes, days, values, present = self._reindex(codes, days, values)
+
+        filled = self._fill(codes, days, values)
+
+        report = FillReport(
+            rows_added=int((~present).sum()),
+            values_filled=int((np.isnan(values) & ~np.isnan(filled)).sum()),
+            values_missing=int(np.isnan(filled).sum()),
+        )
+
+        if self.grid == "none":
+            # Back to the original row order
+            restored = np.empty_like(filled)
+            restored[order] = filled
+            return df.assign(value=restored), report
+
+        result = pd.DataFrame(
+            {
+                "date": days.astype("datetime64[D]").astype("datetime64[ns]"),
+                "product": pd.Categorical.from_codes(codes, categories=categories),
+                "value": filled,
+            }
+        )
+        return result, report
+
+    def _reindex(
+        self, codes: np.ndarray, days: np.ndarray, values: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Lay out sorted rows on a full day grid per product.
+
+        :return: (codes, days, values, present) of the grid rows, where
+            present flags the rows of the input
+        """
+        if len(days) == 0:
+            return codes, days, values, np.ones(0, dtype=bool)
+
+        # First row of each product run
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)] - 1
+        first_day = days[starts]
+        lengths = days[ends] - first_day + 1
+
+        # Calendar grid of every product, concatenated
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+        total = int(lengths.sum())
+        grid_codes = np.repeat(codes[starts], lengths)
+        grid_days = (
+            np.arange(total)
+            - np.repeat(offsets, lengths)
+            + np.repeat(first_day, lengths)
+        )
+
+        run = np.repeat(np.arange(len(starts)), ends - starts + 1)
+        positions = offsets[run] + days - first_day[run]
+
+        grid_values = np.full(total, np.nan)
+        grid_values[positions] = values
+        present = np.zeros(total, dtype=bool)
+        present[positions] = True
+
+        if self.grid == "business":
+            keep = present | np.is_busday(grid_days.astype("datetime64[D]"))
+            grid_codes = grid_codes[keep]
+            grid_days = grid_days[keep]
+            grid_values = grid_values[keep]
+            present = present[keep]
+
+        return grid_codes, grid_days, grid_values, present
+
+    def _fill(
+        self, codes: np.ndarray, days: np.ndarray, values: np.ndarray
+    ) -> np.ndarray:
+        """Fill sorted rows within each product."""
+        import pandas as pd
+
+        missing = np.isnan(values)
+        if not missing.any():
+            return values
+
+        index = np.arange(len(values), dtype="float64")
+        valid_index = pd.Series(np.where(missing, np.nan, index))
+        groups = pd.Series(codes)
+
+        grouped = valid_index.groupby(groups)
+        filled = values.copy()
+
+        if self.method == "linear":
+            previous = grouped.ffill().to_numpy()
+            following = grouped.bfill().to_numpy()
+            fillable = missing & ~np.isnan(previous) & ~np.isnan(following)
+            left = previous[fillable].astype("int64")
+            right = following[fillable].astype("int64")
+            weight = (days[fillable] - days[left]) / (days[right] - days[left])
+            filled[fillable] = values[left] + (values[right] - values[left]) * weight
+        else:
+            source = (
+                grouped.ffill() if self.method == "ffill" else grouped.bfill()
+            ).to_numpy()
+            fillable = missing & ~np.isnan(source)
+            filled[fillable] = values[source[fillable].astype("int64")]
+
+        if self.max_gap is not None:
+            # Length of the run of consecutive missing rows of each row
+            boundary = np.r_[
+                True, (missing[1:] != missing[:-1]) | (codes[1:] != codes[:-1])
+            ]
+            run_id = np.cumsum(boundary) - 1
+            run_length = np.bincount(run_id)[run_id]
+            too_long = missing & (run_length > self.max_gap)
+            filled[too_long] = np.nan
+
+        return filled
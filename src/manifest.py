@@ -0,0 +1,69 @@
+import csv
+
+PAIR_SEPARATOR = "|"
+MANIFEST_COLUMNS = ("department", "product")
+
+
+def parse_pair(value: str) -> tuple[str, str]:
+    """
+    Parse a department/product pair given in the command line.
+
+    :param value: Pair in 'department|product' format (e.g. 'Nacional|Azúcar Blanco')
+    :return: (department, product) tuple
+    :raises ValueError: if the format is invalid
+    """
+    department, sep, product = value.partition(PAIR_SEPARATOR)
+    department = department.strip()
+    product = product.strip()
+
+    if not sep or not department or not product:
+        raise ValueError(
+            f"Invalid pair '{value}'. Expected format: department{PAIR_SEPARATOR}product"
+        )
+
+    return department, product
+
+
+def write_manifest(path: str, pairs: list[tuple[str, str]]) -> None:
+    """
+    Write department/product pairs to a CSV manifest file, readable by
+    load_manifest().
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(MANIFEST_COLUMNS)
+        writer.writerows(pairs)
+
+
+def load_manifest(path: str) -> list[tuple[str, str]]:
+    """
+    Load department/product pairs from a CSV manifest file.
+
+    The file must have a header with 'department' and 'product' columns.
+    Blank rows are ignored and duplicated pairs are kept only once.
+
+    :param path: Path to the manifest file
+    :return: list of (department, product) tuples, in file order
+    :raises ValueError: if required columns are missing
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+
+        missing = set(MANIFEST_COLUMNS) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"Manifest {path} is missing required columns: {missing}")
+
+        pairs = []
+        for row in reader:
+            department = (row["department"] or "").strip()
+            product = (row["product"] or "").strip()
+            if not department and not product:
+                continue
+            if not department or not product:
+                raise ValueError(
+                    f"Manifest {path} line {reader.line_num}: "
+                    "department and product are required"
+                )
+            pairs.append((department, product))
+
+    return list(dict.fromkeys(pairs))
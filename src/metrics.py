@@ -0,0 +1,316 @@
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Iterator, Optional
+
+METRICS_FORMATS = ("jsonl", "prometheus")
+PROMETHEUS_PREFIX = "gep"
+
+
+class TimerStats:
+    """Count, total and max duration of a stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 6),
+            "max_seconds": round(self.max, 6),
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe stage timers and counters of a run.
+
+    Stages are timed with span(), used as a context manager: each span is
+    recorded as an event with its attributes (rows, bytes, ...) and added to
+    the timer of its name. Counters (bytes received, retries, ...) are
+    incremented with increment().
+
+    The registry can be exported as JSON lines (one line per span event, then
+    one per timer and counter) or as a Prometheus text file, e.g. for the
+    node_exporter textfile collector.
+    """
+
+    def __init__(self, max_events: int = 100_000):
+        """
+        :param max_events: Number of span events kept for the JSON lines
+            export. Timers keep counting past it
+        """
+        self.max_events = max_events
+        self.timers: dict[str, TimerStats] = {}
+        self.counters: dict[str, float] = {}
+        self.events: list[dict] = []
+        self.dropped_events = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[dict]:
+        """
+        Time a stage.
+
+        Usage::
+
+            with metrics.span("parse.frame", product=product) as span:
+                ...
+                span["rows"] = len(df)
+
+        :param name: Stage name, e.g. 'qes.execute'
+        :param attributes: Attributes of the event. More can be set on the
+            yielded dict while the span is open
+        """
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as exc:
+            attributes["error"] = exc.__class__.__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, started_at, attributes)
+
+    def record(
+        self,
+        name: str,
+        seconds: float,
+        started_at: Optional[float] = None,
+        attributes: Optional[dict] = None,
+    ) -> None:
+        """
+        Record a duration measured elsewhere, e.g. by the service.
+
+        :param started_at: Epoch time the stage started at
+        """
+        event = {
+            "type": "span",
+            "name": name,
+            "start": started_at,
+            "seconds": round(seconds, 6),
+            **(attributes or {}),
+        }
+        with self._lock:
+            self.timers.setdefault(name, TimerStats()).add(seconds)
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.dropped_events += 1
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def export(self) -> dict:
+        """
+        Timers, counters and events of the registry, as plain picklable data,
+        e.g. to send those of a worker process back with its result.
+        """
+        with self._lock:
+            return {
+                "timers": {
+                    name: (stats.count, stats.total, stats.max)
+                    for name, stats in self.timers.items()
+                },
+                "counters": dict(self.counters),
+                "events": list(self.events),
+                "dropped_events": self.dropped_events,
+            }
+
+    def merge(self, exported: dict) -> None:
+        """Add the timers, counters and events of another registry's export()."""
+        with self._lock:
+            for name, (count, total, longest) in exported["timers"].items():
+                stats = self.timers.setdefault(name, TimerStats())
+                stats.count += count
+                stats.total += total
+                stats.max = max(stats.max, longest)
+            for name, value in exported["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+            room = max(0, self.max_events - len(self.events))
+            self.events.extend(exported["events"][:room])
+            self.dropped_events += exported["dropped_events"] + max(
+                0, len(exported["events"]) - room
+            )
+
+    def reset(self) -> None:
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.events.clear()
+            self.dropped_events = 0
+
+    def summary(self) -> str:
+        """One line summary of the timers, slowest total first."""
+        with self._lock:
+            timers = sorted(
+                self.timers.items(), key=lambda item: item[1].total, reverse=True
+            )
+            return ", ".join(
+                f"{name} {stats.total:.3f}s/{stats.count}" for name, stats in timers
+            )
+
+    def to_json_lines(self) -> str:
+        with self._lock:
+            lines = [json.dumps(event, default=str) for event in self.events]
+            lines.extend(
+                json.dumps({"type": "timer", "name": name, **stats.to_dict()})
+                for name, stats in sorted(self.timers.items())
+            )
+            lines.extend(
+                json.dumps({"type": "counter", "name": name, "value": value})
+                for name, value in sorted(self.counters.items())
+            )
+            if self.dropped_events:
+                lines.append(
+                    json.dumps(
+                        {
+                            "type": "counter",
+                            "name": "metrics.dropped_events",
+                            "value": self.dropped_events,
+                        }
+                    )
+                )
+        return "".join(line + "\n" for line in lines)
+
+    def to_prometheus(self) -> str:
+        """
+        Prometheus text exposition format: a summary (count and sum) and a max
+        gauge per stage, labelled by stage, and a counter per counter.
+        """
+        stage = f"{PROMETHEUS_PREFIX}_stage_seconds"
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+
+        lines = [
+            f"# HELP {stage} Time spent per stage of the extraction.",
+            f"# TYPE {stage} summary",
+        ]
+        for name, stats in timers:
+            label = f'{{stage="{_label_value(name)}"}}'
+            lines.append(f"{stage}_count{label} {stats.count}")
+            lines.append(f"{stage}_sum{label} {stats.total:.6f}")
+        lines.append(f"# HELP {stage}_max Longest span per stage of the extraction.")
+        lines.append(f"# TYPE {stage}_max gauge")
+        for name, stats in timers:
+            lines.append(f'{stage}_max{{stage="{_label_value(name)}"}} {stats.max:.6f}')
+
+        for name, value in counters:
+            metric = f"{PROMETHEUS_PREFIX}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, metrics_format: str = "jsonl") -> None:
+        """
+        Export the registry to a file, atomically.
+
+        :param metrics_format: One of METRICS_FORMATS
+        """
+        if metrics_format == "jsonl":
+            content = self.to_json_lines()
+        elif metrics_format == "prometheus":
+            content = self.to_prometheus()
+        else:
+            raise ValueError(
+                f"Unknown metrics format '{metrics_format}'. "
+                f"Expected one of {METRICS_FORMATS}"
+            )
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Written next to the target and renamed, so collectors never read
+        # a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def execution_events(response: dict) -> list[dict]:
+    """
+    Read the ExecutionMetrics of a QES response.
+
+    Payloads ask for them with 'ExecutionMetricsKind': 1, and the service
+    returns them next to the DSR, as events timed on its side, e.g.:
+    {"Name": "Execute Semantic Query", "Component": "DSE", "Start": "...",
+    "End": "...", "Metrics": {"RowCount": 253}}
+
+    :return: list of dicts with 'name', 'component', 'seconds' and 'metrics'
+    """
+    events = []
+    for result in response.get("results", []):
+        metrics = result.get("result", {}).get("data", {}).get("metrics") or {}
+        for event in metrics.get("Events", []):
+            try:
+                seconds = (
+                    _parse_time(event["End"]) - _parse_time(event["Start"])
+                ).total_seconds()
+            except (KeyError, TypeError, ValueError):
+                continue
+            events.append(
+                {
+                    "name": event.get("Name", "unknown"),
+                    "component": event.get("Component"),
+                    "seconds": seconds,
+                    "metrics": event.get("Metrics", {}),
+                }
+            )
+    return events
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def record_execution_metrics(response: dict) -> None:
+    """Record the ExecutionMetrics events of a QES response as spans."""
+    for event in execution_events(response):
+        stage = "qes.server." + _metric_name(event["name"].lower())
+        REGISTRY.record(
+            stage,
+            event["seconds"],
+            attributes={"component": event["component"], **event["metrics"]},
+        )
+
+
+# Registry of the process, used by the module level functions
+REGISTRY = MetricsRegistry()
+
+
+def span(name: str, **attributes):
+    """MetricsRegistry.span() on the process registry."""
+    return REGISTRY.span(name, **attributes)
+
+
+def increment(name: str, value: float = 1) -> None:
+    """MetricsRegistry.increment() on the process registry."""
+    REGISTRY.increment(name, value)
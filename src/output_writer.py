@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+import logging
+import os
+from typing import TYPE_CHECKING
+
+from src import metrics
+from src.binary_series import BINARY_SERIES_SUFFIX, write_binary_series
+from src.csv_writer import (
+    COMPRESSION_SUFFIXES,
+    check_compression,
+    write_reference_csv,
+    write_reference_rows,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+OUTPUT_FORMATS = ("csv", "parquet", "feather", "binary")
+PARTITION_COLUMNS = ("kind", "product", "department", "year")
+
+
+class OutputWriter(ABC):
+    """
+    Write a [product, date, value] DataFrame under a build_csv_filename() name.
+    """
+
+    def __init__(self, output_dir: str = "."):
+        self.output_dir = output_dir
+
+    @abstractmethod
+    def write(
+        self,
+        df: pd.DataFrame,
+        department: str,
+        base_filename: str,
+        logger: logging.Logger | None = None,
+        kind: str = "daily",
+    ) -> str:
+        """
+        :param df: DataFrame with columns [product, date, value]
+        :param department: Department of the series
+        :param base_filename: Name built by build_csv_filename, plus an optional
+            suffix (e.g. '_monthly')
+        :param kind: 'daily' for the daily values, else the aggregate written
+            (e.g. 'monthly', 'mean'), to keep them apart in a dataset
+        :return: Path of the written file or dataset
+        """
+
+
+class CsvOutputWriter(OutputWriter):
+    """
+    Reference CSV file: Referencia, Data, Valor. With a compression, the file
+    is named .csv.gz or .csv.zst.
+    """
+
+    def __init__(self, output_dir: str = ".", compression: str | None = None):
+        super().__init__(output_dir)
+        check_compression(compression)
+        self.compression = compression
+        self.suffix = ".csv" + COMPRESSION_SUFFIXES.get(compression, "")
+
+    def write(
+        self,
+        df: pd.DataFrame,
+        department: str,
+        base_filename: str,
+        logger: logging.Logger | None = None,
+        kind: str = "daily",
+    ) -> str:
+        path = os.path.join(self.output_dir, base_filename + self.suffix)
+        write_reference_csv(df, path, logger, compression=self.compression)
+        return path
+
+    def write_rows(
+        self,
+        rows: list[dict],
+        department: str,
+        base_filename: str,
+        logger: logging.Logger | None = None,
+        kind: str = "daily",
+    ) -> str:
+        """
+        write() for rows in format [{'date', 'product', 'value'}], without pandas.
+
+        Only the CSV writer writes rows: see write_daily_rows().
+        """
+        path = os.path.join(self.output_dir, base_filename + self.suffix)
+        write_reference_rows(rows, path, logger, compression=self.compression)
+        return path
+
+
+class BinaryOutputWriter(OutputWriter):
+    """
+    Binary series file: int32 day offsets and float64 values, with a small
+    header, to be memory-mapped by load_binary_series().
+    """
+
+    def write(
+        self,
+        df: pd.DataFrame,
+        department: str,
+        base_filename: str,
+        logger: logging.Logger | None = None,
+        kind: str = "daily",
+    ) -> str:
+        path = os.path.join(self.output_dir, base_filename + BINARY_SERIES_SUFFIX)
+        if logger:
+            logger.info("Writing binary series to %s", path)
+
+        product = str(df["product"].iloc[0]) if len(df) else ""
+        with metrics.span("write.binary", rows=len(df)):
+            write_binary_series(df, path, department, product)
+        metrics.increment("write.rows", len(df))
+        return path
+
+
+class ColumnarOutputWriter(OutputWriter):
+    """
+    Partitioned Parquet or Feather (Arrow IPC) dataset with typed columns.
+
+    Rows are written under the output directory in hive partitions
+    kind=<kind>/product=<product>/department=<department>/year=<year>, in
+    files named after the base filename: kind is 'daily' for the daily values,
+    and the aggregate (e.g. 'monthly', 'mean') for the others. Writing another
+    date range adds new files next to the existing ones (append), while
+    writing the same range again replaces its files. The whole daily history
+    can be read back with
+    pyarrow.dataset.dataset(os.path.join(output_dir, "kind=daily"),
+    partitioning="hive"), or from the dataset of output_dir filtered on kind.
+    """
+
+    def __init__(self, output_dir: str = ".", file_format: str = "parquet"):
+        super().__init__(output_dir)
+        if file_format not in ("parquet", "feather"):
+            raise ValueError(f"Unsupported columnar format: {file_format}")
+        self.file_format = file_format
+
+    def write(
+        self,
+        df: pd.DataFrame,
+        department: str,
+        base_filename: str,
+        logger: logging.Logger | None = None,
+        kind: str = "daily",
+    ) -> str:
+        required_columns = {"product", "date", "value"}
+        missing = required_columns - set(df.columns)
+        if missing:
+            raise ValueError(f"Missing required columns: {missing}")
+
+        if logger:
+            logger.info(
+                "Writing %s dataset to %s (%s)",
+                self.file_format,
+                self.output_dir,
+                base_filename,
+            )
+
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        with metrics.span("write.dataset", rows=len(df)):
+            dates = pd.to_datetime(df["date"])
+            table = pa.table(
+                {
+                    "kind": pa.array([kind] * len(df), pa.string()),
+                    "product": pa.array(df["product"].astype(str), pa.string()),
+                    "department": pa.array([department] * len(df), pa.string()),
+                    "year": pa.array(dates.dt.year, pa.int16()),
+                    "date": pc.cast(pa.array(dates), pa.date32()),
+                    "value": pa.array(df["value"], pa.float64()),
+                }
+            )
+
+            extension = "parquet" if self.file_format == "parquet" else "feather"
+            ds.write_dataset(
+                table,
+                self.output_dir,
+                format="parquet" if self.file_format == "parquet" else "ipc",
+                partitioning=ds.partitioning(
+                    table.select(list(PARTITION_COLUMNS)).schema, flavor="hive"
+                ),
+                basename_template=f"{base_filename}-{{i}}.{extension}",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+
+        metrics.increment("write.rows", len(df))
+
+        if logger:
+            logger.info("Dataset successfully written (%d rows)", len(df))
+        return self.output_dir
+
+
+def get_output_writer(
+    output_format: str, output_dir: str = ".", compression: str | None = None
+) -> OutputWriter:
+    """
+    Build the writer of an output format.
+
+    :param output_format: One of OUTPUT_FORMATS
+    :param output_dir: Output directory (dataset root for columnar formats)
+    :param compression: Compression of csv files, one of CSV_COMPRESSIONS
+    """
+    if output_format == "csv":
+        return CsvOutputWriter(output_dir, compression)
+    if output_format in ("parquet", "feather"):
+        return ColumnarOutputWriter(output_dir, output_format)
+    if output_format == "binary":
+        return BinaryOutputWriter(output_dir)
+    raise ValueError(
+        f"Unknown output format '{output_format}'. Expected one of {OUTPUT_FORMATS}"
+    )
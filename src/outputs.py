@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from datetime import date
+import logging
+from typing import TYPE_CHECKING
+
+from src import metrics
+from src.aggregation import SeriesAggregator
+from src.csv_writer import build_csv_filename
+from src.fill_engine import FillEngine
+from src.output_writer import CsvOutputWriter, OutputWriter
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def write_outputs(
+    df: pd.DataFrame,
+    department_name: str,
+    product_name: str,
+    start_date: date,
+    end_date_given: date,
+    apply_fillna: bool,
+    write_daily_values: bool,
+    write_monthly_values: bool,
+    write_mean_csv: bool,
+    writer: OutputWriter,
+    logger: logging.Logger,
+    rollups: tuple[str, ...] = (),
+    rollup_statistic: str = "mean",
+    fill_engine: FillEngine | None = None,
+) -> str | None:
+    """
+    Write the requested outputs of a department/product pair.
+
+    :param df: DataFrame with columns [date, product, value], as parsed
+    :param end_date_given: Inclusive end date, as given in the command line
+    :param writer: Output writer (csv, parquet or feather)
+    :param rollups: Extra rollup frequencies to write, e.g. ('weekly', 'yearly')
+    :param rollup_statistic: Statistic of the extra rollups
+    :param fill_engine: Engine used with `apply_fillna`. Defaults to filling
+        with the previous valid value, without adding missing days
+    :return: Path of the daily values output, if written
+    """
+    if df.empty:
+        logger.warning(
+            "No rows returned for department '%s' and product '%s'",
+            department_name,
+            product_name,
+        )
+        return None
+
+    if apply_fillna:
+        logger.info("Applying fill na")
+        with metrics.span("fill", rows=len(df)):
+            df, fill_report = (fill_engine or FillEngine()).fill(df)
+        logger.info("Fill na: %s", fill_report)
+
+    min_date = df["date"].min()
+    max_date = df["date"].max()
+    num_days = df["date"].nunique()
+
+    logger.info(
+        "Dataframe covers %d distinct days (%s - %s)",
+        num_days,
+        min_date.strftime("%Y-%m-%d"),
+        max_date.strftime("%Y-%m-%d"),
+    )
+
+    base_filename = build_csv_filename(
+        department=department_name,
+        product=product_name,
+        start_date=start_date,
+        end_date=end_date_given,
+        apply_fillna=apply_fillna,
+    )
+
+    daily_filename = None
+    if write_daily_values:
+        logger.info(f"writing: {base_filename}")
+        daily_filename = writer.write(df, department_name, base_filename, logger)
+
+    if write_monthly_values or write_mean_csv or rollups:
+        aggregator = SeriesAggregator(df)
+
+    if write_monthly_values:
+        with metrics.span("aggregate", frequency="monthly"):
+            monthly_avg = aggregator.rollup("monthly").rename(columns={"mean": "value"})
+
+        monthly_filename = base_filename + "_monthly"
+        logger.info(f"writing: {monthly_filename}")
+        writer.write(
+            monthly_avg, department_name, monthly_filename, logger, kind="monthly"
+        )
+
+    if write_mean_csv:
+        with metrics.span("aggregate", frequency="total"):
+            result = aggregator.total().rename(columns={"mean": "value"})
+
+        mean_filename = base_filename + "_mean"
+        logger.info(f"writing: {mean_filename}")
+        writer.write(result, department_name, mean_filename, logger, kind="mean")
+
+    for frequency in rollups:
+        with metrics.span("aggregate", frequency=frequency):
+            rollup = aggregator.rollup(frequency, [rollup_statistic]).rename(
+                columns={rollup_statistic: "value"}
+            )
+
+        rollup_kind = frequency
+        if rollup_statistic != "mean":
+            rollup_kind += f"_{rollup_statistic}"
+        rollup_filename = f"{base_filename}_{rollup_kind}"
+        logger.info(f"writing: {rollup_filename}")
+        writer.write(rollup, department_name, rollup_filename, logger, kind=rollup_kind)
+
+    return daily_filename
+
+
+def write_daily_rows(
+    rows: list[dict],
+    department_name: str,
+    product_name: str,
+    start_date: date,
+    end_date_given: date,
+    writer: CsvOutputWriter,
+    logger: logging.Logger,
+) -> str | None:
+    """
+    write_outputs() for a daily values only CSV run, from parsed rows.
+
+    Rows are only written as CSV, so the writer must be a CsvOutputWriter.
+
+    :param rows: list of dicts in format [{'date', 'product', 'value'}]
+    :return: Path of the daily values output, if written
+    """
+    if not rows:
+        logger.warning(
+            "No rows returned for department '%s' and product '%s'",
+            department_name,
+            product_name,
+        )
+        return None
+
+    days = {row["date"] for row in rows}
+    logger.info(
+        "Rows cover %d distinct days (%s - %s)",
+        len(days),
+        min(days).strftime("%Y-%m-%d"),
+        max(days).strftime("%Y-%m-%d"),
+    )
+
+    base_filename = build_csv_filename(
+        department=department_name,
+        product=product_name,
+        start_date=start_date,
+        end_date=end_date_given,
+        apply_fillna=False,
+    )
+    logger.info(f"writing: {base_filename}")
+    return writer.write_rows(rows, department_name, base_filename, logger)
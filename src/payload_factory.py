@@ -1,4 +1,79 @@
 from datetime import date
+import functools
+import json
+import re
+from typing import Any
+
+# Canonical JSON serialization of payloads: compact, with sorted keys. The
+# ResponseCache hashes dict payloads the same way, so a rendered template and
+# the equivalent dict share the same cache key.
+JSON_DUMPS_OPTIONS = {
+    "sort_keys": True,
+    "separators": (",", ":"),
+    "ensure_ascii": False,
+}
+
+_ENCODER = json.JSONEncoder(**JSON_DUMPS_OPTIONS)
+
+SLOT_MARKER = "\x00{}\x00"
+SLOT_PATTERN = re.compile(r'"\\u0000(\w+)\\u0000"')
+
+
+def string_literal(value: str) -> str:
+    """
+    Quote a string as a semantic query literal, doubling embedded quotes.
+
+    e.g. Rey's -> 'Rey''s'
+    """
+    return "'" + value.replace("'", "''") + "'"
+
+
+def datetime_literal(value: date) -> str:
+    return f"datetime'{value.strftime('%Y-%m-%dT00:00:00')}'"
+
+
+def literal_values(values: list[str]) -> list[list[dict]]:
+    """Values of an In condition over a single column."""
+    return [[{"Literal": {"Value": string_literal(value)}}] for value in values]
+
+
+class PayloadTemplate:
+    """
+    Pre-serialized payload with parameter slots.
+
+    The static structure of a payload is serialized once, and render() only
+    serializes the slot values and joins them with the static parts, instead
+    of building and serializing the whole nested dict for every query.
+    """
+
+    def __init__(self, payload: dict):
+        serialized = _ENCODER.encode(payload)
+
+        self.parts: list[str] = []
+        self.slots: list[str] = []
+        position = 0
+        for match in SLOT_PATTERN.finditer(serialized):
+            self.parts.append(serialized[position : match.start()])
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.parts.append(serialized[position:])
+
+    def render(self, **values: Any) -> bytes:
+        """
+        Fill the slots and return the payload ready to be sent.
+
+        :param values: JSON serializable value of each slot
+        :return: UTF-8 encoded canonical JSON payload
+        """
+        missing = set(self.slots) - set(values)
+        if missing:
+            raise ValueError(f"Missing payload slot values: {sorted(missing)}")
+
+        chunks = [self.parts[0]]
+        for slot, part in zip(self.slots, self.parts[1:]):
+            chunks.append(_ENCODER.encode(values[slot]))
+            chunks.append(part)
+        return "".join(chunks).encode("utf-8")
 
 
 class PayloadFactory:
@@ -12,10 +87,199 @@ class PayloadFactory:
         product: str,
         department: str,
     ) -> dict:
+        return PayloadFactory.multi_series(
+            dataset_id=dataset_id,
+            report_id=report_id,
+            visual_id=visual_id,
+            start_date=start_date,
+            end_date=end_date,
+            products=[product],
+            departments=[department],
+        )
+
+    @staticmethod
+    def multi_series(
+        dataset_id: str,
+        report_id: str,
+        visual_id: str,
+        start_date: date,
+        end_date: date,
+        products: list[str],
+        departments: list[str],
+    ) -> dict:
+        """
+        Build a payload fetching the daily series of several products and
+        departments in a single semantic query.
+
+        Products and departments are filtered with IN-lists, and each product
+        is a member of the secondary grouping. With several departments,
+        DEPARTAMENTO is added to the secondary grouping too, so every
+        (product, department) pair comes back as its own series.
+        """
+        if not products or not departments:
+            raise ValueError("At least one product and one department are required")
 
-        start = start_date.strftime("%Y-%m-%dT00:00:00")
-        end = end_date.strftime("%Y-%m-%dT00:00:00")
+        return PayloadFactory._series_payload(
+            start=datetime_literal(start_date),
+            end=datetime_literal(end_date),
+            departments=literal_values(departments),
+            products=literal_values(products),
+            dataset_id=f"'{dataset_id}",
+            report_id=f"'{report_id}",
+            visual_id=f"'{visual_id}",
+            multi_department=len(departments) > 1,
+        )
 
+    @staticmethod
+    def render_series(
+        dataset_id: str,
+        report_id: str,
+        visual_id: str,
+        start_date: date,
+        end_date: date,
+        products: list[str],
+        departments: list[str],
+    ) -> bytes:
+        """
+        Same payload as multi_series(), rendered from a compiled template.
+
+        :return: Serialized payload, to be sent as the request body
+        """
+        if not products or not departments:
+            raise ValueError("At least one product and one department are required")
+
+        return PayloadFactory.template(len(departments) > 1).render(
+            start=datetime_literal(start_date),
+            end=datetime_literal(end_date),
+            departments=literal_values(departments),
+            products=literal_values(products),
+            dataset_id=f"'{dataset_id}",
+            report_id=f"'{report_id}",
+            visual_id=f"'{visual_id}",
+        )
+
+    @staticmethod
+    def catalog(
+        dataset_id: str,
+        report_id: str,
+        visual_id: str,
+        window: int = 30000,
+    ) -> dict:
+        """
+        Build a payload fetching the distinct (DEPARTAMENTO, PRODUCTO) pairs of
+        the daily prices, to discover the departments and products that can be
+        queried.
+
+        Pairs are the rows of a single primary grouping, without measure nor
+        date filter.
+
+        :param window: Max number of pairs returned. The data set is flagged as
+            incomplete (IC false) when there are more
+        """
+        return {
+            "version": "1.0.0",
+            "modelId": 6878420,
+            "allowLongRunningQueries": True,
+            "userPreferredLocale": "en-US",
+            "cancelQueries": [],
+            "queries": [
+                {
+                    "Query": {
+                        "Commands": [
+                            {
+                                "SemanticQueryDataShapeCommand": {
+                                    "Query": {
+                                        "Version": 2,
+                                        "From": [
+                                            {
+                                                "Entity": "Precios reuters diarios",
+                                                "Name": "p",
+                                                "Type": 0,
+                                            }
+                                        ],
+                                        "Select": [
+                                            {
+                                                "Column": {
+                                                    "Expression": {
+                                                        "SourceRef": {"Source": "p"}
+                                                    },
+                                                    "Property": "DEPARTAMENTO",
+                                                },
+                                                "Name": "Precios reuters diarios.DEPARTAMENTO",
+                                                "NativeReferenceName": "DEPARTAMENTO",
+                                            },
+                                            {
+                                                "Column": {
+                                                    "Expression": {
+                                                        "SourceRef": {"Source": "p"}
+                                                    },
+                                                    "Property": "PRODUCTO",
+                                                },
+                                                "Name": "Precios reuters diarios.PRODUCTO",
+                                                "NativeReferenceName": "PRODUCTO",
+                                            },
+                                        ],
+                                    },
+                                    "Binding": {
+                                        "Primary": {
+                                            "Groupings": [{"Projections": [0, 1]}]
+                                        },
+                                        "DataReduction": {
+                                            "DataVolume": 3,
+                                            "Primary": {"Window": {"Count": window}},
+                                        },
+                                        "Version": 1,
+                                    },
+                                    "ExecutionMetricsKind": 1,
+                                }
+                            }
+                        ]
+                    },
+                    "QueryId": "",
+                    "ApplicationContext": {
+                        "DatasetId": f"'{dataset_id}",
+                        "Sources": [
+                            {
+                                "ReportId": f"'{report_id}",
+                                "VisualId": f"'{visual_id}",
+                            }
+                        ],
+                    },
+                }
+            ],
+        }
+
+    @staticmethod
+    @functools.cache
+    def template(multi_department: bool = False) -> PayloadTemplate:
+        """Compiled series payload, built once per grouping variant."""
+        slots = (
+            "start",
+            "end",
+            "departments",
+            "products",
+            "dataset_id",
+            "report_id",
+            "visual_id",
+        )
+        return PayloadTemplate(
+            PayloadFactory._series_payload(
+                **{slot: SLOT_MARKER.format(slot) for slot in slots},
+                multi_department=multi_department,
+            )
+        )
+
+    @staticmethod
+    def _series_payload(
+        start: Any,
+        end: Any,
+        departments: Any,
+        products: Any,
+        dataset_id: Any,
+        report_id: Any,
+        visual_id: Any,
+        multi_department: bool,
+    ) -> dict:
         payload_template = {
             "version": "1.0.0",
             "modelId": 6878420,
@@ -100,7 +364,7 @@ class PayloadFactory:
                                                                 },
                                                                 "Right": {
                                                                     "Literal": {
-                                                                        "Value": f"datetime'{start}'"
+                                                                        "Value": start
                                                                     }
                                                                 },
                                                             }
@@ -120,7 +384,7 @@ class PayloadFactory:
                                                                 },
                                                                 "Right": {
                                                                     "Literal": {
-                                                                        "Value": f"datetime'{end}'"
+                                                                        "Value": end
                                                                     }
                                                                 },
                                                             }
@@ -143,15 +407,7 @@ class PayloadFactory:
                                                                 }
                                                             }
                                                         ],
-                                                        "Values": [
-                                                            [
-                                                                {
-                                                                    "Literal": {
-                                                                        "Value": f"'{department}'"
-                                                                    }
-                                                                }
-                                                            ]
-                                                        ],
+                                                        "Values": departments,
                                                     }
                                                 }
                                             },
@@ -170,15 +426,7 @@ class PayloadFactory:
                                                                 }
                                                             }
                                                         ],
-                                                        "Values": [
-                                                            [
-                                                                {
-                                                                    "Literal": {
-                                                                        "Value": f"'{product}'"
-                                                                    }
-                                                                }
-                                                            ]
-                                                        ],
+                                                        "Values": products,
                                                     }
                                                 }
                                             },
@@ -204,11 +452,11 @@ class PayloadFactory:
                     },
                     "QueryId": "",
                     "ApplicationContext": {
-                        "DatasetId": f"'{dataset_id}",
+                        "DatasetId": dataset_id,
                         "Sources": [
                             {
-                                "ReportId": f"'{report_id}",
-                                "VisualId": f"'{visual_id}",
+                                "ReportId": report_id,
+                                "VisualId": visual_id,
                             }
                         ],
                     },
@@ -216,4 +464,21 @@ class PayloadFactory:
             ],
         }
 
+        if multi_department:
+            command = payload_template["queries"][0]["Query"]["Commands"][0]
+            query = command["SemanticQueryDataShapeCommand"]["Query"]
+            binding = command["SemanticQueryDataShapeCommand"]["Binding"]
+
+            query["Select"].append(
+                {
+                    "Column": {
+                        "Expression": {"SourceRef": {"Source": "p"}},
+                        "Property": "DEPARTAMENTO",
+                    },
+                    "Name": "Precios reuters diarios.DEPARTAMENTO",
+                    "NativeReferenceName": "DEPARTAMENTO",
+                }
+            )
+            binding["Secondary"]["Groupings"][0]["Projections"].append(3)
+
         return payload_template
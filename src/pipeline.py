@@ -0,0 +1,110 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import logging
+import multiprocessing
+from typing import Any, Callable, Hashable
+
+from src import metrics
+
+Outcome = tuple[Hashable, Any]
+
+
+def _run_task(function: Callable, kwargs: dict) -> tuple[Any, dict]:
+    """
+    Run a task in a worker process.
+
+    :return: (result of the task, metrics recorded while it ran)
+    """
+    metrics.REGISTRY.reset()
+    result = function(**kwargs)
+    return result, metrics.REGISTRY.export()
+
+
+class PostProcessPipeline:
+    """
+    Run the CPU bound post-processing of fetched series (fill, rollups,
+    output formatting and writing) in worker processes, while the main
+    process keeps fetching.
+
+    At most `max_pending` tasks are queued or running: when the pipeline is
+    full, submit() waits for the oldest task, so the caller stops consuming
+    fetched results, and the bounded fetch window stops the queries in turn.
+    Memory stays bounded however long the batch is.
+
+    Workers are started with the spawn method, as the main process runs fetch
+    and token refresh threads, which fork would copy while they hold locks.
+    Tasks must therefore be module level functions, with picklable arguments
+    and results. The metrics recorded by a task are merged into the metrics of
+    the main process.
+
+    With 0 workers, tasks run in the calling process as they are submitted.
+    """
+
+    def __init__(self, workers: int = 0, max_pending: int = 16):
+        if workers < 0:
+            raise ValueError("workers must be at least 0")
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+
+        self.workers = workers
+        self.max_pending = max_pending
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.pool = None
+        if workers > 0:
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        self.pending: deque[tuple[Hashable, Future]] = deque()
+
+    def submit(self, key: Hashable, function: Callable, **kwargs) -> list[Outcome]:
+        """
+        Queue `function(**kwargs)`.
+
+        :param key: Key of the task in the outcomes, e.g. (department, product)
+        :return: Outcomes of the tasks completed to make room for this one, as
+            (key, result) tuples, oldest first. A failed task has its
+            exception as result
+        """
+        if self.pool is None:
+            try:
+                return [(key, function(**kwargs))]
+            except Exception as exc:
+                return [(key, exc)]
+
+        outcomes = []
+        while len(self.pending) >= self.max_pending:
+            outcomes.append(self._wait_oldest())
+        self.pending.append((key, self.pool.submit(_run_task, function, kwargs)))
+        return outcomes
+
+    def drain(self) -> list[Outcome]:
+        """
+        Wait for every queued task.
+
+        :return: Outcomes of the tasks, oldest first
+        """
+        outcomes = []
+        while self.pending:
+            outcomes.append(self._wait_oldest())
+        return outcomes
+
+    def _wait_oldest(self) -> Outcome:
+        key, future = self.pending.popleft()
+        try:
+            result, exported = future.result()
+        except Exception as exc:
+            return key, exc
+
+        metrics.REGISTRY.merge(exported)
+        return key, result
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self) -> "PostProcessPipeline":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,23 +1,55 @@
 import requests
+from requests.adapters import HTTPAdapter
+from contextlib import contextmanager
 import uuid
 import logging
-from typing import Optional
+import time
+from typing import IO, Iterator, Optional
+
+from src import metrics
+from src.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RequestStats,
+    RetryPolicy,
+)
 
 
 class PowerBIClient:
-    def __init__(self, cluster_url: str, report_id: str, embed_token: str):
+    def __init__(
+        self,
+        cluster_url: str,
+        report_id: str,
+        embed_token: str,
+        pool_maxsize: int = 10,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
         self.cluster_url = cluster_url
         self.report_id = report_id
         self.logger = logging.getLogger(self.__class__.__name__)
 
+        # Without a policy, failures are still classified for the breaker
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=0)
+        self.circuit_breaker = circuit_breaker
+        self.stats = RequestStats()
+
         self.session = requests.Session()
+        # Keep enough pooled connections for concurrent execute_query calls
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.session.headers.update(
             {
-                "Authorization": f"EmbedToken {embed_token}",
                 "Accept": "application/json",
                 "Content-Type": "application/json",
             }
         )
+        self.set_embed_token(embed_token)
+
+    def set_embed_token(self, embed_token: str) -> None:
+        """Replace the EmbedToken used by the session, e.g. after a refresh."""
+        self.session.headers["Authorization"] = f"EmbedToken {embed_token}"
 
     def get_models_and_exploration(self) -> dict:
         url = (
@@ -33,13 +65,100 @@ class PowerBIClient:
         }
 
         self.logger.info("Fetching modelsAndExploration")
-        response = self.session.get(url, params=params, headers=headers, timeout=60)
-        response.raise_for_status()
+        with metrics.span("powerbi.models_and_exploration") as span:
+            response = self._request(
+                "GET", url, params=params, headers=headers, timeout=60
+            )
+            response.raise_for_status()
+            span["bytes"] = len(response.content)
 
         return response.json()
 
-    def execute_query(self, qes_endpoint: str, mwc_token: str, payload: dict) -> dict:
-        headers = {
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request with the retry policy and the circuit breaker.
+
+        Connection errors and retryable statuses (429, 5xx) are retried with
+        backoff. Once retries are exhausted, the last response is returned (or
+        the last error raised) so callers handle it as before. While the
+        circuit breaker is open, attempts wait for it instead of being sent.
+
+        :raises CircuitOpenError: if the circuit breaker is still open after
+            the last retry
+        """
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                try:
+                    self.circuit_breaker.before_request()
+                except CircuitOpenError:
+                    if attempt >= self.retry_policy.max_retries:
+                        raise
+                    delay = max(
+                        self.circuit_breaker.retry_in(),
+                        self.retry_policy.delay(attempt),
+                    )
+                    self.logger.warning(
+                        "Circuit breaker open, retry %d/%d in %.1fs",
+                        attempt + 1,
+                        self.retry_policy.max_retries,
+                        delay,
+                    )
+                    self.stats.record_retry()
+                    metrics.increment("http.retries")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+
+            response = error = None
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as exc:
+                error = exc
+            finally:
+                if (
+                    self.circuit_breaker is not None
+                    and response is None
+                    and error is None
+                ):
+                    self.circuit_breaker.release_trial()
+
+            retryable = self.retry_policy.is_retryable(response, error)
+            self.stats.record(time.monotonic() - started, failed=retryable)
+            metrics.increment("http.requests")
+            if retryable:
+                metrics.increment("http.failures")
+            if self.circuit_breaker is not None:
+                if retryable:
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+
+            if not retryable or attempt >= self.retry_policy.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self.retry_policy.delay(attempt, response)
+            self.logger.warning(
+                "%s %s failed (%s), retry %d/%d in %.1fs",
+                method,
+                url,
+                error or response.status_code,
+                attempt + 1,
+                self.retry_policy.max_retries,
+                delay,
+            )
+            if response is not None:
+                response.close()
+            self.stats.record_retry()
+            metrics.increment("http.retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def _query_headers(self, mwc_token: str) -> dict:
+        return {
             "Authorization": f"MWCToken {mwc_token}",
             "Content-Type": "application/json;charset=UTF-8",
             "Accept": "application/json, text/plain, */*",
@@ -51,16 +170,76 @@ class PowerBIClient:
             "referer": "https://app.powerbi.com/",
         }
 
+    @staticmethod
+    def _query_body(payload: dict | bytes) -> dict:
+        """Request body arguments: pre-serialized payloads are sent as is."""
+        if isinstance(payload, bytes):
+            return {"data": payload}
+        return {"json": payload}
+
+    def execute_query(
+        self, qes_endpoint: str, mwc_token: str, payload: dict | bytes
+    ) -> dict:
+        headers = self._query_headers(mwc_token)
+
         self.logger.info("Executing semantic query")
-        response = self.session.post(
-            qes_endpoint, json=payload, headers=headers, timeout=120
-        )
+        with metrics.span("qes.execute") as span:
+            response = self._request(
+                "POST",
+                qes_endpoint,
+                headers=headers,
+                timeout=120,
+                **self._query_body(payload),
+            )
+            span["status"] = response.status_code
+            span["bytes"] = len(response.content)
 
+        metrics.increment("qes.response_bytes", len(response.content))
         if response.status_code != 200:
             self.logger.error("QES error %s: %s", response.status_code, response.text)
 
         response.raise_for_status()
-        return response.json()
+        with metrics.span("qes.json_decode"):
+            result = response.json()
+        metrics.record_execution_metrics(result)
+        return result
+
+    @contextmanager
+    def execute_query_stream(
+        self, qes_endpoint: str, mwc_token: str, payload: dict | bytes
+    ) -> Iterator[IO[bytes]]:
+        """
+        Execute a semantic query without loading the response body in memory.
+
+        Usage::
+
+            with client.execute_query_stream(endpoint, mwc_token, payload) as body:
+                ...  # read body incrementally
+
+        :return: Context manager yielding a file-like object over the response
+            body, decompressed on the fly when sent with gzip/deflate encoding
+        """
+        headers = self._query_headers(mwc_token)
+
+        self.logger.info("Executing semantic query (streaming)")
+        response = self._request(
+            "POST",
+            qes_endpoint,
+            headers=headers,
+            timeout=120,
+            stream=True,
+            **self._query_body(payload),
+        )
+
+        try:
+            if response.status_code != 200:
+                self.logger.error("QES error %s: %s", response.status_code, response.text)
+
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield response.raw
+        finally:
+            response.close()
 
     def get_mwc_token(self, model_exploration_data: dict) -> Optional[str]:
         def find_key(obj, key):
@@ -0,0 +1,129 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Tokens are refilled continuously at `rate` per second, up to `capacity`.
+    acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be greater than zero")
+
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Block until `tokens` tokens are available and consume them.
+
+        :param tokens: Number of tokens to consume
+        """
+        if tokens > self.capacity:
+            raise ValueError("Cannot acquire more tokens than the bucket capacity")
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class ConcurrentQueryExecutor:
+    """
+    Send many query payloads concurrently with bounded parallelism.
+
+    `send` is called from worker threads with one payload at a time, so it
+    must be thread-safe (PowerBIClient.execute_query is, as long as its
+    connection pool is at least `max_concurrency` wide). Results are always
+    returned in submission order. Rate limiting, if any, is up to `send`:
+    SeriesExtractor applies its TokenBucket to every query it sends, including
+    the ones sent outside the executor.
+
+    With `max_pending`, at most that many payloads are sent ahead of the
+    results consumed by the caller, so a slow consumer pauses the queries
+    instead of piling their results up in memory.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Any], Any],
+        max_concurrency: int = 4,
+        max_pending: Optional[int] = None,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.send = send
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def map(self, payloads: Iterable[Any], return_exceptions: bool = False) -> Iterator[Any]:
+        """
+        Send payloads concurrently and yield their results in submission order.
+
+        :param payloads: Payloads to send
+        :param return_exceptions: If True, a failed payload yields its exception
+            instead of raising it, so the remaining results are still yielded
+        :return: Iterator over results, in the same order as `payloads`
+        """
+        payloads = list(payloads)
+        self.logger.info(
+            "Executing %d queries (max concurrency: %d)",
+            len(payloads),
+            self.max_concurrency,
+        )
+
+        window = len(payloads)
+        if self.max_pending is not None:
+            window = max(self.max_pending, self.max_concurrency)
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="qes"
+        ) as pool:
+            remaining = iter(payloads)
+            futures = deque(
+                pool.submit(self.send, payload)
+                for payload in islice(remaining, window)
+            )
+
+            try:
+                while futures:
+                    future = futures.popleft()
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        if not return_exceptions:
+                            raise
+                        result = exc
+
+                    # Refill the window before handing the result over
+                    for payload in islice(remaining, 1):
+                        futures.append(pool.submit(self.send, payload))
+                    yield result
+            finally:
+                for future in futures:
+                    future.cancel()
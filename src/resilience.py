@@ -0,0 +1,233 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a request is refused because the circuit breaker is open."""
+
+    pass
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter for transient HTTP failures.
+
+    Connection errors, timeouts and the `retry_statuses` responses are retried
+    up to `max_retries` times. The n-th retry waits a random time between 0
+    and min(backoff_max, backoff_base * 2**n) seconds ("full jitter"), or the
+    time asked by a Retry-After header when the response has one.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        retry_statuses: tuple[int, ...] = RETRY_STATUS_CODES,
+        jitter: bool = True,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = retry_statuses
+        self.jitter = jitter
+
+    def is_retryable(
+        self,
+        response: Optional[requests.Response] = None,
+        error: Optional[Exception] = None,
+    ) -> bool:
+        if error is not None:
+            return isinstance(error, (requests.ConnectionError, requests.Timeout))
+        return response is not None and response.status_code in self.retry_statuses
+
+    def delay(
+        self, attempt: int, response: Optional[requests.Response] = None
+    ) -> float:
+        """
+        Seconds to wait before a retry.
+
+        :param attempt: Number of the retry, starting at 0
+        :param response: Failed response, whose Retry-After header is honoured
+        """
+        retry_after = (
+            parse_retry_after(response.headers.get("Retry-After"))
+            if response is not None
+            else None
+        )
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+
+        backoff = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header, given in seconds or as an HTTP date.
+
+    :return: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens, and
+    requests fail fast with CircuitOpenError for `reset_timeout` seconds.
+    Then a single trial request is let through (half-open): the circuit
+    closes again if it succeeds, and opens for another `reset_timeout`
+    seconds if it fails. Requests made while the trial is in flight wait for
+    its outcome.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.times_opened = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._trial_done = threading.Condition(self._lock)
+
+    def before_request(self) -> None:
+        """
+        While a half-open trial request is in flight, wait for its outcome, at
+        most `reset_timeout` seconds.
+
+        Once this returns, the request must end with record_success(),
+        record_failure() or release_trial().
+
+        :raises CircuitOpenError: if the circuit is open
+        """
+        with self._lock:
+            deadline = time.monotonic() + self.reset_timeout
+            while True:
+                if self.state == self.OPEN:
+                    remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                    if remaining > 0:
+                        raise CircuitOpenError(
+                            f"Circuit breaker open, retry in {remaining:.1f}s"
+                        )
+                    self.state = self.HALF_OPEN
+                    self._trial_in_flight = False
+
+                if self.state != self.HALF_OPEN:
+                    return
+                if not self._trial_in_flight:
+                    self._trial_in_flight = True
+                    return
+
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    raise CircuitOpenError("Circuit breaker half-open, trial in flight")
+                self._trial_done.wait(timeout)
+
+    def release_trial(self) -> None:
+        """
+        End a request that got neither a response nor a request error (e.g.
+        interrupted): a waiting request becomes the trial instead.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+            self._trial_done.notify_all()
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit lets a trial request through."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                self.logger.info("Circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+            self._trial_done.notify_all()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            self._trial_done.notify_all()
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.times_opened += 1
+                self.logger.warning(
+                    "Circuit breaker opened after %d failures, pausing requests for %.0fs",
+                    self.failures,
+                    self.reset_timeout,
+                )
+
+
+class RequestStats:
+    """Thread-safe request, retry and latency counters."""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, failed: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.failures += int(failed)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"RequestStats({self.requests} requests, {self.retries} retries, "
+            f"{self.failures} failures, latency mean {self.mean_latency:.3f}s "
+            f"max {self.max_latency:.3f}s)"
+        )
@@ -0,0 +1,199 @@
+from datetime import date
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+
+CACHE_SUFFIX = ".json.gz"
+IMMUTABLE_SUFFIX = ".immutable.json.gz"
+
+
+def is_closed_range(end_date: date, today: Optional[date] = None) -> bool:
+    """
+    Check if a date range only covers closed months, whose data won't change.
+
+    :param end_date: Exclusive end date of the range
+    :param today: Reference date, defaults to today
+    """
+    today = today or date.today()
+    return end_date <= today.replace(day=1)
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of QES responses.
+
+    Responses are stored gzip compressed, one file per payload, named after a
+    SHA-256 hash of the canonical JSON of the payload. Entries expire after
+    `ttl` seconds, unless stored as immutable (closed historical ranges), and
+    the least recently used entries are evicted when the cache grows larger
+    than `max_bytes`.
+
+    The file modification time holds the creation time of an entry (for the
+    TTL) and the access time holds its last hit (for the LRU).
+    """
+
+    def __init__(self, directory: str, ttl: float = 86400, max_bytes: int = 2**30):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def payload_key(payload: dict | bytes) -> str:
+        """
+        Hash a payload into a cache key.
+
+        Dict payloads are serialized with sorted keys, so equivalent payloads
+        share the same key regardless of their key order.
+        """
+        if isinstance(payload, dict):
+            payload = json.dumps(
+                payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+            ).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key: str, immutable: bool) -> str:
+        suffix = IMMUTABLE_SUFFIX if immutable else CACHE_SUFFIX
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def get(self, payload: dict | bytes) -> Optional[Any]:
+        """
+        Return the cached response of a payload, or None on a miss.
+        """
+        key = self.payload_key(payload)
+
+        for immutable in (True, False):
+            path = self._path(key, immutable)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            now = time.time()
+            if not immutable and now - stat.st_mtime > self.ttl:
+                self._remove(path)
+                continue
+
+            try:
+                with gzip.open(path, "rb") as f:
+                    response = json.loads(f.read())
+            except (OSError, ValueError):
+                self.logger.warning("Dropping corrupted cache entry %s", path)
+                self._remove(path)
+                continue
+
+            # Keep the creation time in mtime, record the hit in atime
+            os.utime(path, (now, stat.st_mtime))
+            with self._lock:
+                self.hits += 1
+            return response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, payload: dict | bytes, response: Any, immutable: bool = False) -> None:
+        """
+        Store the response of a payload.
+
+        :param immutable: Never expire the entry by TTL (it can still be
+            evicted by the size limit)
+        """
+        key = self.payload_key(payload)
+        path = self._path(key, immutable)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        data = gzip.compress(
+            json.dumps(response, separators=(",", ":")).encode("utf-8"),
+            compresslevel=6,
+        )
+
+        # Size of the entry being replaced, if any
+        try:
+            previous_size = os.stat(path).st_size
+        except FileNotFoundError:
+            previous_size = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            self.logger.warning("Could not write cache entry %s", path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._entries())
+            else:
+                self._size += len(data) - previous_size
+            over_limit = self._size > self.max_bytes
+
+        if over_limit:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove expired entries, then least recently used ones until the
+        cache fits in `max_bytes`.
+        """
+        now = time.time()
+        entries = []
+        total = 0
+
+        for path, stat, size in self._entries():
+            if not path.endswith(IMMUTABLE_SUFFIX) and now - stat.st_mtime > self.ttl:
+                self._remove(path)
+                continue
+            entries.append((stat.st_atime, path, size))
+            total += size
+
+        entries.sort()
+        removed = 0
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+
+        with self._lock:
+            self._size = total
+
+        if removed:
+            self.logger.info("Evicted %d least recently used cache entries", removed)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(CACHE_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat, stat.st_size
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,27 +1,402 @@
+from __future__ import annotations
+
+from array import array
 from datetime import datetime, date
 import logging
+from typing import IO, TYPE_CHECKING, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+from src import metrics
+from src.dsr_decoder import ColumnTable, DataShape, DsrDecoder
+from src.dsr_stream import DsrStreamReader
+
+DATE_COLUMN = "G0"
+VALUE_COLUMN = "M0"
+MS_PER_DAY = 86_400_000
 
 
 class DailySeriesParser:
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.decoder = DsrDecoder()
 
-    def parse(self, response: dict, product: str) -> list[dict]:
-        ds = response["results"][0]["result"]["data"]["dsr"]["DS"][0]
-        points = ds["PH"][0]["DM0"]
-
-        rows = []
-        for p in points:
-            ts = p["G0"]
-            value = p.get("X", [{}])[0].get("M0")
+    def parse(self, response: dict, product: Optional[str]) -> list[dict]:
+        with metrics.span("parse.rows") as span:
+            columns = self.parse_columns(response, product)
 
-            rows.append(
+            rows = [
                 {
                     "date": datetime.utcfromtimestamp(ts / 1000).date(),
-                    "product": product,
+                    "product": label,
                     "value": value,
                 }
-            )
+                for ts, label, value in zip(
+                    columns["date"], columns["product"], columns["value"]
+                )
+            ]
+            span["rows"] = len(rows)
 
+        metrics.increment("parse.rows", len(rows))
         self.logger.info("Parsed %d rows", len(rows))
         return rows
+
+    def parse_columns(self, response: dict, product: Optional[str]) -> dict[str, list]:
+        """
+        Parse the daily series of a QES response into columns.
+
+        Every primary row (date) gets one value per secondary member (product),
+        None where the service returned no value.
+
+        :param product: Label of the series. If None, each series is labelled
+            with its secondary member, as returned by the service
+        :return: dict with 'date' (epoch ms), 'product' and 'value' lists
+        """
+        columns = {"date": [], "product": [], "value": []}
+
+        for shape in self.decoder.decode(response):
+            self._append_series(shape, product, columns)
+
+        return columns
+
+    def parse_frame(self, response: dict, product: Optional[str]) -> pd.DataFrame:
+        """
+        Parse the daily series of a QES response straight into a typed DataFrame.
+
+        Same rows as parse(), but built from NumPy arrays without per-row
+        dicts: 'date' is datetime64 (midnight UTC), 'value' is float64 with
+        NaN for missing values and 'product' is categorical.
+
+        :param product: Label of the series. If None, each series is labelled
+            with its secondary member, as returned by the service
+        :return: DataFrame with columns [date, product, value]
+        """
+        categories: dict[str, int] = {}
+        parts = []
+
+        with metrics.span("parse.decode"):
+            for shape in self.decoder.decode(response):
+                ts, cell_rows, cell_members, cell_values = self._shape_arrays(shape)
+                parts.append(
+                    self._series_arrays(
+                        ts=ts,
+                        labels=self._labels(shape.members, product),
+                        cell_rows=cell_rows,
+                        cell_members=cell_members,
+                        cell_values=cell_values,
+                        categories=categories,
+                    )
+                )
+
+        df = self._build_frame(parts, categories)
+        self.logger.info("Parsed %d rows", len(df))
+        return df
+
+    def parse_batch(
+        self, response: dict, departments: list[str], products: list[str]
+    ) -> dict[tuple[str, str], pd.DataFrame]:
+        """
+        Split the response of a PayloadFactory.multi_series query into one
+        series per (department, product) pair.
+
+        Each series only has the dates the service returned a cell for, like
+        a single product query. Secondary members are matched to the requested
+        names case-insensitively, and labelled with the requested name.
+
+        :param departments: Departments of the query. When there is only one,
+            the response has no department column and every series belongs to it
+        :param products: Products of the query
+        :return: dict of DataFrames with columns [date, product, value], with an
+            empty DataFrame for pairs the service returned no data for
+        """
+        requested = {
+            (department.casefold(), product.casefold()): (department, product)
+            for department in departments
+            for product in products
+        }
+        parts: dict[tuple[str, str], list] = {key: [] for key in requested.values()}
+
+        with metrics.span("parse.decode", series=len(requested)):
+            for shape in self.decoder.decode(response):
+                ts, cell_rows, cell_members, cell_values = self._shape_arrays(shape)
+                valid = ~np.isnan(ts)
+
+                member_products = self._member_labels(shape.members)
+                if len(departments) == 1:
+                    member_departments = [departments[0]] * len(member_products)
+                else:
+                    member_departments = self._member_labels(shape.members, position=1)
+
+                for member, (department, product) in enumerate(
+                    zip(member_departments, member_products)
+                ):
+                    if department is None or product is None:
+                        continue
+                    key = requested.get(
+                        (str(department).casefold(), str(product).casefold())
+                    )
+                    if key is None:
+                        continue
+
+                    in_member = cell_members == member
+                    values = np.full(len(ts), np.nan)
+                    present = np.zeros(len(ts), dtype=bool)
+                    values[cell_rows[in_member]] = cell_values[in_member]
+                    present[cell_rows[in_member]] = True
+
+                    keep = valid & present
+                    parts[key].append(
+                        (
+                            ts[keep].astype("int64"),
+                            np.zeros(int(keep.sum()), dtype="int64"),
+                            values[keep],
+                        )
+                    )
+
+        series = {
+            key: self._build_frame(key_parts, {key[1]: 0})
+            for key, key_parts in parts.items()
+        }
+        self.logger.info(
+            "Parsed %d rows for %d series",
+            sum(len(df) for df in series.values()),
+            len(series),
+        )
+        return series
+
+    def parse_stream(
+        self, stream: IO[bytes], product: Optional[str]
+    ) -> tuple[pd.DataFrame, bool]:
+        """
+        Parse the daily series of a QES response body while it is being read.
+
+        Rows are decoded one at a time into compact typed arrays, without
+        loading the JSON tree in memory, and turned into the same DataFrame
+        as parse_frame().
+
+        :param stream: File-like object with the (decompressed) response body
+        :param product: See parse_frame()
+        :return: (DataFrame with columns [date, product, value], completeness
+            flag, as is_complete())
+        """
+        with metrics.span("parse.stream") as span:
+            reader = DsrStreamReader(stream)
+
+            # (dates, cell rows, cell members, cell values) per data set
+            data_sets: list[tuple[array, array, array, array]] = []
+            for data_set, values, cells in reader.rows():
+                while len(data_sets) <= data_set:
+                    data_sets.append((array("d"), array("q"), array("q"), array("d")))
+                ts, cell_rows, cell_members, cell_values = data_sets[data_set]
+
+                row = len(ts)
+                date_ms = values.get(DATE_COLUMN)
+                ts.append(np.nan if date_ms is None else date_ms)
+
+                if not cells and VALUE_COLUMN in values:
+                    cells = [(0, values)]
+                for member, cell in cells:
+                    cell_rows.append(row)
+                    cell_members.append(member)
+                    cell_values.append(self._to_float(cell.get(VALUE_COLUMN)))
+
+            while len(data_sets) < len(reader.members):
+                data_sets.append((array("d"), array("q"), array("q"), array("d")))
+            span["bytes"] = reader.bytes_read
+
+        metrics.increment("qes.response_bytes", reader.bytes_read)
+
+        categories: dict[str, int] = {}
+        parts = []
+        for (ts, cell_rows, cell_members, cell_values), member_rows in zip(
+            data_sets, reader.members
+        ):
+            members = ColumnTable()
+            for member in member_rows:
+                members.append(member)
+            parts.append(
+                self._series_arrays(
+                    ts=np.frombuffer(ts, dtype="float64"),
+                    labels=self._labels(members, product),
+                    cell_rows=np.frombuffer(cell_rows, dtype="int64"),
+                    cell_members=np.frombuffer(cell_members, dtype="int64"),
+                    cell_values=np.frombuffer(cell_values, dtype="float64"),
+                    categories=categories,
+                )
+            )
+
+        df = self._build_frame(parts, categories)
+        self.logger.info("Parsed %d rows from %d streamed bytes", len(df), reader.bytes_read)
+        return df, reader.is_complete and not reader.restart_tokens
+
+    def _labels(self, members: ColumnTable, product: Optional[str]) -> list:
+        labels = self._member_labels(members)
+        if product is not None:
+            labels = [product] * len(labels)
+        return labels
+
+    def _shape_arrays(
+        self, shape: DataShape
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: (epoch ms dates of the primary rows, row index, member index
+            and value of each cell) arrays
+        """
+        if shape.members.num_rows == 0 and shape.cells.num_rows == 0:
+            # No secondary grouping: measures are in the primary rows
+            cell_rows = np.arange(shape.primary.num_rows, dtype="int64")
+            cell_members = np.zeros(shape.primary.num_rows, dtype="int64")
+            cell_values = self._to_float_array(shape.primary.column(VALUE_COLUMN))
+        else:
+            cell_rows = np.asarray(shape.cells.column("_row"), dtype="int64")
+            cell_members = np.asarray(shape.cells.column("_member"), dtype="int64")
+            cell_values = self._to_float_array(shape.cells.column(VALUE_COLUMN))
+
+        ts = self._to_float_array(shape.primary.column(DATE_COLUMN))
+        return ts, cell_rows, cell_members, cell_values
+
+    @staticmethod
+    def _series_arrays(
+        ts: np.ndarray,
+        labels: list,
+        cell_rows: np.ndarray,
+        cell_members: np.ndarray,
+        cell_values: np.ndarray,
+        categories: dict[str, int],
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Lay out the cells of a data set as one value per (date, member).
+
+        :return: (epoch ms dates, category codes, values) arrays
+        """
+        label_codes = np.array(
+            [
+                categories.setdefault(label, len(categories)) if label is not None else -1
+                for label in labels
+            ],
+            dtype="int64",
+        )
+
+        grid = np.full((len(ts), len(labels)), np.nan)
+        known = cell_members < len(labels)
+        grid[cell_rows[known], cell_members[known]] = cell_values[known]
+
+        keep = ~np.isnan(ts)
+        return (
+            np.repeat(ts[keep].astype("int64"), len(labels)),
+            np.tile(label_codes, int(keep.sum())),
+            grid[keep].ravel(),
+        )
+
+    @staticmethod
+    def _build_frame(parts: list, categories: dict[str, int]) -> pd.DataFrame:
+        import pandas as pd
+
+        with metrics.span("parse.dataframe") as span:
+            if parts:
+                date_ms, codes, values = (np.concatenate(p) for p in zip(*parts))
+            else:
+                date_ms = codes = np.empty(0, dtype="int64")
+                values = np.empty(0)
+
+            date_ms = date_ms - date_ms % MS_PER_DAY
+
+            df = pd.DataFrame(
+                {
+                    "date": pd.to_datetime(date_ms, unit="ms"),
+                    "product": pd.Categorical.from_codes(
+                        codes, categories=list(categories)
+                    ),
+                    "value": values,
+                }
+            )
+            span["rows"] = len(df)
+
+        metrics.increment("parse.rows", len(df))
+        return df
+
+    @staticmethod
+    def _to_float(value) -> float:
+        if value is None:
+            return np.nan
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    @staticmethod
+    def _to_float_array(values: list) -> np.ndarray:
+        try:
+            return np.asarray(values, dtype="float64")
+        except (TypeError, ValueError):
+            import pandas as pd
+
+            return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(
+                dtype="float64"
+            )
+
+    def _append_series(
+        self, shape: DataShape, product: Optional[str], columns: dict[str, list]
+    ) -> None:
+        dates = shape.primary.column(DATE_COLUMN)
+
+        labels = self._labels(shape.members, product)
+
+        if shape.members.num_rows == 0 and shape.cells.num_rows == 0:
+            # No secondary grouping: measures are in the primary rows
+            grid = {
+                (row, 0): value
+                for row, value in enumerate(shape.primary.column(VALUE_COLUMN))
+            }
+        else:
+            grid = {
+                (row, member): value
+                for row, member, value in zip(
+                    shape.cells.column("_row"),
+                    shape.cells.column("_member"),
+                    shape.cells.column(VALUE_COLUMN),
+                )
+            }
+
+        for row, ts in enumerate(dates):
+            if ts is None:
+                continue
+            for member, label in enumerate(labels):
+                columns["date"].append(ts)
+                columns["product"].append(label)
+                columns["value"].append(grid.get((row, member)))
+
+    def _member_labels(
+        self, members: ColumnTable, position: int = 0
+    ) -> list[Optional[str]]:
+        """
+        Label of each secondary member: the value of its first group column
+        (product), or of the group column at `position` (e.g. 1 for the
+        department of a multi_series query).
+        """
+        if members.num_rows == 0:
+            return [None]
+
+        group_columns = sorted(
+            (name for name in members.columns if name.startswith("G")),
+            key=lambda name: int(name[1:]),
+        )
+        if len(group_columns) <= position:
+            return [None] * members.num_rows
+        return members.column(group_columns[position])
+
+    def is_complete(self, response: dict) -> bool:
+        """
+        Check if the service returned the full data set.
+
+        The service sets IC (IsComplete) to false and may add restart tokens (RT)
+        when the result was reduced or windowed.
+        """
+        return all(
+            bool(ds.get("IC", True)) and not ds.get("RT")
+            for result in response["results"]
+            for ds in result["result"]["data"]["dsr"]["DS"]
+        )
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+import logging
+import os
+import sqlite3
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+from src import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series_values (
+    department TEXT NOT NULL,
+    product TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value REAL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (department, product, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series_coverage (
+    department TEXT NOT NULL,
+    product TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    PRIMARY KEY (department, product, start_date)
+) WITHOUT ROWID;
+"""
+
+
+class SeriesStore:
+    """
+    Local store of the daily series, in a SQLite file.
+
+    Values are indexed by (department, product, date) and upserted, so
+    overlapping extractions update the same rows instead of producing
+    overlapping files. The store also records the date ranges queried for
+    each series (its coverage): dates inside the coverage that have no row
+    (weekends, holidays) are known to be empty, so a range read of covered
+    dates is answered locally, and only missing_ranges() need a query.
+
+    Coverage is only recorded up to yesterday, so the values of today, which
+    may still be published, are queried again by the next run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def coverage(self, department: str, product: str) -> list[tuple[date, date]]:
+        """
+        :return: Sorted, non overlapping (start, end) ranges queried for the
+            series, end exclusive
+        """
+        rows = self.connection.execute(
+            """
+            SELECT start_date, end_date FROM series_coverage
+            WHERE department = ? AND product = ? ORDER BY start_date
+            """,
+            (department, product),
+        ).fetchall()
+        return [
+            (date.fromisoformat(start), date.fromisoformat(end)) for start, end in rows
+        ]
+
+    def missing_ranges(
+        self, department: str, product: str, start_date: date, end_date: date
+    ) -> list[tuple[date, date]]:
+        """
+        Compute the parts of [start_date, end_date) not covered yet.
+
+        :param end_date: Exclusive end date
+        :return: list of (start, end) ranges, end exclusive
+        """
+        ranges = []
+        cursor = start_date
+        for covered_start, covered_end in self.coverage(department, product):
+            if covered_end <= cursor:
+                continue
+            if covered_start >= end_date:
+                break
+            if covered_start > cursor:
+                ranges.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+
+        if cursor < end_date:
+            ranges.append((cursor, end_date))
+        return ranges
+
+    def upsert(
+        self,
+        department: str,
+        product: str,
+        df: pd.DataFrame,
+        covered: Optional[tuple[date, date]] = None,
+    ) -> None:
+        """
+        Insert or replace the values of a series, in a single transaction.
+
+        :param df: DataFrame with columns [date, product, value], as fetched
+        :param covered: (start, end) range queried to get `df`, end exclusive,
+            to add to the coverage of the series
+        """
+        import pandas as pd
+
+        updated_at = datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (
+                department,
+                product,
+                ts,
+                None if pd.isna(value) else float(value),
+                updated_at,
+            )
+            for ts, value in zip(df["date"].dt.strftime("%Y-%m-%d"), df["value"])
+        ]
+
+        with metrics.span("store.upsert", rows=len(rows)), self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO series_values (department, product, date, value, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (department, product, date)
+                DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+            if covered is not None:
+                self._add_coverage(department, product, *covered)
+
+    def _add_coverage(
+        self, department: str, product: str, start_date: date, end_date: date
+    ) -> None:
+        """Merge a range into the coverage of a series."""
+        end_date = min(end_date, date.today())
+        if end_date <= start_date:
+            return
+
+        merged = []
+        for covered_start, covered_end in self.coverage(department, product):
+            # Overlapping and adjacent ranges are merged
+            if covered_end < start_date or covered_start > end_date:
+                merged.append((covered_start, covered_end))
+            else:
+                start_date = min(start_date, covered_start)
+                end_date = max(end_date, covered_end)
+        merged.append((start_date, end_date))
+
+        self.connection.execute(
+            "DELETE FROM series_coverage WHERE department = ? AND product = ?",
+            (department, product),
+        )
+        self.connection.executemany(
+            """
+            INSERT INTO series_coverage (department, product, start_date, end_date)
+            VALUES (?, ?, ?, ?)
+            """,
+            (
+                (department, product, start.isoformat(), end.isoformat())
+                for start, end in merged
+            ),
+        )
+
+    def read_frame(
+        self, department: str, product: str, start_date: date, end_date: date
+    ) -> pd.DataFrame:
+        """
+        Read the stored values of a series over a date range.
+
+        :param end_date: Exclusive end date
+        :return: DataFrame with columns [date, product, value], sorted by date,
+            as fetched
+        """
+        import pandas as pd
+
+        with metrics.span("store.read") as span:
+            rows = self.connection.execute(
+                """
+                SELECT date, value FROM series_values
+                WHERE department = ? AND product = ? AND date >= ? AND date < ?
+                ORDER BY date
+                """,
+                (department, product, start_date.isoformat(), end_date.isoformat()),
+            ).fetchall()
+            span["rows"] = len(rows)
+
+            df = pd.DataFrame(
+                {
+                    "date": pd.to_datetime([row[0] for row in rows], format="%Y-%m-%d"),
+                    "product": pd.Categorical([product] * len(rows)),
+                    "value": np.array(
+                        [np.nan if row[1] is None else row[1] for row in rows],
+                        dtype="float64",
+                    ),
+                }
+            )
+        return df
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,196 @@
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import logging
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.aggregation import FREQUENCIES, STATISTICS, SeriesAggregator
+from src.catalog import Catalog, UnknownCatalogValueError
+from src.csv_writer import write_reference_csv
+from src.date_util import parse_yyyymmdd
+from src.extractor import SeriesExtractor
+from src.fill_engine import FillEngine
+
+SERIES_PATH = "/series"
+HEALTH_PATH = "/health"
+RESPONSE_FORMATS = ("json", "csv")
+TRUE_VALUES = ("1", "true", "yes")
+
+
+class BadRequestError(ValueError):
+    """Raised when a request has missing or invalid parameters."""
+
+    pass
+
+
+class ExtractionServer(ThreadingHTTPServer):
+    """
+    Local HTTP daemon serving daily series from a warm SeriesExtractor.
+
+    The extractor (its PowerBI session, tokens and response cache) is shared
+    by every request, so only the first request, or a token refresh, pays for
+    the token handshake.
+
+    Endpoints:
+    - GET /health
+    - GET /series?department=...&product=...&start=YYYYmmdd&end=YYYYmmdd
+      with the optional format (json or csv), fillna (true/false), frequency
+      (one of FREQUENCIES) and statistic (one of STATISTICS) parameters
+    - POST /series, with the same parameters in a JSON object body
+
+    The end date is inclusive, as in the command line.
+
+    With a Catalog, unknown departments and products are rejected with a 400
+    before any query, and other spellings are resolved to the catalog ones.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        extractor: SeriesExtractor,
+        fill_engine: Optional[FillEngine] = None,
+        catalog: Optional[Catalog] = None,
+    ):
+        super().__init__(address, SeriesRequestHandler)
+        self.extractor = extractor
+        self.fill_engine = fill_engine or FillEngine()
+        self.catalog = catalog
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def extract(self, params: dict) -> tuple[bytes, str]:
+        """
+        Fetch and render the series described by request parameters.
+
+        :return: (response body, content type)
+        :raises BadRequestError: if a parameter is missing or invalid
+        """
+        department = self._required(params, "department")
+        product = self._required(params, "product")
+        if self.catalog is not None:
+            try:
+                department, product = self.catalog.resolve(department, product)
+            except UnknownCatalogValueError as exc:
+                raise BadRequestError(str(exc)) from exc
+        try:
+            start_date = parse_yyyymmdd(self._required(params, "start"))
+            end_date = parse_yyyymmdd(self._required(params, "end"))
+        except ValueError as exc:
+            raise BadRequestError(str(exc)) from exc
+        if start_date > end_date:
+            raise BadRequestError("start must be earlier than or equal to end")
+
+        response_format = str(params.get("format", "json")).lower()
+        if response_format not in RESPONSE_FORMATS:
+            raise BadRequestError(f"format must be one of {RESPONSE_FORMATS}")
+        frequency = params.get("frequency")
+        if frequency is not None and frequency not in FREQUENCIES:
+            raise BadRequestError(f"frequency must be one of {FREQUENCIES}")
+        statistic = params.get("statistic", "mean")
+        if statistic not in STATISTICS:
+            raise BadRequestError(f"statistic must be one of {STATISTICS}")
+        fillna = str(params.get("fillna", "false")).lower() in TRUE_VALUES
+
+        df = self.extractor.fetch_frame(
+            department, product, start_date, end_date + timedelta(days=1)
+        )
+        if fillna:
+            df, _ = self.fill_engine.fill(df)
+        if frequency is not None and not df.empty:
+            df = (
+                SeriesAggregator(df)
+                .rollup(frequency, [statistic])
+                .rename(columns={statistic: "value"})
+            )
+
+        if response_format == "csv":
+            buffer = io.StringIO()
+            write_reference_csv(df, buffer)
+            return buffer.getvalue().encode("utf-8"), "text/csv; charset=utf-8"
+
+        values = df["value"].to_numpy(dtype="float64", na_value=np.nan)
+        body = {
+            "department": department,
+            "product": product,
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat(),
+            "rows": [
+                {"date": day, "value": None if np.isnan(value) else float(value)}
+                for day, value in zip(
+                    pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d"), values
+                )
+            ],
+        }
+        return json.dumps(body, ensure_ascii=False).encode("utf-8"), (
+            "application/json; charset=utf-8"
+        )
+
+    @staticmethod
+    def _required(params: dict, name: str) -> str:
+        value = params.get(name)
+        if not value:
+            raise BadRequestError(f"Missing parameter '{name}'")
+        return str(value)
+
+
+class SeriesRequestHandler(BaseHTTPRequestHandler):
+    server: ExtractionServer
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == HEALTH_PATH:
+            self._send_json(200, {"status": "ok"})
+        elif url.path == SERIES_PATH:
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            self._handle_series(params)
+        else:
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != SERIES_PATH:
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(params, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as exc:
+            self._send_json(400, {"error": f"Invalid JSON body: {exc}"})
+            return
+
+        self._handle_series(params)
+
+    def _handle_series(self, params: dict) -> None:
+        try:
+            body, content_type = self.server.extract(params)
+        except BadRequestError as exc:
+            self._send_json(400, {"error": str(exc)})
+            return
+        except Exception as exc:
+            self.server.logger.exception("Extraction failed for %s", params)
+            self._send_json(502, {"error": f"{exc.__class__.__name__}: {exc}"})
+            return
+
+        self._send(200, body, content_type)
+
+    def _send_json(self, status: int, body: dict) -> None:
+        self._send(status, json.dumps(body).encode("utf-8"), "application/json")
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        self.server.logger.info("%s - %s", self.address_string(), format % args)
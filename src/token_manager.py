@@ -0,0 +1,293 @@
+import base64
+from datetime import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from src.powerbi_client import PowerBIClient
+from src.token_provider import EmbedTokenProvider
+
+
+class MWCTokenError(RuntimeError):
+    """Raised when the MWC token cannot be found in modelsAndExploration."""
+
+    pass
+
+
+class CachedToken:
+    """
+    A token value, the epoch time (seconds) it expires at and, when known, the
+    epoch time it was issued at.
+    """
+
+    def __init__(
+        self, value: str, expires_at: float, issued_at: Optional[float] = None
+    ):
+        self.value = value
+        self.expires_at = expires_at
+        self.issued_at = issued_at
+
+    def refresh_margin(self, margin: float) -> float:
+        """
+        :return: `margin`, clamped to half of the token lifetime, so a short
+            lived token is not stale as soon as it is issued
+        """
+        if self.issued_at is None:
+            return margin
+        return min(margin, max(0.0, self.expires_at - self.issued_at) / 2)
+
+    def refresh_at(self, margin: float) -> float:
+        """:return: Epoch time at which the token should be refreshed"""
+        return self.expires_at - self.refresh_margin(margin)
+
+    def is_fresh(self, margin: float) -> bool:
+        return time.time() < self.refresh_at(margin)
+
+    def to_dict(self) -> dict:
+        return {
+            "value": self.value,
+            "expires_at": self.expires_at,
+            "issued_at": self.issued_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CachedToken":
+        issued_at = data.get("issued_at")
+        return cls(
+            value=data["value"],
+            expires_at=float(data["expires_at"]),
+            issued_at=float(issued_at) if issued_at is not None else None,
+        )
+
+
+def jwt_expiration(token: str) -> Optional[float]:
+    """
+    Read the 'exp' claim of a JWT token, without validating it.
+
+    :return: Expiration epoch time in seconds, or None if the token is not a JWT
+    """
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+
+    try:
+        claims_b64 = parts[1] + "=" * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(claims_b64))
+        return float(claims["exp"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class TokenManager:
+    """
+    Cache the EmbedToken and the MWC token, refreshing them before they expire.
+
+    Tokens are kept in memory and, when `cache_path` is given, in a JSON file
+    readable only by the current user, so short scheduled runs can skip the
+    token handshake entirely. Tokens are refreshed `refresh_margin` seconds
+    before their expiration (at most half of their lifetime), either lazily on
+    access or by a background thread started with start_background_refresh(),
+    which sleeps at least `min_refresh_interval` seconds between refreshes.
+    """
+
+    def __init__(
+        self,
+        token_provider: EmbedTokenProvider,
+        cache_path: Optional[str] = None,
+        default_ttl: float = 3600,
+        refresh_margin: float = 300,
+        min_refresh_interval: float = 30,
+    ):
+        self.token_provider = token_provider
+        self.cache_path = cache_path
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._embed: Optional[CachedToken] = None
+        self._mwc: Optional[CachedToken] = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+        self._load()
+
+    def get_embed_token(self) -> str:
+        """
+        Return a fresh EmbedToken, requesting a new one only when needed.
+
+        :raises EmbedTokenError: if the token cannot be retrieved
+        """
+        with self._lock:
+            if self._embed is None or not self._embed.is_fresh(self.refresh_margin):
+                self._refresh_embed()
+            return self._embed.value
+
+    def get_mwc_token(self, client: PowerBIClient) -> str:
+        """
+        Return a fresh MWC token, calling modelsAndExploration only when needed.
+
+        :param client: Client used to call modelsAndExploration. Its EmbedToken
+            is updated to the current cached one
+        :raises MWCTokenError: if the MWC token cannot be found
+        """
+        with self._lock:
+            if self._mwc is None or not self._mwc.is_fresh(self.refresh_margin):
+                self._refresh_mwc(client)
+            return self._mwc.value
+
+    def refresh(self, client: PowerBIClient) -> None:
+        """
+        Request new EmbedToken and MWC token, regardless of their expiration.
+
+        The tokens are requested without holding the lock, so threads reading
+        the current tokens are not blocked meanwhile, and swapped in once both
+        are received.
+        """
+        embed = self._request_embed()
+        mwc = self._request_mwc(client, embed.value)
+        with self._lock:
+            self._embed = embed
+            self._mwc = mwc
+            self._log_cached("EmbedToken", embed)
+            self._log_cached("MWC token", mwc)
+            self._save()
+
+    def invalidate(self, stale_mwc_token: Optional[str] = None) -> None:
+        """
+        Drop the cached tokens, e.g. after the service rejected them with 401/403.
+
+        :param stale_mwc_token: The rejected MWC token. If another thread has
+            already replaced it, the cache is left untouched
+        """
+        with self._lock:
+            if stale_mwc_token and self._mwc and self._mwc.value != stale_mwc_token:
+                return
+            self.logger.info("Invalidating cached tokens")
+            self._embed = None
+            self._mwc = None
+            self._save()
+
+    def start_background_refresh(self, client: PowerBIClient) -> None:
+        """
+        Start a daemon thread that refreshes both tokens before they expire.
+
+        :param client: Client used to call modelsAndExploration
+        """
+        if self._refresh_thread is not None:
+            return
+
+        self._stop.clear()
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_loop,
+            args=(client,),
+            name="token-refresh",
+            daemon=True,
+        )
+        self._refresh_thread.start()
+
+    def stop_background_refresh(self) -> None:
+        self._stop.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join(timeout=5)
+            self._refresh_thread = None
+
+    def _refresh_loop(self, client: PowerBIClient) -> None:
+        while not self._stop.wait(timeout=self._seconds_until_refresh()):
+            try:
+                self.refresh(client)
+            except Exception:
+                self.logger.exception("Background token refresh failed")
+                if self._stop.wait(timeout=30):
+                    return
+
+    def _seconds_until_refresh(self) -> float:
+        with self._lock:
+            tokens = [t for t in (self._embed, self._mwc) if t is not None]
+            if len(tokens) < 2:
+                return self.min_refresh_interval
+            next_refresh = min(t.refresh_at(self.refresh_margin) for t in tokens)
+        return max(self.min_refresh_interval, next_refresh - time.time())
+
+    def _request_embed(self) -> CachedToken:
+        issued_at = time.time()
+        token, expiration = self.token_provider.get_token_with_expiration()
+        expires_at = (
+            expiration.timestamp()
+            if expiration is not None
+            else issued_at + self.default_ttl
+        )
+        return CachedToken(token, expires_at, issued_at)
+
+    def _request_mwc(self, client: PowerBIClient, embed_token: str) -> CachedToken:
+        issued_at = time.time()
+        client.set_embed_token(embed_token)
+        models = client.get_models_and_exploration()
+
+        mwc = client.get_mwc_token(models)
+        if not mwc:
+            self.logger.error("Could not find mwc_token")
+            raise MWCTokenError("MWC token not found in modelsAndExploration")
+
+        expires_at = jwt_expiration(mwc) or issued_at + self.default_ttl
+        return CachedToken(mwc, expires_at, issued_at)
+
+    def _log_cached(self, name: str, token: CachedToken) -> None:
+        self.logger.info(
+            "%s cached until %s", name, datetime.fromtimestamp(token.expires_at)
+        )
+
+    def _refresh_embed(self) -> None:
+        self._embed = self._request_embed()
+        self._log_cached("EmbedToken", self._embed)
+        self._save()
+
+    def _refresh_mwc(self, client: PowerBIClient) -> None:
+        self._mwc = self._request_mwc(client, self.get_embed_token())
+        self._log_cached("MWC token", self._mwc)
+        self._save()
+
+    def _load(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            embed = CachedToken.from_dict(data["embed"]) if data.get("embed") else None
+            mwc = CachedToken.from_dict(data["mwc"]) if data.get("mwc") else None
+        except (OSError, ValueError, KeyError, TypeError):
+            self.logger.warning("Ignoring unreadable token cache %s", self.cache_path)
+            return
+
+        self._embed = embed
+        self._mwc = mwc
+        self.logger.info("Loaded cached tokens from %s", self.cache_path)
+
+    def _save(self) -> None:
+        if not self.cache_path:
+            return
+
+        data = {
+            "embed": self._embed.to_dict() if self._embed else None,
+            "mwc": self._mwc.to_dict() if self._mwc else None,
+        }
+
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(directory, exist_ok=True)
+
+        # mkstemp creates the file with 0600 permissions
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tokens-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            self.logger.warning("Could not write token cache %s", self.cache_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
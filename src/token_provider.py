@@ -1,5 +1,9 @@
 import requests
+from datetime import datetime, timezone
 import logging
+from typing import Optional
+
+from src import metrics
 
 
 class EmbedTokenError(RuntimeError):
@@ -22,11 +26,23 @@ class EmbedTokenProvider:
         :return: EmbedToken string
         :raises EmbedTokenError: if the token cannot be retrieved
         """
+        token, _ = self.get_token_with_expiration()
+        return token
+
+    def get_token_with_expiration(self) -> tuple[str, Optional[datetime]]:
+        """
+        Retrieve an EmbedToken and its expiration from the internal token service.
+
+        :return: (EmbedToken string, expiration as an aware datetime or None
+            if the service does not return it)
+        :raises EmbedTokenError: if the token cannot be retrieved
+        """
         self.logger.info("Requesting EmbedToken")
 
         try:
-            response = requests.get(self.token_url, timeout=self.timeout)
-            response.raise_for_status()
+            with metrics.span("token.embed"):
+                response = requests.get(self.token_url, timeout=self.timeout)
+                response.raise_for_status()
 
         except requests.RequestException as exc:
             self.logger.error("HTTP error while requesting EmbedToken", exc_info=exc)
@@ -44,4 +60,20 @@ class EmbedTokenProvider:
             raise EmbedTokenError("EmbedToken not returned by token service")
 
         self.logger.info("EmbedToken retrieved successfully")
-        return token
+        return token, self._parse_expiration(
+            data.get("Expiration") or data.get("expiration")
+        )
+
+    def _parse_expiration(self, value) -> Optional[datetime]:
+        if not value:
+            return None
+
+        try:
+            expiration = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            self.logger.warning("Could not parse EmbedToken expiration: %s", value)
+            return None
+
+        if expiration.tzinfo is None:
+            expiration = expiration.replace(tzinfo=timezone.utc)
+        return expiration